@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+
+import sys
+import getopt
+
+# Each subcommand is the module which implements it, imported only when the
+# subcommand is run, so that each subcommand imports only what it needs.
+SUBCOMMANDS = {
+        'extract': 'pipeline.extract',
+        'clean': 'pipeline.clean',
+        'translate': 'pipeline.translate',
+        'normalize': 'pipeline.normalize',
+        'phonemes': 'pipeline.phonemes',
+        'combine': 'pipeline.combine_characters',
+        'merge': 'pipeline.merge',
+        'separate': 'pipeline.separate',
+        'store': 'pipeline.store',
+        'features': 'pipeline.features',
+        'signatures': 'pipeline.signatures',
+        'estimate': 'pipeline.estimate',
+        'run': 'pipeline.run',
+        'build': 'pipeline.build',
+        'daemon': 'pipeline.daemon',
+        'client': 'pipeline.client',
+        'character-list': 'tools.get_character_list',
+        'dramatis-personae': 'tools.extract_dramatis_personae',
+        'file-list': 'tools.get_file_list',
+        'generate-corpus': 'tools.generate_corpus',
+        'benchmark': 'tools.benchmark',
+        }
+
+# The time in milliseconds each subcommand may spend importing modules before
+# it parses its arguments, beyond those imported by the interpreter itself, as
+# measured by -X importtime. Each budget is about one and a half times the
+# slowest of repeated measurements on a single core whose interpreter imports
+# its own modules in INTERPRETER_MS; features and signatures import NumPy. On
+# a slower or busier host, every budget is scaled up by the time its
+# interpreter takes to import its own modules, measured alongside.
+INTERPRETER_MS = 9.0
+BUDGETS = {
+        'extract': 35,
+        'clean': 40,
+        'translate': 50,
+        'normalize': 55,
+        'phonemes': 45,
+        'combine': 35,
+        'merge': 35,
+        'separate': 35,
+        'store': 35,
+        'features': 190,
+        'signatures': 190,
+        'estimate': 60,
+        'run': 45,
+        'build': 45,
+        'daemon': 80,
+        'client': 40,
+        'character-list': 30,
+        'dramatis-personae': 45,
+        'file-list': 45,
+        'generate-corpus': 25,
+        'benchmark': 50,
+        }
+
+
+def run_subcommand(name, arg_list):
+    '''Imports the module of the given subcommand and runs its main() function
+    with the given arguments, as though its script had been run directly.'''
+    import importlib
+    module_name = SUBCOMMANDS[name]
+    sys.argv = [module_name.split('.')[-1] + '.py'] + arg_list
+    module = importlib.import_module(module_name)
+    module.main()
+
+
+def measure_import_time(arg_list):
+    '''Runs python3 -X importtime with the given arguments, and returns a
+    dictionary of the time in microseconds spent importing each module, not
+    including the modules it imports.'''
+    import subprocess
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + arg_list, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, cumulative, module = line[len('import time:'):].split('|')
+        if self_time.strip().isdigit():
+            times[module.strip()] = int(self_time)
+    return times
+
+
+def check_import_times(names, repeat=5):
+    '''Measures the time each of the given subcommands spends importing
+    modules before it parses its arguments, by running it with -h, and
+    compares it to the subcommand's budget, scaled by the speed of the host.
+    Each subcommand is measured the given number of times, and the least time
+    is taken, since other processes can only ever slow it down. Prints a line
+    for each subcommand to stdout. Returns True if every subcommand is within
+    its budget.'''
+    interpreter = None
+    for i in range(repeat):
+        times = measure_import_time(['-c', 'pass'])
+        if interpreter is None or sum(times.values()) < sum(interpreter.values()):
+            interpreter = times
+    scale = max(1.0, sum(interpreter.values()) / 1000 / INTERPRETER_MS)
+    within = True
+    for name in names:
+        total = None
+        for i in range(repeat):
+            times = measure_import_time([__file__, name, '-h'])
+            measured = sum(time for module, time in times.items() if module not in interpreter) / 1000
+            if total is None or measured < total:
+                total = measured
+        budget = BUDGETS[name] * scale
+        status = 'ok'
+        if total > budget:
+            status = 'OVER BUDGET'
+            within = False
+        print('{:<20}{:>8.1f} ms of {:>4.0f} ms  {}'.format(name, total, budget, status))
+    return within
+
+
+def parse_ctp(arg_list):
+    '''Parses command-line arguments up to the subcommand, and runs the
+    subcommand with the remaining arguments.'''
+    optlist, args = getopt.getopt(arg_list, 'ht')
+    check = False
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - runs any stage of the pipeline, or any tool, as a subcommand
+
+    Usage:
+        python3 {0} SUBCOMMAND [OPTION]... [FILE]...
+        python3 {0} -t [SUBCOMMAND]...
+
+    Runs the given subcommand with the given options and files, exactly as its
+    script would be run. Only the modules needed by the subcommand are
+    imported, so that launching a stage thousands of times, as in per-shard
+    jobs, costs as little as possible. For the usage of each subcommand, run:
+        python3 {0} SUBCOMMAND -h
+
+    Subcommands:
+        extract             pipeline/extract.py
+        clean               pipeline/clean.py
+        translate           pipeline/translate.py
+        normalize           pipeline/normalize.py
+        phonemes            pipeline/phonemes.py
+        combine             pipeline/combine_characters.py
+        merge               pipeline/merge.py
+        separate            pipeline/separate.py
+        store               pipeline/store.py
+        features            pipeline/features.py
+        signatures          pipeline/signatures.py
+        estimate            pipeline/estimate.py
+        run                 pipeline/run.py
+        build               pipeline/build.py
+        daemon              pipeline/daemon.py
+        client              pipeline/client.py
+        character-list      tools/get_character_list.py
+        dramatis-personae   tools/extract_dramatis_personae.py
+        file-list           tools/get_file_list.py
+        generate-corpus     tools/generate_corpus.py
+        benchmark           tools/benchmark.py
+
+
+    -h              Display this help message.
+
+    -t              Rather than running a subcommand, measure the time each
+                        of the given subcommands (or every subcommand, if none
+                        are given) spends importing modules before parsing its
+                        arguments, using python3 -X importtime, and compare it
+                        to the subcommand's budget, taking the least of five
+                        runs of each. Budgets are scaled up on hosts whose
+                        interpreter imports its own modules more slowly than
+                        the one on which they were set. Exits with status 1 if
+                        any subcommand is over budget.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-t':
+            check = True
+    if not check and not args:
+        print('Please include a subcommand, or -h for usage information.', file=sys.stderr)
+        exit(1)
+    names = args if check else args[:1]
+    for name in names:
+        if name not in SUBCOMMANDS:
+            print('ERROR: {}: unknown subcommand: {}'.format(sys.argv[0], name), file=sys.stderr)
+            exit(1)
+    if not check:
+        run_subcommand(args[0], args[1:])
+    elif not check_import_times(names or list(SUBCOMMANDS)):
+        exit(1)
+
+
+def main():
+    parse_ctp(sys.argv[1:])
+
+
+if __name__ == '__main__':
+    main()
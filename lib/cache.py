@@ -0,0 +1,73 @@
+'''Fingerprints and atomic writes for caching per-play results on disk.
+
+A fingerprint is a sha256 hex digest over a sequence of strings, such as the
+hashes of the files a result depends on and the options which produced it, so
+that a cached result is reused only if every one of its inputs is unchanged.
+
+Files are written atomically: the contents are written to a temporary file in
+the same directory, which is renamed over the destination only once it is
+complete, so an interrupted process never leaves a partial file behind.
+'''
+
+import os
+import hashlib
+import contextlib
+
+file_hashes = {}
+
+
+def hash_file(filename, block_size=1 << 20):
+    '''Returns the sha256 hex digest of the contents of the given file. Each
+    file is hashed at most once per process.'''
+    key = os.path.abspath(filename)
+    if key not in file_hashes:
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as infile:
+            for block in iter(lambda: infile.read(block_size), b''):
+                digest.update(block)
+        file_hashes[key] = digest.hexdigest()
+    return file_hashes[key]
+
+
+def fingerprint(*parts):
+    '''Returns the sha256 hex digest of the given strings, each of which is
+    length-prefixed so that no two different sequences of strings collide.'''
+    digest = hashlib.sha256()
+    for part in parts:
+        data = str(part).encode('utf-8')
+        digest.update(str(len(data)).encode('ascii') + b':' + data)
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def atomic_open(filename, mode='wb'):
+    '''Opens a temporary file alongside the given filename for writing, and
+    renames it to the given filename when the context exits without error.
+    Otherwise, the temporary file is removed.'''
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, 0o755, exist_ok=True)
+    temp_filename = '{}.tmp-{}'.format(filename, os.getpid())
+    encoding = None
+    if 'b' not in mode:
+        encoding = 'utf-8'
+    outfile = open(temp_filename, mode, encoding=encoding)
+    try:
+        yield outfile
+        outfile.flush()
+        os.fsync(outfile.fileno())
+        outfile.close()
+        os.replace(temp_filename, filename)
+    except BaseException:
+        outfile.close()
+        os.remove(temp_filename)
+        raise
+
+
+def atomic_write(filename, data):
+    '''Atomically writes the given bytes or string to the given filename.'''
+    mode = 'w'
+    if isinstance(data, bytes):
+        mode = 'wb'
+    with atomic_open(filename, mode) as outfile:
+        outfile.write(data)
@@ -0,0 +1,148 @@
+'''Transparent streaming compression of the files read and written by the
+pipeline.
+
+A file whose name ends in .gz, .bz2, or .xz is read and written through the
+gzip, bz2, or lzma codec of the standard library, one block at a time, so
+that neither the compressed nor the decompressed file is ever held whole in
+memory. Any other file is opened as it is.
+
+Compression is slower than the stages which write most files, so writes to a
+compressed file are handed, in blocks of BLOCK_SIZE bytes, through a bounded
+queue to a thread which compresses and writes them, while the stage carries on
+producing the next block. The codecs release the GIL while they compress, so
+the two run in parallel. Decompression is much cheaper, and is done as the
+file is read.
+'''
+
+import io
+import os
+import queue
+import atexit
+import weakref
+import threading
+
+BLOCK_SIZE = 1 << 16
+QUEUE_SIZE = 16  # Blocks waiting to be compressed before writes wait
+DONE = None  # Put on the queue after the last block
+EXTENSIONS = ('.gz', '.bz2', '.xz')
+# Compressed files open for writing, closed at exit. Only weak references are
+# held, so that files which are closed and dropped, as the daemon does for
+# every job, do not accumulate.
+writers = weakref.WeakSet()
+
+
+def get_extension(filename):
+    '''Returns the compressed extension of the given filename, or an empty
+    string if it is not compressed.'''
+    extension = os.path.splitext(filename)[1]
+    if extension in EXTENSIONS:
+        return extension
+    return ''
+
+
+def strip_extension(filename):
+    '''Returns the given filename without its compressed extension, if it has
+    one, so that A00011.xml.gz has the same TCP code as A00011.xml.'''
+    extension = get_extension(filename)
+    if extension:
+        return filename[:-len(extension)]
+    return filename
+
+
+def open_codec(filename, extension, mode):
+    '''Returns the given compressed file opened as a binary file in the given
+    mode, rb or wb, through the codec of its extension. The codecs are only
+    imported when first needed. gzip compresses at level 6, as the gzip
+    command does, rather than at 9, which is several times slower for little
+    gain.'''
+    if extension == '.gz':
+        import gzip
+        return gzip.open(filename, mode, compresslevel=6)
+    if extension == '.bz2':
+        import bz2
+        return bz2.open(filename, mode)
+    import lzma
+    return lzma.open(filename, mode)
+
+
+class CompressingWriter(io.RawIOBase):
+    '''A binary file which compresses everything written to it into the given
+    compressed binary file on a separate thread. Each write is queued, and
+    waits only if QUEUE_SIZE writes are already waiting to be compressed. It
+    is best wrapped in a BufferedWriter, so that each write is large. An error
+    in compression is raised by the next write, or by close().'''
+
+    def __init__(self, fileobj, name):
+        self.fileobj = fileobj
+        self.name = name
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.error = None
+        self.thread = threading.Thread(target=self.compress, name='compress {}'.format(name), daemon=True)
+        self.thread.start()
+
+    def compress(self):
+        '''Compresses each queued block until the last. After an error, the
+        remaining blocks are discarded, so that writes never wait forever.'''
+        while True:
+            data = self.queue.get()
+            if data is DONE:
+                return
+            if self.error is None:
+                try:
+                    self.fileobj.write(data)
+                except BaseException as err:
+                    self.error = err
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.check()
+        self.queue.put(bytes(data))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.queue.put(DONE)
+            self.thread.join()
+            try:
+                self.fileobj.close()
+            finally:
+                super().close()
+            self.check()
+
+
+def open_file(filename, mode='r', encoding=None, newline=None):
+    '''Opens the given file as open() does, in one of the modes r, w, rb, or
+    wb, compressing or decompressing it according to its extension. A text
+    file read or written through a codec has a buffer attribute, which is the
+    equivalent binary file, as a file returned by open() does.'''
+    extension = get_extension(filename)
+    if not extension:
+        if 'b' in mode:
+            return open(filename, mode)
+        return open(filename, mode, encoding=encoding, newline=newline)
+    if mode[0] == 'r':
+        fileobj = open_codec(filename, extension, 'rb')
+    else:
+        fileobj = io.BufferedWriter(CompressingWriter(open_codec(filename, extension, 'wb'), filename), BLOCK_SIZE)
+    if 'b' not in mode:
+        fileobj = io.TextIOWrapper(fileobj, encoding=encoding, newline=newline)
+    if mode[0] == 'w':
+        writers.add(fileobj)
+    return fileobj
+
+
+def close_writers():
+    '''Closes every compressed file still open for writing, so that a stage
+    which exits without closing its output does not lose the blocks still
+    waiting to be compressed.'''
+    for fileobj in list(writers):
+        fileobj.close()
+
+
+atexit.register(close_writers)
@@ -0,0 +1,10 @@
+'''Exceptions raised by the stages of the pipeline.
+
+The core functions of the stages raise a PipelineError, rather than exiting,
+when their input cannot be processed, so that they may be used as a library.
+The scripts catch it, print its message to stderr, and exit with status 1.
+'''
+
+
+class PipelineError(Exception):
+    '''Raised when a stage cannot process its input.'''
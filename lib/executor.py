@@ -0,0 +1,240 @@
+'''Concurrent execution of an in-process pipeline through bounded queues.
+
+Each stage of a Pipeline runs in its own thread, reading batches of rows from
+a bounded queue filled by the stage before it and writing batches to a bounded
+queue read by the stage after it. When a queue is full, the stage writing to
+it waits, so that a slow stage holds back the stages before it rather than
+letting rows pile up in memory. Mapped stages additionally run each batch on
+a pool of threads or processes, while keeping the batches in order.
+
+Every queue records its depth each time a batch is put on it, and every stage
+records how long it waited for input (starved by the stages before it) and
+for room in its output queue (held back by the stages after it). The stage
+which waits least is the bottleneck.
+
+If any stage raises an error, or the caller stops reading the rows of the
+final stage, every stage is cancelled: stages waiting for room in a queue or
+for a batch give up within POLL_INTERVAL seconds, so that no thread is left
+waiting forever.
+'''
+
+import time
+import queue
+import threading
+import itertools
+import collections
+import concurrent.futures
+
+DONE = None  # Put on a queue after the last batch
+POLL_INTERVAL = 0.1  # Seconds between checks for cancellation while waiting
+
+
+class Cancelled(Exception):
+    '''Raised in a stage waiting to put a batch on a queue once the pipeline
+    has been cancelled.'''
+
+
+class Channel:
+    '''A bounded queue of batches between two stages, which records its depth
+    and the time spent waiting to put batches on it and get batches from it.
+    Once the given stop event is set, putting a batch raises Cancelled rather
+    than waiting for room, and getting a batch from the empty queue returns
+    DONE rather than waiting for one.'''
+
+    def __init__(self, size, stop):
+        self.queue = queue.Queue(size)
+        self.stop = stop
+        self.size = size
+        self.batches = 0
+        self.rows = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+
+    def put(self, batch):
+        if batch is not DONE:
+            depth = self.queue.qsize()
+            self.batches += 1
+            self.rows += len(batch)
+            self.depth_total += depth
+            self.max_depth = max(self.max_depth, depth)
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    self.queue.put(batch, timeout=POLL_INTERVAL)
+                    return
+                except queue.Full:
+                    if self.stop.is_set():
+                        raise Cancelled()
+        finally:
+            self.put_wait += time.perf_counter() - start
+
+    def get(self):
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return self.queue.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    if self.stop.is_set():
+                        return DONE
+        finally:
+            self.get_wait += time.perf_counter() - start
+
+    def __iter__(self):
+        while True:
+            batch = self.get()
+            if batch is DONE:
+                return
+            yield batch
+
+    def iter_rows(self):
+        '''Generates the rows of each batch until the last batch.'''
+        for batch in self:
+            yield from batch
+
+    def get_metrics(self):
+        '''Returns a dictionary of the queue's metrics.'''
+        mean_depth = 0.0
+        if self.batches:
+            mean_depth = self.depth_total / self.batches
+        return {'size': self.size, 'batches': self.batches, 'rows': self.rows,
+                'max_depth': self.max_depth, 'mean_depth': mean_depth}
+
+
+def batched(iterable, batch_size):
+    '''Generates lists of up to the given number of items from the iterable.'''
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class Pipeline:
+    '''A pipeline of stages run concurrently, connected by queues holding at
+    most queue_size batches of up to batch_size rows each. Stages are added in
+    order, beginning with a source, and the rows of the final stage are
+    generated by run().'''
+
+    def __init__(self, queue_size=8, batch_size=64):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.stages = []
+        self.errors = []
+
+    def add_source(self, name, function):
+        '''Adds a source stage, which calls the given function with no
+        arguments to get an iterable of rows.'''
+        self.stages.append((name, 'stream', lambda rows: function(), 1, False, None, (), None))
+
+    def add_stream(self, name, function):
+        '''Adds a stage which calls the given function with an iterable of its
+        input rows to get an iterable of its output rows, in a single thread.'''
+        self.stages.append((name, 'stream', function, 1, False, None, (), None))
+
+    def add_map(self, name, task, workers=1, processes=False, initializer=None, initargs=(), collect=None):
+        '''Adds a stage which calls the given task with each batch of its input
+        rows, on a pool of the given number of worker threads (or processes,
+        if processes is True, in which case the task must be picklable, and
+        the initializer is called with the initargs in each process). The task
+        returns the list of output rows for the batch, or a result from which
+        the collect function, if given, returns the list. Collect is called on
+        each result in order, in a single thread. Batches are kept in order,
+        and at most twice as many as there are workers are in progress at once.'''
+        self.stages.append((name, 'map', task, workers, processes, initializer, initargs, collect))
+
+    def fail(self, err):
+        '''Records the given error of a stage, unless the stage was cancelled,
+        and cancels every stage.'''
+        if not isinstance(err, Cancelled):
+            self.errors.append(err)
+        self.stop.set()
+
+    def finish(self, out_channel):
+        '''Puts DONE on the given channel, unless the pipeline is cancelled,
+        in which case the stages after it stop without it.'''
+        try:
+            out_channel.put(DONE)
+        except Cancelled:
+            pass
+
+    def run_stream(self, function, in_channel, out_channel):
+        try:
+            for batch in batched(function(in_channel.iter_rows()), self.batch_size):
+                out_channel.put(batch)
+        except BaseException as err:
+            self.fail(err)
+        finally:
+            self.finish(out_channel)
+
+    def run_map(self, task, workers, processes, initializer, initargs, collect, in_channel, out_channel):
+        if collect is None:
+            collect = list
+        if processes:
+            pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+        else:
+            pool = concurrent.futures.ThreadPoolExecutor(workers, initializer=initializer, initargs=initargs)
+        try:
+            pending = collections.deque()
+            for batch in in_channel:
+                pending.append(pool.submit(task, batch))
+                while len(pending) >= 2 * workers:
+                    out_channel.put(collect(pending.popleft().result()))
+            while pending:
+                out_channel.put(collect(pending.popleft().result()))
+        except BaseException as err:
+            self.fail(err)
+        finally:
+            self.finish(out_channel)
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        '''Starts every stage, and generates the rows of the final stage.
+        Raises the first error of any stage once the final stage is done.
+        Every stage is cancelled after an error, or if the generator is closed
+        before the final stage is done.'''
+        self.stop = threading.Event()
+        self.channels = [Channel(self.queue_size, self.stop) for stage in self.stages]
+        self.start = time.perf_counter()
+        in_channel = Channel(1, self.stop)
+        in_channel.put(DONE)
+        for stage, out_channel in zip(self.stages, self.channels):
+            name, kind, function, workers, processes, initializer, initargs, collect = stage
+            if kind == 'stream':
+                args = (function, in_channel, out_channel)
+                target = self.run_stream
+            else:
+                args = (function, workers, processes, initializer, initargs, collect, in_channel, out_channel)
+                target = self.run_map
+            threading.Thread(target=target, args=args, daemon=True).start()
+            in_channel = out_channel
+        try:
+            yield from in_channel.iter_rows()
+        finally:
+            self.stop.set()
+        self.wall_time = time.perf_counter() - self.start
+        if self.errors:
+            raise self.errors[0]
+
+    def get_metrics(self):
+        '''Returns a dictionary of the metrics of each stage and of its output
+        queue, once run() is complete. The sink wait is the time spent waiting
+        for the rows of the final stage.'''
+        metrics = {'wall_time': self.wall_time, 'queue_size': self.queue_size, 'batch_size': self.batch_size, 'stages': []}
+        in_channel = None
+        for stage, out_channel in zip(self.stages, self.channels):
+            name, kind, function, workers, processes, initializer, initargs, collect = stage
+            input_wait = 0.0
+            if in_channel is not None:
+                input_wait = in_channel.get_wait
+            stage_metrics = {'name': name, 'workers': workers, 'processes': processes,
+                             'input_wait': input_wait, 'output_wait': out_channel.put_wait,
+                             'output_queue': out_channel.get_metrics()}
+            metrics['stages'].append(stage_metrics)
+            in_channel = out_channel
+        metrics['sink_wait'] = in_channel.get_wait
+        return metrics
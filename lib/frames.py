@@ -0,0 +1,208 @@
+'''Length-prefixed binary interchange format for the pipeline.
+
+The text formats of the pipeline rely on a separator which must never occur
+within a field, which is why clean.py replaces spaces in character names with
+hyphens, and why every script must detect whether its input is tab- or
+space-separated. Framed output avoids both: every field carries its length.
+
+A framed stream begins with the magic header, followed by a single byte giving
+the separator which the equivalent text would use (a tab or a space), followed
+by one frame per row. Each frame is a little-endian uint32 count of the fields
+in the row, then a uint32 byte length for each field, then the utf-8 encoded
+fields themselves. The fields of a row are the TCP code, the character's name,
+and the elements of the character's speech, which are xml text, cleaned text,
+words, or phonemes, according to the stage which wrote them.
+
+Since the magic header begins with a NUL byte, which never occurs in the text
+formats, framed input is detected automatically by every script.
+'''
+
+import io
+import struct
+import lib.rows as rows
+import lib.profiling as profiling
+
+MAGIC = b'\x00CTPF\x01'
+COUNT = struct.Struct('<I')
+BLOCK_SIZE = 1 << 20
+
+
+def is_framed(data):
+    '''Returns True if the given bytes begin with the framed format header.'''
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def encode_row(row):
+    '''Returns the frame for the given Row as bytes.'''
+    fields = [row.code.encode('utf-8'), row.character.encode('utf-8')]
+    fields += [element.encode('utf-8') for element in row.elements]
+    lengths = [len(field) for field in fields]
+    header = struct.pack('<{}I'.format(len(fields) + 1), len(fields), *lengths)
+    return header + b''.join(fields)
+
+
+def write_frames(outfile, in_rows, separator):
+    '''Writes the framed format header and a frame for each of the given Rows
+    to the given binary file.'''
+    outfile.write(MAGIC + separator.encode('ascii'))
+    for row in in_rows:
+        outfile.write(encode_row(row))
+
+
+def parse_frame(view, offset):
+    '''Parses the frame at the given offset of the given memoryview, decoding
+    its fields directly from slices of the view. Returns a tuple of the Row
+    and the offset of the next frame, or None if the view ends before the
+    frame does.'''
+    if len(view) - offset < COUNT.size:
+        return None
+    count = COUNT.unpack_from(view, offset)[0]
+    assert(count >= 2)
+    start = offset + COUNT.size * (count + 1)
+    if len(view) < start:
+        return None
+    lengths = struct.unpack_from('<{}I'.format(count), view, offset + COUNT.size)
+    if len(view) < start + sum(lengths):
+        return None
+    fields = []
+    for length in lengths:
+        fields.append(str(view[start:start + length], 'utf-8'))
+        start += length
+    return (rows.Row(fields[0], fields[1], fields[2:]), start)
+
+
+def parse_frames(data):
+    '''Parses framed data from the given bytes-like object, which must begin
+    with the framed format header. Fields are decoded directly from slices of
+    a memoryview over the data, so the data is never split or copied as a
+    whole. Returns a tuple of the separator and a generator of the Rows.'''
+    assert(is_framed(data))
+    view = memoryview(data)
+    separator = str(view[len(MAGIC):len(MAGIC) + 1], 'ascii')
+
+    def generate_rows(offset):
+        while offset < len(view):
+            parsed = parse_frame(view, offset)
+            assert(parsed is not None)  # The data ends within a frame
+            row, offset = parsed
+            yield row
+
+    return (separator, generate_rows(len(MAGIC) + 1))
+
+
+def read_frames(buf, copy=None):
+    '''Reads framed data from the given binary file, which must begin with the
+    framed format header, one block at a time, so that only the frames of the
+    current block are held in memory. If a binary file to copy to is given,
+    the data is also written to it unchanged, a block at a time, as its frames
+    are read. Returns a tuple of the separator and a generator of the Rows.'''
+    header = buf.read(len(MAGIC) + 1)
+    assert(len(header) == len(MAGIC) + 1 and is_framed(header))
+    separator = str(header[len(MAGIC):], 'ascii')
+    if copy is not None:
+        copy.write(header)
+
+    def generate_rows():
+        data = b''
+        while True:
+            # A frame larger than a block is read in ever larger reads
+            more = buf.read(max(BLOCK_SIZE, len(data)))
+            if not more:
+                assert(not data)  # The data ends within a frame
+                return
+            view = memoryview(data + more)
+            offset = 0
+            parsed = parse_frame(view, offset)
+            while parsed is not None:
+                row, offset = parsed
+                yield row
+                parsed = parse_frame(view, offset)
+            if copy is not None:
+                copy.write(view[:offset])
+            data = bytes(view[offset:])
+
+    return (separator, generate_rows())
+
+
+def get_buffer(textfile):
+    '''Returns the binary buffer underlying the given file, or the file itself
+    if it is already binary.'''
+    return getattr(textfile, 'buffer', textfile)
+
+
+def read_rows(infile):
+    '''Reads Rows from the given file, which may contain either pipeline text
+    or framed data, detected by the framed format header. Text is read one
+    line at a time, and framed data one block of frames at a time. Returns a
+    tuple of the separator and a generator of the Rows.'''
+    buf = get_buffer(infile)
+    if is_framed(buf.peek(len(MAGIC))):
+        separator, in_rows = read_frames(buf)
+        return (separator, profiling.timed(in_rows, 'parse'))
+    return rows.read_rows(io.TextIOWrapper(buf, encoding='utf-8'))
+
+
+def copy_rows(infile, outfile, framed=False):
+    '''Reads Rows from the given file, for scripts which pass their input
+    through unchanged, and writes the input to the given file as it is read.
+    Framed input is copied one block at a time, as its frames are read, so it
+    is never held whole in memory. Text input is read whole, since its
+    separator is detected from all of it, and copied once every Row has been
+    read, unless framed is True, in which case each Row is written as a frame
+    once it has been generated. Returns a tuple of the separator and a
+    generator of the Rows, which must be exhausted for the input to be
+    written.'''
+    buf = get_buffer(infile)
+    outfile.flush()
+    out_buf = get_buffer(outfile)
+    if is_framed(buf.peek(len(MAGIC))):
+        separator, in_rows = read_frames(buf, out_buf)
+        return (separator, profiling.timed(in_rows, 'parse'))
+    with profiling.phase('read'):
+        data = buf.read()
+    in_string = data.decode('utf-8')
+    separator = rows.get_separator(in_string)
+
+    def generate_rows():
+        if framed:
+            out_buf.write(MAGIC + separator.encode('ascii'))
+        for row in rows.parse_rows(in_string, separator):
+            yield row
+            if framed:
+                out_buf.write(encode_row(row))
+        if not framed:
+            out_buf.write(data)
+
+    return (separator, profiling.timed(generate_rows(), 'parse'))
+
+
+def write_rows(outfile, in_rows, separator, framed=False):
+    '''Writes the given Rows to the given file, either as pipeline text using
+    the given separator, or as framed data if framed is True.'''
+    with profiling.phase('write'):
+        if framed:
+            outfile.flush()
+            write_frames(get_buffer(outfile), in_rows, separator)
+        else:
+            for row in in_rows:
+                outfile.write(rows.format_row(row, separator) + '\n')
+
+
+def write_variants(outfiles, row_tuples, separator, framed=False):
+    '''Writes each of the given tuples of Rows, which hold variants of the
+    same row, one Row to each of the given files in order, as write_rows()
+    would write them, so that every variant is written in a single pass.'''
+    with profiling.phase('write'):
+        if framed:
+            buffers = []
+            for outfile in outfiles:
+                outfile.flush()
+                buffers.append(get_buffer(outfile))
+                buffers[-1].write(MAGIC + separator.encode('ascii'))
+            for row_tuple in row_tuples:
+                for buf, row in zip(buffers, row_tuple):
+                    buf.write(encode_row(row))
+        else:
+            for row_tuple in row_tuples:
+                for outfile, row in zip(outfiles, row_tuple):
+                    outfile.write(rows.format_row(row, separator) + '\n')
@@ -0,0 +1,331 @@
+'''The VEP metadata, compiled into a table keyed by TCP code, for selecting
+plays by query.
+
+The metadata csv has a row for each play, giving its TCP code, author, title,
+genre, date of writing, and date of the text used, followed by the counts of
+its most frequent words and its total count of word tokens. Some TCP files
+hold more than one play, and so have more than one row.
+
+The table keeps only the columns which may be queried, and is compiled on
+first use into a memory-mapped table (see lib/table.py) from each TCP code to
+its plays, named by a fingerprint of the metadata and of the list of missing
+files, so that later queries neither parse the csv nor build the table again.
+Alongside it, a second table holds each field as a column of the values of
+every play, in order of TCP code. Plays whose files are listed in
+missing_files.txt, alongside the metadata, are left out of both. A query which
+gives the code of every play it may match, such as
+"code=A11954 or code=A12345", looks the codes up in the table; any other query
+decodes only the columns of the fields it compares, and scans them.
+
+A query is a sequence of comparisons joined by "and" and "or", where "and"
+binds more tightly than "or". Each comparison is a field, an operator, and a
+value, such as "genre=CO", "date<1600", or "author~Fletcher". A value may be
+quoted with " or ', so that it may contain spaces, "and", or "or", as in
+title~"Love and Honour". The fields are
+code, author, title, genre, date (of writing), printed (the date of the text
+used), and tokens. The operators are =, !=, <, <=, >, and >=, which compare
+date, printed, and tokens as numbers, and ~, which matches any field
+containing the value, ignoring case. A play with no value for a field matches
+no comparison of that field other than !=. A TCP file is selected if any of
+its plays matches the query.
+'''
+
+import os
+import re
+import csv
+import getopt
+import itertools
+import collections
+import lib.cache as cache
+import lib.table as table
+
+project_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+metadata_path = os.path.join(project_dir, 'data', 'VEP_metadata.csv')
+
+# The column of the metadata csv from which each field of a play is read
+COLUMNS = collections.OrderedDict([
+        ('author', 'author'),
+        ('title', 'title'),
+        ('genre', 'genre'),
+        ('date', 'date of writing'),
+        ('printed', 'date of text used'),
+        ('tokens', 'tcp_top_100:# Word Tokens'),
+        ])
+NUMERIC_FIELDS = {'date', 'printed', 'tokens'}
+FIELDS = ['code'] + list(COLUMNS)
+
+Play = collections.namedtuple('Play', FIELDS)
+
+OPERATORS = {
+        '=': lambda a, b: a == b,
+        '!=': lambda a, b: a != b,
+        '<': lambda a, b: a is not None and a < b,
+        '<=': lambda a, b: a is not None and a <= b,
+        '>': lambda a, b: a is not None and a > b,
+        '>=': lambda a, b: a is not None and a >= b,
+        '~': lambda a, b: a is not None and b.lower() in a.lower(),
+        }
+COMPARISON = re.compile(r'\s*(\w+)\s*(!=|<=|>=|=|<|>|~)\s*(.*?)\s*')
+# A quoted value, which is skipped, or an "and" or "or" joining comparisons
+JOINER = re.compile(r'''[=<>~]\s*(?:"[^"]*"|'[^']*')|\s+(and|or)\s+''')
+
+# Plays are encoded in the table as fields separated by the unit separator,
+# and multiple plays of a TCP file by the record separator. The values of a
+# column are separated by the unit separator.
+FIELD_SEPARATOR = '\x1f'
+PLAY_SEPARATOR = '\x1e'
+
+
+def get_missing_filename(filename):
+    '''Returns the filename of the list of missing files of the given
+    metadata csv file.'''
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), 'missing_files.txt')
+
+
+def read_missing_codes(filename):
+    '''Returns the set of TCP codes of the xml files named in the given list
+    of missing files, or an empty set if it does not exist.'''
+    if not os.path.exists(filename):
+        return set()
+    with open(filename, 'r') as infile:
+        return set(re.findall(r'([A-Za-z]\d+)\.xml', infile.read()))
+
+
+def read_codes(filename, column=0):
+    '''Returns the TCP codes in the given column of the given csv file, in
+    order, skipping its header, if it has one, and any empty values. Values may
+    be TCP codes or xml filenames, such as those listed by get_file_list.py.
+    Each code is returned only once, and codes whose files are listed in
+    missing_files.txt alongside the csv file are left out.'''
+    codes = []
+    seen = read_missing_codes(get_missing_filename(filename))
+    with open(filename, newline='', encoding='utf-8-sig') as csvfile:
+        for row in csv.reader(csvfile):
+            if len(row) > column and row[column] and row[column] != 'TCP':
+                code = row[column].strip()
+                if code.endswith('.xml'):
+                    code = code[:-len('.xml')]
+                if code not in seen:
+                    seen.add(code)
+                    codes.append(code)
+    return codes
+
+
+def read_plays(filename=metadata_path, missing_codes=set()):
+    '''Returns a dictionary from each TCP code in the given metadata csv file
+    which is not in the given set of missing codes to the list of its plays,
+    as Plays.'''
+    plays = collections.OrderedDict()
+    with open(filename, newline='', encoding='utf-8-sig') as csvfile:
+        for row in csv.DictReader(csvfile):
+            code = row['TCP']
+            if not code or code in missing_codes:
+                continue
+            fields = [row.get(column, '') or '' for column in COLUMNS.values()]
+            plays.setdefault(code, []).append(Play(code, *[decode_field(field, value) for field, value in zip(COLUMNS, fields)]))
+    return plays
+
+
+def decode_field(field, value):
+    '''Returns the given string value of the given field, as a number if the
+    field is numeric, or None if it is empty.'''
+    if value == '':
+        return None
+    if field in NUMERIC_FIELDS:
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return value
+
+
+def encode_plays(plays):
+    '''Returns the given list of Plays as a single string.'''
+    return PLAY_SEPARATOR.join(FIELD_SEPARATOR.join('' if value is None else str(value) for value in play[1:]) for play in plays)
+
+
+def decode_plays(code, value):
+    '''Returns the list of Plays of the given TCP code encoded in the given
+    string by encode_plays().'''
+    plays = []
+    for encoded in value.split(PLAY_SEPARATOR):
+        values = encoded.split(FIELD_SEPARATOR)
+        plays.append(Play(code, *[decode_field(field, value) for field, value in zip(COLUMNS, values)]))
+    return plays
+
+
+def encode_columns(plays):
+    '''Returns a dictionary from each field to the values of the given dictionary
+    of the Plays of each TCP code, in order of code, as a single string.'''
+    ordered = [play for code in sorted(plays) for play in plays[code]]
+    return {field: FIELD_SEPARATOR.join('' if play[i] is None else str(play[i]) for play in ordered) for i, field in enumerate(FIELDS)}
+
+
+def decode_column(field, value):
+    '''Returns the list of values of the given field encoded in the given
+    string by encode_columns().'''
+    if field == 'code':
+        return value.split(FIELD_SEPARATOR) if value else []
+    return [decode_field(field, field_value) for field_value in value.split(FIELD_SEPARATOR)]
+
+
+class Index(object):
+    '''The plays of each TCP code in the metadata, backed by a compiled table
+    keyed by TCP code, and by a compiled table of the column of each field.
+    Indexing by a TCP code returns the list of its plays.'''
+
+    def __init__(self, plays_table, columns_table):
+        self.table = plays_table
+        self.columns_table = columns_table
+        self.columns = {}
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, code):
+        return code in self.table
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __getitem__(self, code):
+        return decode_plays(code, self.table[code])
+
+    def get_column(self, field):
+        '''Returns the list of the values of the given field of every play, in
+        order of TCP code, decoding it only once.'''
+        if field not in self.columns:
+            self.columns[field] = decode_column(field, self.columns_table[field])
+        return self.columns[field]
+
+    def scan(self, fields, matches):
+        '''Returns the TCP codes, in order, of which any play matches the given
+        function, which is given Plays in which only the given fields, and the
+        code, are filled in.'''
+        columns = [self.get_column(field) if field in fields or field == 'code' else itertools.repeat(None) for field in FIELDS]
+        codes = []
+        for play in map(Play._make, zip(*columns)):
+            if matches(play) and (not codes or codes[-1] != play.code):
+                codes.append(play.code)
+        return codes
+
+    def select(self, query):
+        '''Returns the TCP codes, in order, of which any play matches the
+        given query, or all of them if the query is None. If the query gives
+        the codes of all the plays it may match, only those are looked up, and
+        otherwise the columns of the fields it compares are scanned.'''
+        if query is None:
+            return list(self.table)
+        alternatives = split_query(query)
+        matches = parse_query(query)
+        codes = get_query_codes(alternatives)
+        if codes is None:
+            fields = {read_comparison(comparison)[0] for comparisons in alternatives for comparison in comparisons}
+            return self.scan(fields, matches)
+        # The table is sorted by code, so this is the order of a scan
+        codes = [code for code in sorted(codes) if code in self.table]
+        return [code for code in codes if any(matches(play) for play in self[code])]
+
+
+def load_index(filename=metadata_path):
+    '''Returns the Index of the given metadata csv file, leaving out the plays
+    whose files are listed as missing, compiling it only if it has not been
+    compiled from the same files before.'''
+    missing_filename = get_missing_filename(filename)
+    missing_hash = ''
+    if os.path.exists(missing_filename):
+        missing_hash = cache.hash_file(missing_filename)
+    fingerprint = cache.fingerprint(cache.hash_file(filename), missing_hash)
+
+    plays = []  # Read only if a table is compiled, and only once
+
+    def get_plays():
+        if not plays:
+            plays.append(read_plays(filename, read_missing_codes(missing_filename)))
+        return plays[0]
+
+    def get_dict():
+        return {code: encode_plays(code_plays) for code, code_plays in get_plays().items()}
+
+    def get_columns():
+        return encode_columns(get_plays())
+    return Index(table.load_table('metadata', fingerprint, get_dict), table.load_table('metadata-columns', fingerprint, get_columns))
+
+
+def read_comparison(comparison):
+    '''Returns a tuple of the field, operator, and value of the given
+    comparison, with any quotes removed from the value, which is a number if
+    it is compared as one. Raises a getopt.GetoptError if the comparison is
+    invalid.'''
+    match = COMPARISON.fullmatch(comparison)
+    if match is None:
+        raise getopt.GetoptError('invalid comparison in query: {}'.format(comparison.strip()))
+    field, operator, value = match.groups()
+    if field not in FIELDS:
+        raise getopt.GetoptError('unknown field in query: {} (fields are {})'.format(field, ', '.join(FIELDS)))
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        value = value[1:-1]
+    if field in NUMERIC_FIELDS and operator != '~':
+        try:
+            value = int(value)
+        except ValueError:
+            raise getopt.GetoptError('{} must be compared with a number: {}'.format(field, comparison.strip()))
+    return (field, operator, value)
+
+
+def parse_comparison(comparison):
+    '''Returns a function which returns True if a Play satisfies the given
+    comparison. Raises a getopt.GetoptError if the comparison is invalid.'''
+    field, operator, value = read_comparison(comparison)
+    compare = OPERATORS[operator]
+    index = FIELDS.index(field)
+    if operator == '~' and field in NUMERIC_FIELDS:
+        return lambda play: play[index] is not None and compare(str(play[index]), value)
+    return lambda play: compare(play[index], value)
+
+
+def split_query(query):
+    '''Returns the alternatives of the given query, joined by "or", each as
+    the list of its comparisons, joined by "and". An "and" or "or" inside a
+    quoted value does not join comparisons.'''
+    query = ' ' + query.strip() + ' '
+    alternatives = [[]]
+    start = 0
+    for match in JOINER.finditer(query):
+        if match.group(1) is None:
+            continue
+        alternatives[-1].append(query[start:match.start()])
+        if match.group(1) == 'or':
+            alternatives.append([])
+        start = match.end()
+    alternatives[-1].append(query[start:])
+    return alternatives
+
+
+def get_query_codes(alternatives):
+    '''Returns the set of TCP codes of which a play may match the given
+    alternatives of a query, as returned by split_query(), if each of them
+    compares the code with =, or else None. Raises a getopt.GetoptError if a
+    comparison is invalid.'''
+    codes = set()
+    for comparisons in alternatives:
+        equal = [value for field, operator, value in map(read_comparison, comparisons) if field == 'code' and operator == '=']
+        if not equal:
+            return None
+        if len(set(equal)) == 1:
+            codes.add(equal[0])
+    return codes
+
+
+def parse_query(query):
+    '''Returns a function which returns True if a Play matches the given
+    query. Raises a getopt.GetoptError if the query is invalid.'''
+    alternatives = [[parse_comparison(comparison) for comparison in comparisons] for comparisons in split_query(query)]
+    return lambda play: any(all(compare(play) for compare in comparisons) for comparisons in alternatives)
+
+
+def select_filenames(query, filename=metadata_path):
+    '''Returns the xml filenames of the TCP codes in the given metadata csv
+    file of which any play matches the given query, leaving out those whose
+    files are listed as missing.'''
+    return [code + '.xml' for code in load_index(filename).select(query)]
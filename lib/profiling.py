@@ -0,0 +1,161 @@
+'''Built-in profiling shared by every script in the pipeline and tools.
+
+Every script accepts the following options before its own options, which are
+removed from the argument list before the script parses it:
+
+    --profile[=directory]   Run the script under cProfile, writing the stats
+                                and a json summary of the time spent in each
+                                phase to the given directory (default .)
+    --profile-memory        Also trace memory allocations with tracemalloc,
+                                adding the peak traced memory and the lines
+                                which allocated the most to the summary.
+
+Output files are named <script>-<host>-<pid>-<time>.prof and .json, so that
+several stages profiled at once within one shell pipeline never collide.
+
+Phases are recorded with phase(), a context manager, and timed(), which wraps
+an iterable so that the time spent producing each item is counted. Phases nest:
+time spent in an inner phase is counted only for that phase, and not for the
+phase which encloses it, so the phases of a streaming pipeline add up to the
+whole run even though reading, parsing, and writing are interleaved. When
+profiling is off, both return immediately without timing anything.
+'''
+
+import sys
+import os
+import time
+import contextlib
+
+enabled = False
+phase_times = {}
+phase_stack = []
+
+
+def timed(iterable, name):
+    '''Returns an iterable over the given iterable which counts the time spent
+    producing each item toward the phase with the given name. Returns the
+    iterable itself if profiling is off.'''
+    if not enabled:
+        return iterable
+    return _timed(iterable, name)
+
+
+def _timed(iterable, name):
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+@contextlib.contextmanager
+def _phase(name):
+    start = time.perf_counter()
+    phase_stack.append(0.0)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        inner = phase_stack.pop()
+        phase_times[name] = phase_times.get(name, 0.0) + elapsed - inner
+        if phase_stack:
+            phase_stack[-1] += elapsed
+
+
+def phase(name):
+    '''Returns a context manager which counts the time spent within it toward
+    the phase with the given name, excluding time counted toward any phase
+    entered within it.'''
+    if not enabled:
+        return contextlib.nullcontext()
+    return _phase(name)
+
+
+def get_profile_options(arg_list):
+    '''Removes the profiling options from the given argument list. Returns a
+    tuple of the remaining arguments, the directory to which to write profiles
+    (or None if profiling is off), and whether to trace memory.'''
+    remaining = []
+    directory = None
+    memory = False
+    for i, arg in enumerate(arg_list):
+        if arg == '--':
+            remaining += arg_list[i:]
+            break
+        if arg == '--profile':
+            directory = '.'
+        elif arg.startswith('--profile='):
+            directory = arg[len('--profile='):]
+        elif arg == '--profile-memory':
+            memory = True
+        else:
+            remaining.append(arg)
+    if memory and directory is None:
+        directory = '.'
+    return (remaining, directory, memory)
+
+
+def get_profile_prefix(directory, name):
+    '''Returns the path prefix for the profile files of this process, which is
+    unique among concurrent processes, even across hosts sharing a filesystem.'''
+    import socket
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    filename = '{}-{}-{}-{}'.format(name, socket.gethostname(), os.getpid(), stamp)
+    return os.path.join(directory, filename)
+
+
+def write_summary(prefix, name, arg_list, wall_time, snapshot=None, peak_memory=None):
+    '''Writes the json summary of the phase times, and of the memory trace if
+    one was taken, to the file given by the prefix.'''
+    import json
+    summary = {
+            'script': name,
+            'args': arg_list,
+            'pid': os.getpid(),
+            'wall_time': wall_time,
+            'phases': phase_times
+            }
+    if snapshot is not None:
+        summary['peak_memory_bytes'] = peak_memory
+        summary['top_allocations'] = [str(stat) for stat in snapshot.statistics('lineno')[:20]]
+    with open(prefix + '.json', 'w') as outfile:
+        json.dump(summary, outfile, indent=2)
+        outfile.write('\n')
+
+
+def run(parse_function, arg_list, name):
+    '''Runs the given parse function of a script on the given arguments, first
+    removing the profiling options. If profiling is requested, runs the
+    function under cProfile (and tracemalloc, if requested), and writes the
+    profile and summary once the script finishes or exits.'''
+    global enabled
+    arg_list, directory, memory = get_profile_options(arg_list)
+    if directory is None:
+        return parse_function(arg_list)
+    import cProfile
+    enabled = True
+    os.makedirs(directory, 0o755, exist_ok=True)
+    prefix = get_profile_prefix(directory, name)
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        return parse_function(arg_list)
+    finally:
+        profiler.disable()
+        wall_time = time.perf_counter() - start
+        snapshot = None
+        peak_memory = None
+        if memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        profiler.dump_stats(prefix + '.prof')
+        write_summary(prefix, name, arg_list, wall_time, snapshot, peak_memory)
+        print('Profile written to {}.prof and {}.json'.format(prefix, prefix), file=sys.stderr)
@@ -0,0 +1,73 @@
+'''Messages between the pipeline daemon and its clients.
+
+A client connects to the daemon's Unix domain socket and sends a single line
+of json describing its job: the stage, the options of the stage's script, and
+the client's working directory, against which relative filenames are
+resolved. The client then sends the stage's input, exactly as the script
+would read it from stdin, and shuts down its side of the socket.
+
+The daemon replies with a sequence of chunks, each of which is a byte naming
+the stream to which it belongs, a little-endian uint32 length, and the data.
+Chunks of the OUTPUT stream are what the script would write to stdout, chunks
+of the ERRORS stream are what it would write to stderr, and the last chunk is
+of the STATUS stream, holding the script's exit status as ascii digits.
+'''
+
+import io
+import os
+import struct
+
+OUTPUT = b'o'
+ERRORS = b'e'
+STATUS = b'x'
+CHUNK = struct.Struct('<cI')
+
+
+def get_socket_path():
+    '''Returns the path of the daemon's socket, given by the CTP_SOCKET
+    environment variable, or else private to the current user in /tmp.'''
+    return os.environ.get('CTP_SOCKET', '/tmp/ctp-{}.sock'.format(os.getuid()))
+
+
+def send_chunk(sock, stream, data):
+    '''Sends the given bytes on the given socket as a chunk of the given
+    stream.'''
+    sock.sendall(CHUNK.pack(stream, len(data)))
+    sock.sendall(data)
+
+
+def read_chunk(infile):
+    '''Reads a chunk from the given binary file. Returns a tuple of its stream
+    and its data, or of None and empty data if the file ends first.'''
+    header = infile.read(CHUNK.size)
+    if len(header) < CHUNK.size:
+        return (None, b'')
+    stream, length = CHUNK.unpack(header)
+    data = infile.read(length)
+    if len(data) < length:
+        return (None, b'')
+    return (stream, data)
+
+
+class ChunkWriter(io.RawIOBase):
+    '''A binary file which sends everything written to it on the given socket
+    as chunks of the given stream. It is best wrapped in a BufferedWriter, so
+    that each chunk is large.'''
+
+    def __init__(self, sock, stream):
+        self.sock = sock
+        self.stream = stream
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        send_chunk(self.sock, self.stream, bytes(data))
+        return len(data)
+
+
+def open_stream(sock, stream, buffer_size=1 << 16):
+    '''Returns a text file which sends everything written to it on the given
+    socket as chunks of the given stream, and whose buffer attribute is the
+    equivalent binary file.'''
+    return io.TextIOWrapper(io.BufferedWriter(ChunkWriter(sock, stream), buffer_size), encoding='utf-8')
@@ -0,0 +1,104 @@
+'''Structured rows shared by the stages of the pipeline.
+
+Every script in the pipeline reads and writes one character per line, where
+the first field is the TCP code, the second field is the character's name, and
+the remaining fields are either xml text (tab-separated) or words
+(space-separated). A Row holds those same three parts so that stages can be
+composed in-process without formatting and re-splitting the text at each hop.
+'''
+
+import collections
+import itertools
+import lib.profiling as profiling
+
+Row = collections.namedtuple('Row', ['code', 'character', 'elements'])
+
+
+def get_separator(in_string):
+    '''Returns the separator used by the given pipeline string, which is a tab
+    character if any tab exists in the string, else a space character.'''
+    if '\t' in in_string:
+        return '\t'
+    return ' '
+
+
+def parse_row(line, separator):
+    '''Splits a single line of pipeline text into a Row using the given
+    separator. Fields are not collapsed, so formatting the Row with the same
+    separator reproduces the line exactly.'''
+    fields = line.split(separator)
+    assert(len(fields) >= 2)
+    return Row(fields[0], fields[1], fields[2:])
+
+
+def parse_rows(in_string, separator=None):
+    '''Generates a Row for each non-empty line of the given pipeline string. If
+    no separator is given, the separator is detected from the string.'''
+    if separator is None:
+        separator = get_separator(in_string)
+    for line in in_string.split('\n'):
+        if line.strip() == '':
+            continue
+        yield parse_row(line, separator)
+
+
+def read_rows(infile):
+    '''Reads pipeline text from the given file one line at a time. The
+    separator is detected from the first non-empty line, which contains a tab
+    character if and only if the text is tsv-style. Returns a tuple of the
+    separator (a space character if the file is empty) and a generator of the
+    Rows.'''
+    line = infile.readline()
+    while line and line.strip() == '':
+        line = infile.readline()
+    separator = get_separator(line)
+
+    def generate_rows(first_line):
+        for line in profiling.timed(itertools.chain([first_line], infile), 'read'):
+            line = line.rstrip('\n')
+            if line.strip() != '':
+                yield parse_row(line, separator)
+
+    return (separator, profiling.timed(generate_rows(line), 'parse'))
+
+
+def parse_word_rows(in_string):
+    '''Generates a Row for each non-empty line of the given string, splitting
+    each line on any whitespace so that every element is a single word.'''
+    for line in in_string.split('\n'):
+        words = line.split()
+        if not words:
+            continue
+        assert(len(words) >= 2)
+        yield Row(words[0], words[1], words[2:])
+
+
+def iter_words(row):
+    '''Generates the individual words of a Row, whether its elements are single
+    words or cleaned strings which contain several space-separated words.'''
+    for element in row.elements:
+        for word in element.split():
+            yield word
+
+
+def format_character(character, separator):
+    '''Returns the given character's name as it is written in pipeline text
+    with the given separator. If the separator is a space character, spaces in
+    the name are replaced by hyphens so that the name remains a single word, as
+    clean.py has always done.'''
+    if separator == ' ':
+        return character.replace(' ', '-')
+    return character
+
+
+def format_row(row, separator):
+    '''Returns the line of pipeline text for the given Row, without a trailing
+    newline character, with the character's name as given by
+    format_character().'''
+    return separator.join([row.code, format_character(row.character, separator)] + list(row.elements))
+
+
+def format_rows(rows, separator):
+    '''Returns the pipeline string for the given Rows, with each row followed
+    by a newline character.'''
+    return '\n'.join(format_row(row, separator) for row in rows) + '\n'
@@ -0,0 +1,122 @@
+'''Deterministic, seeded samples of the corpus, stratified within genres.
+
+A sample is given as UNIT:FRACTION[:SEED], such as play:0.1 or line:0.25:7,
+where the unit is play, character, or line. Every choice is made by a stable
+hash of the seed and the code, character, or line being chosen, rather than
+by a random number generator, so the same seed always gives the same sample,
+in every process and whatever the order in which files are given, and a
+checkpointed or sharded run samples exactly what an ordinary run does.
+
+Plays are sampled separately within each genre of the VEP metadata, characters
+separately within each <text> of each play, and lines separately within each
+character's speech, so that every stratum is sampled at the given fraction.
+Only plays are stratified by genre itself. The strata of characters and
+lines lie within a single play, and so within a single genre, which is
+therefore sampled at the given fraction too, but they are not stratified by
+genre across plays: that would make the sample of each play depend on which
+other plays of its genre are in the run, so that a sharded or checkpointed
+run, which sees one play at a time, could not sample as an ordinary run does.
+The number sampled from a stratum of N units is N * FRACTION rounded up or
+down at random, so that every unit is sampled with probability exactly
+FRACTION, and statistics of the sample may be scaled up by 1 / FRACTION
+without bias.
+'''
+
+import getopt
+import itertools
+import lib.rows as rows
+import lib.cache as cache
+import lib.shards as shards
+
+UNITS = ('play', 'character', 'line')
+
+
+def parse_sample(arg):
+    '''Parses a sample given as UNIT:FRACTION[:SEED]. Returns a tuple of the
+    unit, the fraction, and the seed, which defaults to 0.'''
+    parts = arg.split(':')
+    if len(parts) not in (2, 3) or parts[0] not in UNITS:
+        raise getopt.GetoptError('sample must be given as UNIT:FRACTION[:SEED], where UNIT is {}: {}'.format(', '.join(UNITS), arg))
+    try:
+        fraction = float(parts[1])
+    except ValueError:
+        raise getopt.GetoptError('sample fraction must be a number: {}'.format(arg))
+    if not 0 < fraction <= 1:
+        raise getopt.GetoptError('sample fraction must be greater than 0 and at most 1: {}'.format(arg))
+    seed = '0'
+    if len(parts) == 3:
+        seed = parts[2]
+    return (parts[0], fraction, seed)
+
+
+def get_key(seed, *parts):
+    '''Returns a number from 0 to 1, fixed by the given seed and parts, which
+    is uniformly distributed over different seeds and parts.'''
+    return int(cache.fingerprint(seed, *parts)[:16], 16) / (1 << 64)
+
+
+def get_sample_size(count, fraction, key):
+    '''Returns the given count times the given fraction, rounded up with a
+    probability equal to its fractional part, as given by the key.'''
+    return int(count * fraction + key)
+
+
+def choose(items, fraction, seed, stratum, get_name):
+    '''Returns the set of indices of the items chosen from the given list,
+    which is a stratum with the given name, ranking the items by the key of
+    the name given for each by get_name.'''
+    size = get_sample_size(len(items), fraction, get_key(seed, 'stratum', *stratum))
+    ranked = sorted(range(len(items)), key=lambda i: get_key(seed, *get_name(i)))
+    return set(ranked[:size])
+
+
+def sample_plays(filenames, fraction, seed, genres):
+    '''Returns the given xml filenames of the plays sampled from each genre,
+    in order, where genres maps each TCP code to its genre.'''
+    strata = {}
+    for filename in filenames:
+        strata.setdefault(genres.get(shards.get_code(filename)), []).append(filename)
+    sampled = set()
+    for genre, stratum in strata.items():
+        chosen = choose(stratum, fraction, seed, ('genre', str(genre)), lambda i: ('play', shards.get_code(stratum[i])))
+        sampled.update(stratum[i] for i in chosen)
+    return [filename for filename in filenames if filename in sampled]
+
+
+def sample_rows(in_rows, unit, fraction, seed):
+    '''Generates the characters sampled from each <text>, or the Rows with the
+    lines sampled from each character's speech, of the given Rows, in order.
+    The Rows of each <text> must be consecutive, as they are as extracted.
+    Plays are not sampled here, but by sample_plays().'''
+    for code, text_rows in itertools.groupby(in_rows, key=lambda row: row.code):
+        text_rows = list(text_rows)
+        if unit == 'character':
+            chosen = choose(text_rows, fraction, seed, ('text', code), lambda i: ('character', code, text_rows[i].character))
+            for i, row in enumerate(text_rows):
+                if i in chosen:
+                    yield row
+        elif unit == 'line':
+            for row in text_rows:
+                elements = row.elements
+                chosen = choose(elements, fraction, seed, ('lines', code, row.character), lambda i: ('line', code, row.character, str(i)))
+                if chosen:
+                    yield rows.Row(row.code, row.character, [element for i, element in enumerate(elements) if i in chosen])
+        else:
+            yield from text_rows
+
+
+def get_genres(filenames, metadata_filename=None):
+    '''Returns a dictionary from the TCP code of each of the given xml
+    filenames to its genre in the given VEP metadata csv file, or in
+    data/VEP_metadata.csv, or to None if it has none.'''
+    import lib.metadata as metadata
+    if metadata_filename is None:
+        metadata_filename = metadata.metadata_path
+    index = metadata.load_index(metadata_filename)
+    genres = {}
+    for filename in filenames:
+        code = shards.get_code(filename)
+        genres[code] = None
+        if code in index:
+            genres[code] = index[code][0].genre
+    return genres
@@ -0,0 +1,62 @@
+'''Deterministic partitioning of the corpus into shards by TCP code.
+
+Each xml file belongs to shard K of N (counting from 1) according to a stable
+hash of its TCP code, so every machine given the same list of files and the
+same N selects the same plays, without any coordination. Machines sharing a
+filesystem coordinate only through lock files, which are created exclusively
+so that no shard is run by two processes at once.
+'''
+
+import os
+import getopt
+import lib.compression as compression
+
+
+def get_code(filename):
+    '''Returns the TCP code of the given xml filename, which may be
+    compressed.'''
+    return os.path.basename(compression.strip_extension(filename)).replace('.xml', '')
+
+
+def get_shard(code, shard_count):
+    '''Returns the shard, from 1 to the shard count, to which the given TCP
+    code belongs. Unlike hash(), this is the same in every process.'''
+    import hashlib
+    digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+    return int(digest[:16], 16) % shard_count + 1
+
+
+def select(filenames, shard, shard_count):
+    '''Returns the filenames which belong to the given shard, in order.'''
+    return [filename for filename in filenames if get_shard(get_code(filename), shard_count) == shard]
+
+
+def parse_shard(arg):
+    '''Parses a shard given as K/N. Returns a tuple of the shard and the shard
+    count.'''
+    try:
+        shard, shard_count = [int(n) for n in arg.split('/')]
+    except ValueError:
+        raise getopt.GetoptError('shard must be given as K/N: {}'.format(arg))
+    if shard_count < 1 or shard < 1 or shard > shard_count:
+        raise getopt.GetoptError('shard must be from 1 to N: {}'.format(arg))
+    return (shard, shard_count)
+
+
+def acquire_lock(lock_filename):
+    '''Creates the given lock file, recording the host and process holding
+    it. Raises FileExistsError if the lock is already held.'''
+    import socket
+    try:
+        fd = os.open(lock_filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        with open(lock_filename, 'r') as lock_file:
+            holder = lock_file.read().strip()
+        raise FileExistsError('{} is held by {}; remove it if that process is no longer running'.format(lock_filename, holder))
+    with os.fdopen(fd, 'w') as lock_file:
+        lock_file.write('{} {}\n'.format(socket.gethostname(), os.getpid()))
+
+
+def release_lock(lock_filename):
+    '''Removes the given lock file.'''
+    os.remove(lock_filename)
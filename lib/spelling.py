@@ -0,0 +1,140 @@
+'''A symmetric delete spelling index over a phoneme dictionary's vocabulary.
+
+Words not in the phoneme dictionary are mostly early modern spellings of
+words which are, such as haue, iust, sonne, and citie. Each word is first
+reduced to its skeleton by the substitutions of early modern spelling: vv to
+w, v to u, j to i, y to i, ck to c, doubled letters to single letters, and no
+final e. A word is resolved to the known word whose skeleton is closest to
+its own, within a bounded edit distance, so that variants differing only by
+those substitutions are at distance 0.
+
+Close skeletons are found as by SymSpell: every skeleton of the vocabulary is
+indexed under each string made by deleting up to the maximum distance of
+letters from its first PREFIX_LENGTH letters, and the skeleton of an unknown
+word is looked up under each of its own such deletes, so that each lookup
+takes a fixed number of table lookups however large the vocabulary is. The
+candidates are then checked by their true edit distance, counting adjacent
+transpositions as single edits.
+
+Both tables are compiled on first use into memory-mapped tables (see
+lib/table.py), named by a fingerprint of the dictionary and the maximum
+distance, so they are built only once for each dictionary.
+'''
+
+import re
+import collections
+import lib.cache as cache
+import lib.table as table
+
+VERSION = '1'
+PREFIX_LENGTH = 7
+SEPARATOR = '\x1f'
+WORD = re.compile(r"[a-z']+")
+
+Index = collections.namedtuple('Index', ['vocabulary', 'skeletons', 'deletes', 'max_distance'])
+
+
+def get_skeleton(word):
+    '''Returns the skeleton of the given word, which is the same for spelling
+    variants which differ only by the substitutions of early modern spelling.'''
+    word = word.lower().replace('vv', 'w')
+    word = word.replace('v', 'u').replace('j', 'i').replace('y', 'i').replace('ck', 'c')
+    word = re.sub(r'(.)\1+', r'\1', word)
+    if len(word) > 2 and word.endswith('e'):
+        word = word[:-1]
+    return word
+
+
+def get_deletes(word, distance):
+    '''Returns the set of strings made by deleting up to the given number of
+    letters from the first PREFIX_LENGTH letters of the given word, including
+    the prefix itself.'''
+    deletes = {word[:PREFIX_LENGTH]}
+    frontier = deletes
+    for i in range(distance):
+        frontier = {string[:j] + string[j + 1:] for string in frontier if len(string) > 1 for j in range(len(string))}
+        deletes = deletes | frontier
+    return deletes
+
+
+def get_distance(a, b, max_distance):
+    '''Returns the optimal string alignment distance between the given
+    strings, or max_distance + 1 if it is greater than max_distance.'''
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > max_distance:
+            return max_distance + 1
+    return row[-1]
+
+
+def get_skeleton_dict(vocabulary):
+    '''Returns a dictionary from each skeleton of the given words to the
+    words with that skeleton, joined by SEPARATOR.'''
+    skeletons = {}
+    for word in vocabulary:
+        if WORD.fullmatch(word):
+            skeletons.setdefault(get_skeleton(word), []).append(word)
+    return {skeleton: SEPARATOR.join(sorted(words)) for skeleton, words in skeletons.items()}
+
+
+def get_delete_dict(skeletons, max_distance):
+    '''Returns a dictionary from each delete of the given skeletons, up to the
+    given distance, to the skeletons with that delete, joined by SEPARATOR.'''
+    deletes = {}
+    for skeleton in skeletons:
+        for delete in get_deletes(skeleton, max_distance):
+            if delete in deletes:
+                deletes[delete] += SEPARATOR + skeleton
+            else:
+                deletes[delete] = skeleton
+    return deletes
+
+
+def load_index(vocabulary, fingerprint, max_distance=2):
+    '''Returns the Index of the given vocabulary, a phoneme dictionary or
+    table whose contents are identified by the given fingerprint, compiling
+    its tables only if they have not been compiled before.'''
+    fingerprint = cache.fingerprint(VERSION, fingerprint, PREFIX_LENGTH)
+    skeletons = table.load_table('skeletons', fingerprint, lambda: get_skeleton_dict(vocabulary))
+    deletes_fingerprint = cache.fingerprint(fingerprint, max_distance)
+    deletes = table.load_table('deletes', deletes_fingerprint, lambda: get_delete_dict(skeletons, max_distance))
+    return Index(vocabulary, skeletons, deletes, max_distance)
+
+
+def get_max_distance(skeleton, max_distance):
+    '''Returns the greatest edit distance at which a word with the given
+    skeleton may be resolved: 0 below 4 letters and 1 below 7, at most, since
+    shorter words have too many neighbours to resolve.'''
+    return min(max_distance, (len(skeleton) - 1) // 3)
+
+
+def lookup(index, word):
+    '''Returns a tuple of the edit distance between the skeleton of the given
+    word and the closest skeleton of a known word, and the list of the known
+    words closest to the given word, or None and an empty list if no known
+    word is within the maximum distance.'''
+    skeleton = get_skeleton(word)
+    max_distance = get_max_distance(skeleton, index.max_distance)
+    candidates = set()
+    for delete in get_deletes(skeleton, max_distance):
+        if delete in index.deletes:
+            candidates.update(index.deletes[delete].split(SEPARATOR))
+    ranked = []
+    for candidate in candidates:
+        distance = get_distance(skeleton, candidate, max_distance)
+        if distance <= max_distance:
+            for known in index.skeletons[candidate].split(SEPARATOR):
+                ranked.append((distance, get_distance(word, known, len(word) + len(known)), known))
+    if not ranked:
+        return (None, [])
+    best = min(ranked)[:2]
+    return (best[0], sorted(known for distance, word_distance, known in ranked if (distance, word_distance) == best))
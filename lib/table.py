@@ -0,0 +1,163 @@
+'''Compiled, read-only string tables which are memory-mapped rather than loaded.
+
+Loading a dictionary such as the standardizer dictionary or the cmudict builds
+a Python dict in every process which uses it. A compiled table is instead a
+file which each process maps into memory, so that any number of worker
+processes share a single physical copy through the page cache, and opening a
+table takes no longer than opening a file.
+
+A table file begins with the magic header and a little-endian uint32 count of
+its entries, followed by count + 1 uint32 offsets into the key blob, count + 1
+uint32 offsets into the value blob, the key blob, and the value blob. Keys are
+utf-8 encoded and sorted bytewise, so that a key is found by binary search.
+
+Tables are compiled on first use into the dicts/compiled directory, named by
+a fingerprint of everything from which they were compiled, and are opened as
+Table objects, which may be used in place of the dict from which they were
+compiled. If the table cannot be compiled, the dict itself is used.
+'''
+
+import os
+import mmap
+import array
+import struct
+import functools
+import collections.abc
+import lib.cache as cache
+
+MAGIC = b'\x00CTPT\x01\x00\x00'
+HEADER = struct.Struct('<8sI')
+VERSION = '1'
+MEMO_SIZE = 1 << 16  # Lookups remembered by each table
+
+table_dir = os.path.dirname(os.path.abspath(__file__)) + '/../dicts/compiled'
+
+
+def compile_table(table_filename, items):
+    '''Atomically writes a table of the given (key, value) string pairs to the
+    given filename.'''
+    items = sorted((key.encode('utf-8'), value.encode('utf-8')) for key, value in items)
+    key_offsets = array.array('I', [0])
+    value_offsets = array.array('I', [0])
+    for key, value in items:
+        key_offsets.append(key_offsets[-1] + len(key))
+        value_offsets.append(value_offsets[-1] + len(value))
+    if key_offsets.itemsize != 4:
+        raise OSError('tables require 4 byte unsigned integers')
+    if struct.pack('=I', 1) != struct.pack('<I', 1):
+        key_offsets.byteswap()
+        value_offsets.byteswap()
+    with cache.atomic_open(table_filename) as outfile:
+        outfile.write(HEADER.pack(MAGIC, len(items)))
+        outfile.write(key_offsets.tobytes())
+        outfile.write(value_offsets.tobytes())
+        outfile.write(b''.join(key for key, value in items))
+        outfile.write(b''.join(value for key, value in items))
+
+
+class Table(collections.abc.Mapping):
+    '''A read-only mapping from strings to values, backed by a memory-mapped
+    table file. Values are strings, or are converted from strings by the given
+    decode function. The most recent MEMO_SIZE keys looked up are remembered,
+    along with their values, so that repeated lookups of common words cost no
+    more than a dict lookup, while the table is not copied into the memory of
+    a long-running process one lookup at a time.'''
+
+    def __init__(self, table_filename, decode=None):
+        with open(table_filename, 'rb') as table_file:
+            self.map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a compiled table'.format(table_filename))
+        start = HEADER.size
+        self.key_offsets = self.read_offsets(start)
+        start += 4 * (self.count + 1)
+        self.value_offsets = self.read_offsets(start)
+        self.keys_start = start + 4 * (self.count + 1)
+        self.values_start = self.keys_start + self.key_offsets[self.count]
+        self.decode = decode
+        self.lookup = functools.lru_cache(maxsize=MEMO_SIZE)(self.find_value)
+
+    def read_offsets(self, start):
+        '''Returns the offset array beginning at the given position, as a view
+        of the mapped file if the byte order allows, or as a copy otherwise.'''
+        view = memoryview(self.map)[start:start + 4 * (self.count + 1)]
+        if struct.pack('=I', 1) == struct.pack('<I', 1):
+            return view.cast('I')
+        offsets = array.array('I', bytes(view))
+        offsets.byteswap()
+        return offsets
+
+    def key_at(self, i):
+        '''Returns the utf-8 encoded key at the given index.'''
+        return self.map[self.keys_start + self.key_offsets[i]:self.keys_start + self.key_offsets[i + 1]]
+
+    def value_at(self, i):
+        '''Returns the decoded value at the given index.'''
+        value = str(self.map[self.values_start + self.value_offsets[i]:self.values_start + self.value_offsets[i + 1]], 'utf-8')
+        if self.decode is not None:
+            value = self.decode(value)
+        return value
+
+    def find(self, key):
+        '''Returns the index of the given key, or -1 if it is not in the table.'''
+        target = key.encode('utf-8')
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.key_at(low) == target:
+            return low
+        return -1
+
+    def find_value(self, key):
+        '''Returns a tuple of whether the given key is in the table and its
+        value. Tables look keys up through lookup(), which remembers the
+        results of this.'''
+        i = -1
+        if isinstance(key, str):
+            i = self.find(key)
+        if i < 0:
+            return (False, None)
+        return (True, self.value_at(i))
+
+    def __getitem__(self, key):
+        found, value = self.lookup(key)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.lookup(key)[0]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield str(self.key_at(i), 'utf-8')
+
+
+def load_table(name, fingerprint, get_dict, encode=None, decode=None):
+    '''Returns the table with the given name compiled from the dict returned
+    by get_dict, whose contents are identified by the given fingerprint,
+    compiling it only if it has not been compiled before. Values are converted
+    to strings by the encode function, and back by the decode function, if
+    they are not strings. If the table cannot be compiled, such as when the
+    project directory is read-only, returns the dict itself.'''
+    fingerprint = cache.fingerprint(VERSION, fingerprint)
+    table_filename = '{}/{}-{}.ctpt'.format(table_dir, name, fingerprint[:16])
+    if not os.path.exists(table_filename):
+        dictionary = get_dict()
+        items = dictionary.items()
+        if encode is not None:
+            items = ((key, encode(value)) for key, value in items)
+        try:
+            compile_table(table_filename, items)
+        except OSError:
+            return dictionary
+    return Table(table_filename, decode)
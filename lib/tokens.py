@@ -0,0 +1,130 @@
+'''Memory-mapped columnar store of the token streams of each character.
+
+A token store holds the words (or phonemes) spoken by every character as one
+contiguous array of int32 token ids, each of which indexes the store's
+vocabulary, so that analyses may load a corpus without reading and splitting
+its text. Each character's tokens are a contiguous slice of the array, given
+by the store's index of (TCP code, character) to offset and length.
+
+A store file begins with the magic header and three little-endian uint64s:
+the number of tokens, the position of the index, and the position of the
+vocabulary. The token array follows immediately, as little-endian int32s. The
+index follows the tokens, as utf-8 lines of the form
+    TCPcode\\tcharacter\\toffset\\tlength\\n
+and the vocabulary follows the index, as one utf-8 token per line, in order of
+token id.
+
+A TokenStore maps the file into memory, and returns the tokens of each
+character as a NumPy array which is a view of the mapped file, or as a
+memoryview of int32s if NumPy is not installed.
+'''
+
+import mmap
+import array
+import struct
+
+MAGIC = b'\x00CTPS\x01\x00\x00'
+HEADER = struct.Struct('<8sQQQ')
+
+
+def get_token_bytes(ids):
+    '''Returns the given array of int32 token ids as little-endian bytes.'''
+    if struct.pack('=i', 1) != struct.pack('<i', 1):
+        ids = array.array('i', ids)
+        ids.byteswap()
+    return ids.tobytes()
+
+
+def store_rows(outfile, in_rows, iter_tokens):
+    '''Writes a token store of the given Rows to the given binary file, which
+    must be seekable, taking the tokens of each Row from the iter_tokens
+    function, such as lib.rows.iter_words. Generates each Row unchanged after
+    its tokens are written, and completes the store once every Row has been
+    generated.'''
+    vocabulary = {}
+    index = []
+    count = 0
+    outfile.write(HEADER.pack(MAGIC, 0, 0, 0))
+    for row in in_rows:
+        ids = array.array('i')
+        for token in iter_tokens(row):
+            if token not in vocabulary:
+                vocabulary[token] = len(vocabulary)
+            ids.append(vocabulary[token])
+        outfile.write(get_token_bytes(ids))
+        index.append('{}\t{}\t{}\t{}\n'.format(row.code, row.character, count, len(ids)))
+        count += len(ids)
+        yield row
+    index_position = HEADER.size + 4 * count
+    index_data = ''.join(index).encode('utf-8')
+    outfile.write(index_data)
+    outfile.write(''.join(token + '\n' for token in vocabulary).encode('utf-8'))
+    outfile.seek(0)
+    outfile.write(HEADER.pack(MAGIC, count, index_position, index_position + len(index_data)))
+
+
+def write_store(outfile, in_rows, iter_tokens):
+    '''Writes a token store of the given Rows to the given binary file, as
+    store_rows() does.'''
+    for row in store_rows(outfile, in_rows, iter_tokens):
+        pass
+
+
+class TokenStore:
+    '''A read-only token store, memory-mapped from the given file.'''
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as infile:
+            self.map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, index_position, vocabulary_position = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a token store'.format(filename))
+        self.index = {}
+        self.keys = []
+        for line in str(self.map[index_position:vocabulary_position], 'utf-8').splitlines():
+            code, character, offset, length = line.split('\t')
+            self.index[(code, character)] = (int(offset), int(length))
+            self.keys.append((code, character))
+        self.vocabulary = str(self.map[vocabulary_position:], 'utf-8').split('\n')[:-1]
+        self.token_ids = None
+        self.array = self.get_array()
+
+    def get_array(self):
+        '''Returns the whole token array as a NumPy int32 array which views the
+        mapped file, or a memoryview of int32s if NumPy is not installed.'''
+        try:
+            import numpy
+        except ImportError:
+            view = memoryview(self.map)[HEADER.size:HEADER.size + 4 * self.count]
+            if struct.pack('=i', 1) == struct.pack('<i', 1):
+                return view.cast('i')
+            ids = array.array('i', bytes(view))
+            ids.byteswap()
+            return memoryview(ids)
+        return numpy.frombuffer(self.map, dtype='<i4', count=self.count, offset=HEADER.size)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def get(self, code, character):
+        '''Returns the token ids of the given character, as a view of the
+        mapped file which is not copied.'''
+        offset, length = self.index[(code, character)]
+        return self.array[offset:offset + length]
+
+    def get_tokens(self, code, character):
+        '''Returns the list of tokens of the given character.'''
+        return [self.vocabulary[i] for i in self.get(code, character)]
+
+    def get_token_id(self, token):
+        '''Returns the id of the given token, or -1 if it is not in the
+        vocabulary.'''
+        if self.token_ids is None:
+            self.token_ids = {token: i for i, token in enumerate(self.vocabulary)}
+        return self.token_ids.get(token, -1)
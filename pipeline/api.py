@@ -0,0 +1,135 @@
+'''Importable interface to the stages of the pipeline.
+
+Each stage is a function which takes an iterable of Rows and returns an
+iterator of Rows, so that stages may be chained without subprocesses, text
+formatting, or parsing, and rows are processed one at a time as they are
+consumed:
+
+    import pipeline.api as api
+    rows = api.iter_extract(['data/plays_of_interest/A08360.xml'])
+    rows = api.iter_translate(api.iter_clean(rows))
+    for row in api.iter_phonemes(rows, unknowns=unknowns):
+        row.code, row.character, row.elements
+
+A Row is the namedtuple lib.rows.Row of a TCP code, a character's name, and
+the elements of the character's speech, which are xml, cleaned text, words,
+or phonemes, according to the stage which generated them.
+
+Errors are raised as exceptions rather than exiting: a PipelineError if a
+file cannot be parsed or a line cannot be cleaned, and an OSError if a file
+cannot be read. Dictionaries are loaded by load_translation() and
+load_phonemes(), which return the same compiled table each time they are
+called with the same arguments, so a long-running process loads each
+dictionary only once. Default dictionaries are found relative to this
+module, not the current directory.
+'''
+
+import os
+import threading
+import lib.rows as rows
+import lib.errors as errors
+import lib.sampling as sampling
+import pipeline.extract as extract
+import pipeline.clean as clean
+import pipeline.translate as translate
+import pipeline.phonemes as phonemes
+
+Row = rows.Row
+PipelineError = errors.PipelineError
+
+loaded = {}  # Maps the arguments of each loaded dictionary to the dictionary
+loaded_lock = threading.Lock()
+
+
+def load(key, load_function):
+    '''Returns the dictionary loaded by the given function, loading it only the
+    first time it is requested with the given key.'''
+    with loaded_lock:
+        if key not in loaded:
+            loaded[key] = load_function()
+        return loaded[key]
+
+
+def iter_extract(paths, directory='', speakers=(), patterns=(), texts=None, codes=None, sample=None):
+    '''Generates a Row for each character of each <text> tag of each of the
+    given xml files, in order, with the given directory prepended to each
+    path, as extract.py does. Only the Rows of the given speakers, of
+    speakers whose names match any of the given regular expressions, of the
+    given <text> numbers, and of the given TCP codes are generated, as by
+    extract.py -s, -r, -t, and -p, if any are given. If a sample is given, as
+    a tuple of the unit, fraction, and seed, only the sampled plays,
+    characters, or lines are generated, as by extract.py -a. Raises a
+    PipelineError if a file cannot be parsed.'''
+    speaker_filter = extract.get_speaker_filter(speakers, patterns)
+    if texts is not None:
+        texts = set(texts)
+    if codes is not None:
+        paths = extract.select_codes(paths, set(codes))
+    if sample is not None and sample[0] == 'play':
+        unit, fraction, seed = sample
+        paths = sampling.sample_plays(paths, fraction, str(seed), sampling.get_genres(paths))
+        sample = None
+    elif sample is not None:
+        sample = (sample[0], sample[1], str(sample[2]))
+    return extract.extract_files(paths, directory, True, speaker_filter, texts, sample)
+
+
+def iter_clean(in_rows, hyphenate=True):
+    '''Generates a Row of cleaned text for each of the given Rows of xml, as
+    clean.py does. Spaces in character names are replaced by hyphens unless
+    hyphenate is False. Raises a PipelineError if a line of xml cannot be
+    cleaned.'''
+    for row in in_rows:
+        yield clean.clean_row(row, hyphenate)
+
+
+def load_translation(dict_filename=None, separator=':', modernize=True):
+    '''Returns the translation table of the given dictionary file, or of the
+    standardizer dictionary if none is given, as translate.py loads it with
+    -d, -s, and (if modernize is False) -p. The table is loaded only once for
+    each set of arguments, and may be shared between threads.'''
+    if dict_filename is None:
+        dict_filename = translate.std_dict_path
+    dict_filename = os.path.abspath(dict_filename)
+    key = ('translate', dict_filename, separator, modernize)
+    return load(key, lambda: translate.get_translation_table(dict_filename, separator, modernize))
+
+
+def iter_translate(in_rows, dicts=None):
+    '''Generates a Row of words for each of the given Rows of cleaned text,
+    translated by each of the given translation tables in turn, as though by
+    piping translate.py into itself once for each table. Dicts may be a single
+    table, a list of tables, or None for the standardizer dictionary.'''
+    if dicts is None:
+        dicts = [load_translation()]
+    elif not isinstance(dicts, (list, tuple)):
+        dicts = [dicts]
+    for translation_dict in dicts:
+        in_rows = translate.translate_rows(in_rows, translation_dict)
+    return iter(in_rows)
+
+
+def load_phonemes(dict_filename=None, separator=','):
+    '''Returns the phoneme table of the given dictionary file, as phonemes.py
+    loads it with -d and -s, or of the cmudict if none is given, which
+    requires nltk and its cmudict corpus the first time it is compiled. The
+    table is loaded only once for each set of arguments, and may be shared
+    between threads.'''
+    if dict_filename is None:
+        return load(('cmudict',), phonemes.load_cmudict_table)
+    dict_filename = os.path.abspath(dict_filename)
+    key = ('phonemes', dict_filename, separator)
+    return load(key, lambda: phonemes.load_phoneme_table(dict_filename, separator))
+
+
+def iter_phonemes(in_rows, phoneme_dict=None, preserve_emphasis=False, unknowns=None):
+    '''Generates a Row of phonemes for each of the given Rows of words, using
+    the given phoneme table, or the cmudict if none is given, as phonemes.py
+    does. Stress markings are kept on vowels if preserve_emphasis is True.
+    Words which are not in the table are counted in the given unknowns
+    dictionary, if one is given, which is modified in place.'''
+    if phoneme_dict is None:
+        phoneme_dict = load_phonemes()
+    if unknowns is None:
+        unknowns = {}
+    return phonemes.get_phoneme_rows(in_rows, preserve_emphasis, phoneme_dict, unknowns)
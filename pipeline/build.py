@@ -0,0 +1,350 @@
+#!/usr/bin/python3
+
+import sys
+import getopt
+import os
+import shlex
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.cache as cache
+import lib.shards as shards
+import lib.compression as compression
+import lib.profiling as profiling
+import pipeline.stages as stages
+
+pipeline_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_stage_sources():
+    '''Returns a dictionary mapping stage names to the source files on which
+    the output of that stage depends, relative to the pipeline directory.
+    Every stage is built through stages.py, and its rows are parsed, formatted,
+    and cached through lib/rows.py and lib/frames.py. The separate and store
+    stages are left out, since they write files of their own, which a cached
+    build would not write again.'''
+    common = ['stages.py', '../lib/rows.py', '../lib/frames.py']
+    sources = {}
+    sources['extract'] = ['extract.py', '../lib/shards.py', '../lib/sampling.py', '../lib/compression.py'] + common
+    sources['clean'] = ['clean.py', '../lib/conversion_dict.py'] + common
+    sources['translate'] = ['translate.py', '../lib/table.py'] + common
+    sources['combine'] = ['combine_characters.py'] + common
+    sources['normalize'] = ['normalize.py', 'phonemes.py', '../lib/spelling.py', '../lib/table.py'] + common
+    sources['phonemes'] = ['phonemes.py', '../lib/table.py'] + common
+    return sources
+
+
+def get_stage_options():
+    '''Returns a dictionary mapping stage names to their getopt options.'''
+    options = {}
+    options['extract'] = ''
+    options['clean'] = ''
+    options['translate'] = 'pd:s:'
+    options['combine'] = 'd:s:'
+    options['normalize'] = 'e:d:s:'
+    options['phonemes'] = stages.PHONEMES_OPTIONS
+    return options
+
+
+def get_stage_fingerprint(spec_list):
+    '''Returns the fingerprint of the given stage, which changes whenever its
+    options, source files, or dictionaries change. The dictionaries are the
+    files given by -d and as arguments, or the standardizer dictionary if
+    translate is given none. The -u and -l options of phonemes only affect
+    the unknown word counts, which are combined after the cached stages.'''
+    optlist, args = getopt.getopt(spec_list[1:], get_stage_options()[spec_list[0]])
+    filenames = [pipeline_dir + '/' + source for source in get_stage_sources()[spec_list[0]]]
+    dict_filenames = [a for o, a in optlist if o == '-d'] + args
+    if spec_list[0] == 'translate' and len(dict_filenames) == 0:
+        import pipeline.translate as translate
+        dict_filenames.append(translate.std_dict_path)
+    options = [o + a for o, a in optlist if o not in ('-u', '-l')]
+    hashes = [cache.hash_file(filename) for filename in filenames + dict_filenames]
+    return cache.fingerprint(spec_list[0], *(options + ['--'] + args + ['--'] + hashes))
+
+
+def get_play_fingerprints(filename, stage_fingerprints):
+    '''Returns the fingerprint of each stage's output for the given xml file,
+    each of which depends on the contents of the file and on the fingerprints
+    of that stage and every stage before it.'''
+    fingerprint = cache.hash_file(filename)
+    play_fingerprints = []
+    for stage_fingerprint in stage_fingerprints:
+        fingerprint = cache.fingerprint(fingerprint, stage_fingerprint)
+        play_fingerprints.append(fingerprint)
+    return play_fingerprints
+
+
+def get_artifact_filename(cache_dir, code, index, name, fingerprint):
+    '''Returns the filename of the cached framed output of the given stage
+    for the play with the given TCP code.'''
+    return '{}/{}/{}-{}.{}.ctpf'.format(cache_dir, code, index, name, fingerprint)
+
+
+def build_play(filename, stage_specs, play_fingerprints, play_stages, cache_dir, rebuilt):
+    '''Brings the cached output of every stage for the given xml file up to
+    date, starting from the output of the last stage which is already cached,
+    and building the stage functions in the given play_stages dictionary only
+    when first needed. Counts each stage which was rebuilt in the rebuilt
+    list. Returns the list of filenames of the output of each stage.'''
+    code = shards.get_code(filename)
+    names = [spec_list[0] for spec_list in stage_specs]
+    artifacts = [get_artifact_filename(cache_dir, code, i, names[i], play_fingerprints[i]) for i in range(len(names))]
+    start = len(names)
+    while start > 0 and not os.path.exists(artifacts[start - 1]):
+        start -= 1
+    splitter = '\t'
+    in_rows = []
+    if start > 0:
+        with open(artifacts[start - 1], 'rb') as infile:
+            splitter, in_rows = frames.read_rows(infile)
+            in_rows = list(in_rows)
+    import pipeline.extract as extract
+    for i in range(start, len(names)):
+        with profiling.phase(names[i]):
+            unknowns_dict = None
+            if i == 0:
+                in_rows = list(extract.extract_files([filename]))
+            else:
+                if i not in play_stages:
+                    play_stages[i] = stages.build_play_stage(stage_specs[i])
+                in_rows, splitter, unknowns_dict = play_stages[i](in_rows, splitter)
+        with cache.atomic_open(artifacts[i]) as outfile:
+            frames.write_frames(outfile, in_rows, splitter)
+        if unknowns_dict is not None:
+            write_unknowns(get_unknowns_filename(artifacts[i]), unknowns_dict)
+        rebuilt[i] += 1
+    return artifacts
+
+
+def read_artifact(filename):
+    '''Generates the Rows of the given cached stage output.'''
+    with open(filename, 'rb') as infile:
+        splitter, in_rows = frames.read_rows(infile)
+        yield from in_rows
+
+
+def read_first_row(filename):
+    '''Returns a tuple of the separator and the first Row (or None) of the
+    given cached stage output.'''
+    with open(filename, 'rb') as infile:
+        splitter, in_rows = frames.read_rows(infile)
+        return (splitter, next(in_rows, None))
+
+
+def get_unknowns_filename(segment):
+    '''Returns the filename of the unknown word counts which accompany the
+    given framed segment.'''
+    return segment[:-len('.ctpf')] + '.unknowns'
+
+
+def write_unknowns(unknowns_filename, unknowns_dict):
+    '''Atomically writes the unknown word counts of a single play, in order
+    of their first occurrence, so that ties sort as they would in run.py.'''
+    unknowns = ''.join('{}\t{}\n'.format(word, count) for word, count in unknowns_dict.items())
+    cache.atomic_write(unknowns_filename, unknowns)
+
+
+def read_unknowns(unknowns_filename, unknowns_dict):
+    '''Adds the unknown word counts of a single play from the given file to
+    the given unknowns dictionary.'''
+    with open(unknowns_filename, 'r') as unknowns_file:
+        for line in unknowns_file:
+            line = line.strip()
+            if line:
+                word, count = line.split('\t')
+                unknowns_dict[word] = unknowns_dict.get(word, 0) + int(count)
+
+
+def remove_unused(cache_dir, used):
+    '''Removes every cached file which is not among the given used filenames,
+    along with any empty play directories. Returns the number removed.'''
+    removed = 0
+    for code in os.listdir(cache_dir):
+        play_dir = cache_dir + '/' + code
+        for filename in os.listdir(play_dir):
+            path = play_dir + '/' + filename
+            if path.replace('.unknowns', '.ctpf') not in used:
+                os.remove(path)
+                removed += 1
+        if len(os.listdir(play_dir)) == 0:
+            os.rmdir(play_dir)
+    return removed
+
+
+def assemble(stage_specs, segments, unknowns_filenames, outfile, framed=False):
+    '''Writes the rows of each of the given framed segments, each of which is
+    the output of the given stages for one play, to the output file, in the
+    same order and form as run.py would write them. If the stages include
+    phonemes, the unknown word counts of each play are read from the given
+    unknowns files and combined, and written as phonemes.py would write them.'''
+    names = [spec_list[0] for spec_list in stage_specs]
+    splitter = '\t'
+    first_rows = []
+    for segment in segments:
+        splitter, first_row = read_first_row(segment)
+        first_rows.append(first_row)
+    order = list(range(len(segments)))
+    if 'combine' in names:  # combine sorts all rows, and the rows of each play sort together
+        order = [i for i in order if first_rows[i] is not None]
+        order.sort(key=lambda i: rows.format_row(first_rows[i], splitter))
+    out_rows = (row for i in order for row in read_artifact(segments[i]))
+    frames.write_rows(outfile, out_rows, splitter, framed)
+
+    if 'phonemes' in names:
+        index = names.index('phonemes')
+        optlist, args = getopt.getopt(stage_specs[index][1:], stages.PHONEMES_OPTIONS)
+        preserve_emphasis, unknowns_filename, unknowns_dict, dict_filename, separator = stages.read_phonemes_options(optlist)
+        if 'combine' not in names[:index]:
+            order = range(len(segments))
+        for i in order:
+            read_unknowns(unknowns_filenames[i], unknowns_dict)
+        stages.report_unknowns(unknowns_filename, unknowns_dict)
+
+
+def build(stage_specs, filenames, cache_dir, outfile, framed=False, collect=False):
+    '''Runs the given stages over each of the given xml files, reusing the
+    cached output of every stage whose inputs are unchanged, and writes the
+    output of the final stage for every file to the output file, in the same
+    order and form as run.py would. If collect is True, removes every cached
+    file not used by this build. Returns a list of the number of plays for
+    which each stage was rebuilt.'''
+    stage_specs = [['extract']] + [shlex.split(spec) for spec in stage_specs]
+    sources = get_stage_sources()
+    for spec_list in stage_specs[1:]:
+        if len(spec_list) > 0 and spec_list[0] in ('separate', 'store'):
+            raise getopt.GetoptError('{} stage writes files which a cached build would not write again; run it with run.py over the output'.format(spec_list[0]))
+        if len(spec_list) == 0 or spec_list[0] not in sources or spec_list[0] == 'extract':
+            raise getopt.GetoptError('unknown stage: {}'.format(' '.join(spec_list)))
+    with profiling.phase('load'):
+        stage_fingerprints = [get_stage_fingerprint(spec_list) for spec_list in stage_specs]
+    play_stages = {}
+    rebuilt = [0] * len(stage_specs)
+    artifacts = []
+    for filename in filenames:
+        with profiling.phase('load'):
+            play_fingerprints = get_play_fingerprints(filename, stage_fingerprints)
+        artifacts.append(build_play(filename, stage_specs, play_fingerprints, play_stages, cache_dir, rebuilt))
+
+    unknowns_filenames = None
+    if 'phonemes' in [spec_list[0] for spec_list in stage_specs]:
+        index = [spec_list[0] for spec_list in stage_specs].index('phonemes')
+        unknowns_filenames = [get_unknowns_filename(play_artifacts[index]) for play_artifacts in artifacts]
+    assemble(stage_specs, [play_artifacts[-1] for play_artifacts in artifacts], unknowns_filenames, outfile, framed)
+    if collect:
+        remove_unused(cache_dir, set(filename for play_artifacts in artifacts for filename in play_artifacts))
+    return rebuilt
+
+
+def parse_build(arg_list):
+    '''Parses command-line arguments and runs the core build() function
+    accordingly. Writes the output to stdout unless an output file is specified
+    using the -o flag, and the number of plays rebuilt by each stage to stderr.'''
+    optlist, args = getopt.getopt(arg_list, 'hbgs:d:c:o:')
+    outfile = sys.stdout
+    stage_specs = []
+    in_directory = ''
+    cache_dir = 'build_cache'
+    framed = False
+    collect = False
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - incrementally build the output of the pipeline over a corpus
+
+    Usage:
+        python3 {0} [OPTION]... FILE...
+
+    Extracts the character speech of each xml file and runs the selected
+    stages over it, as run.py does, but caches the output of every stage for
+    every play. Each cached output is keyed by a fingerprint of everything it
+    depends on: the contents of the xml file, the options of that stage and
+    of every stage before it, the dictionaries they use (including the default
+    standardizer dictionary and lib/conversion_dict.py), and the source of the
+    stages and of the lib modules they use. When the build is run again, only
+    the plays and stages whose inputs have changed are rebuilt, so that
+    changing one play or one dictionary rebuilds only what depends on it. For
+    example, after changing
+    ../dicts/additional_dict.txt,
+        python3 {0} -s clean -s translate -s 'translate -p -d ../dicts/additional_dict.txt' ../data/plays_of_interest/*
+    reruns only the final stage, reusing the cached output of the others.
+
+    The output is assembled from the cached output of the final stage for each
+    play, and is identical to the output of run.py with an extract stage
+    followed by the same stages, including the unknown word counts of a
+    phonemes stage.
+
+
+    -h              Display this help message.
+
+    -s stage        Add a stage to run after extracting each xml file. The
+                        stage is given by its name, optionally followed by the
+                        options of its script, quoted as a single argument.
+                        Stages are:
+                            clean
+                            translate   [-p] [-d dictfile] [-s separator]
+                            combine     [-s separator] dictfile [dictfile]...
+                            normalize   [-e distance] [-d dictfile]
+                                        [-s separator]
+                            phonemes    [-e] [-d dictfile] [-s separator]
+                                        [-u filename] [-l filename]
+                        The separate and store stages of run.py are not
+                        supported, since they write files of their own, which
+                        a cached build would not write again. Run them with
+                        run.py over the output instead.
+                        Ex:
+                            $ python3 {0} -s clean -b A08360.xml | \\
+                              python3 run.py -s 'separate -d ready_for_ml'
+
+    -d directory    Specify the directory containing the xml files.
+
+    -c directory    Specify the directory in which to cache the output of each
+                        stage for each play. The default is build_cache
+
+    -g              Remove every cached file which was not used by this build,
+                        such as the outputs of previous versions of plays and
+                        dictionaries.
+
+    -o filename     Specify an output file to which to write output, rather
+                        than writing to stdout.
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-s':
+            stage_specs.append(a)
+        if o == '-d':
+            in_directory = a.rstrip('/') + '/'
+        if o == '-c':
+            cache_dir = a.rstrip('/')
+        if o == '-g':
+            collect = True
+        if o == '-o':
+            outfile = compression.open_file(a, 'w', encoding='utf-8')
+        if o == '-b':
+            framed = True
+    filenames = [in_directory + filename for filename in args]
+    try:
+        rebuilt = build(stage_specs, filenames, cache_dir, outfile, framed, collect)
+    except getopt.GetoptError as err:
+        print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+        exit(1)
+    names = ['extract'] + [shlex.split(spec)[0] for spec in stage_specs]
+    for name, count in zip(names, rebuilt):
+        print('{}: rebuilt {} of {} plays'.format(name, count, len(filenames)), file=sys.stderr)
+    if outfile != sys.stdout:
+        outfile.close()
+
+
+def main():
+    if len(sys.argv) == 1:
+        sys.argv.append('-h')
+    profiling.run(parse_build, sys.argv[1:], 'build')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,11 @@ import codecs
 import xml.etree.ElementTree as ET
 sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
 import lib.conversion_dict as conversion_dict
+import lib.rows as rows
+import lib.frames as frames
+import lib.errors as errors
+import lib.compression as compression
+import lib.profiling as profiling
 
 
 def get_ns_tag(tag):
@@ -128,9 +133,7 @@ def fill_gaps(text):
         l = ET.fromstring(text)
         extent = fill_first_gap(l)
         if extent == None:
-            print('ERROR: Can\'t find gap tag in <l>.', file=sys.stderr)
-            print(ET.tostring(l, encoding='unicode'), file=sys.stderr)
-            exit(1)
+            raise errors.PipelineError('Can\'t find gap tag in <l>.\n' + ET.tostring(l, encoding='unicode'))
         text = ET.tostring(l, encoding='unicode')
         text = text.replace('\n', ' ')
         text = text.replace('\t', ' ')
@@ -162,7 +165,8 @@ def clean_xml(text):
     their corresponding values, then removing the tags in the xml ignore list
     (leaving their inner text in place), and then fully deleting all xml tags
     and their contents in the xml delete list. Returns the cleaned text, which
-    should now be plaintext unicode with no xml formatting.'''
+    should now be plaintext unicode with no xml formatting. Raises a
+    PipelineError if the text cannot be parsed or fully cleaned.'''
 
     xml_dict = get_xml_dictionary()
     for key in xml_dict:
@@ -173,11 +177,8 @@ def clean_xml(text):
 
     try:
         l = ET.fromstring(text)
-    except ET.ParseError:
-        print('\n\n', file=sys.stderr)
-        print('ERROR: Failed to parse text:', file=sys.stderr)
-        print(text, file=sys.stderr)
-        exit()
+    except ET.ParseError as err:
+        raise errors.PipelineError('Failed to parse text:\n' + text) from err
     for tag_del in get_xml_delete():
         remove_tags(l, get_ns_tag(tag_del))
     text = ET.tostring(l, encoding='unicode')
@@ -193,20 +194,41 @@ def clean_xml(text):
     text = ignore_tags(text, ['l', 'p'])
 
     if '<' in text or '>' in text:
-        print('ERROR: Text not fully cleaned of xml.', file=sys.stderr)
-        print(text, file=sys.stderr)
-        exit(1)
+        raise errors.PipelineError('Text not fully cleaned of xml.\n' + text)
     return text    
 
 
-def clean_unicode(text):
+conversion_table = None
+
+
+def get_conversion_dict():
+    '''Returns the dictionary from lib/conversion_dict.py, which is built only
+    once per process rather than once for each line cleaned.'''
+    global conversion_table
+    if conversion_table is None:
+        conversion_table = conversion_dict.getConversionDict()
+    return conversion_table
+
+
+def load_conversion_dict():
+    '''Returns the dictionary from lib/conversion_dict.py as it is now on disk,
+    reloading the module, for a process such as daemon.py which runs long
+    enough for the file to change.'''
+    import importlib
+    importlib.reload(conversion_dict)
+    return conversion_dict.getConversionDict()
+
+
+def clean_unicode(text, conv_dict=None):
     '''Cleans the given text by converting unicode characters to ASCII according
-    to the dictionary in lib/conversion_dict.py. Returns the cleaned text, which
+    to the given conversion dictionary, or the dictionary in
+    lib/conversion_dict.py if it is None. Returns the cleaned text, which
     should be ASCII-conpatible characters. Inspired by the clean_word() function
     from characterCleaner.py, part of the VEP pipeline, which can be found here:
         https://github.com/uwgraphics/VEP-pipeline
     '''
-    conv_dict = conversion_dict.getConversionDict()
+    if conv_dict is None:
+        conv_dict = get_conversion_dict()
     for char in text:
         try:
             codecs.encode(char, 'ascii', errors='strict')
@@ -228,6 +250,31 @@ def clean_punctuation(text):
     return text
 
 
+def clean_row(row, hyphenate=True, conv_dict=None):
+    '''Cleans a single Row of xml text by resolving xml tags and special
+    characters, and then replacing all non-ASCII characters with their ASCII
+    equivalents. If hyphenate is True, spaces in the character's name are
+    replaced by hyphens so that the name remains a single word. This is not
+    necessary for framed output, which is unambiguous. Non-ASCII characters are
+    converted by the given conversion dictionary, as for clean_unicode().
+    Returns a Row whose
+    elements are the cleaned, space-separated words of each of the original
+    xml elements.'''
+    cleaned = []
+    for line in row.elements:
+        text = clean_xml(line)
+        text = clean_unicode(text, conv_dict)
+        text = clean_punctuation(text)
+        text = text.lower().strip()
+        while '  ' in text:
+            text = text.replace('  ', ' ')
+        cleaned.append(text)
+    character = row.character
+    if hyphenate:
+        character = character.replace(' ', '-')
+    return rows.Row(row.code, character, cleaned)
+
+
 def clean(in_string):
     '''Cleans a tsv string by first resolving xml tags and special characters,
     and then replacing all non-ASCII characters with their ASCII equivalents
@@ -237,32 +284,18 @@ def clean(in_string):
     has words separated by spaces. The first word is the TCP code, the second
     word is the character, and all remaining words are the character's cleaned
     speech.'''
-    out_list = []
-    for row in in_string.strip().split('\n'):
-        lines = row.split('\t')
-        assert(len(lines) >= 2)
-        TCPcode = lines[0]
-        character = lines[1].replace(' ', '-')
-        row_list = [TCPcode, character]
-        for line in lines[2:]:
-            text = clean_xml(line)
-            text = clean_unicode(text)
-            text = clean_punctuation(text)
-            text = text.lower().strip()
-            while '  ' in text:
-                text = text.replace('  ', ' ')
-            row_list.append(text)
-        out_list.append(' '.join(row_list))
-    return '\n'.join(out_list) + '\n'
+    cleaned_rows = (clean_row(row) for row in rows.parse_rows(in_string.strip(), '\t'))
+    return rows.format_rows(cleaned_rows, ' ')
 
 
 def parse_clean(arg_list):
     '''Parses command-line arguments and runs the core clean() function
     accordingly. Writes the output to stdout unless an output file is specified
     using the -o flag.'''
-    optlist, args = getopt.getopt(arg_list, 'hi:o:')
+    optlist, args = getopt.getopt(arg_list, 'hbi:o:')
     infile = sys.stdin
     outfile = sys.stdout
+    framed = False
     for o, a in optlist:
         if o == '-h':
             print('''
@@ -296,15 +329,25 @@ Usage information for {0}
 
     -o filename     Specify an output file to which to write output, rather
                         than writing to stdout.
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
 '''.format(sys.argv[0]))
             exit(0)
         if o == '-i':
-            infile = open(a, 'r', encoding='utf-8')
+            infile = compression.open_file(a, 'r', encoding='utf-8')
         if o == '-o':
-            outfile = open(a, 'w')  # No need for utf-8 encoding after cleaning
-    in_string = infile.read()
-    out_string = clean(in_string)
-    outfile.write(out_string)
+            outfile = compression.open_file(a, 'w')  # No need for utf-8 encoding after cleaning
+        if o == '-b':
+            framed = True
+    splitter, in_rows = frames.read_rows(infile)
+    cleaned_rows = (clean_row(row, hyphenate=not framed) for row in in_rows)
+    try:
+        frames.write_rows(outfile, profiling.timed(cleaned_rows, 'core'), ' ', framed)
+    except errors.PipelineError as err:
+        print('ERROR: {}'.format(err), file=sys.stderr)
+        exit(1)
     if infile != sys.stdin:
         infile.close()
     if outfile != sys.stdout:
@@ -312,7 +355,7 @@ Usage information for {0}
 
 
 def main():
-    parse_clean(sys.argv[1:])
+    profiling.run(parse_clean, sys.argv[1:], 'clean')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+import sys
+import getopt
+import os
+import json
+import socket
+import threading
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.protocol as protocol
+import lib.compression as compression
+import lib.profiling as profiling
+
+# The options of each stage's script, all but -h, -i, and -o of which are
+# passed to the daemon.
+STAGE_OPTIONS = {
+        'clean': 'hbi:o:',
+        'translate': 'hbpi:o:d:s:w:',
+        'phonemes': 'hbei:o:u:l:d:s:w:',
+        }
+
+
+def send_input(sock, infile, block_size=1 << 16):
+    '''Sends everything in the given binary file on the given socket, then
+    shuts down the sending side of the socket.'''
+    try:
+        for block in iter(lambda: infile.read(block_size), b''):
+            sock.sendall(block)
+        sock.shutdown(socket.SHUT_WR)
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # The daemon has stopped reading, and will report why
+
+
+def run_remote(sock, stage, arg_list, infile, outfile):
+    '''Runs the given stage with the given options on the daemon connected to
+    the given socket, sending it the given binary input file while writing its
+    output to the given binary output file and its messages to stderr. Returns
+    the stage's exit status.'''
+    request = {'stage': stage, 'args': arg_list, 'cwd': os.getcwd()}
+    sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+    sender = threading.Thread(target=send_input, args=(sock, infile), daemon=True)
+    sender.start()
+    replies = sock.makefile('rb')
+    while True:
+        stream, data = protocol.read_chunk(replies)
+        if stream == protocol.OUTPUT:
+            outfile.write(data)
+        elif stream == protocol.ERRORS:
+            sys.stderr.flush()
+            sys.stderr.buffer.write(data)
+            sys.stderr.buffer.flush()
+        elif stream == protocol.STATUS:
+            return int(data)
+        else:
+            print('ERROR: {}: the daemon stopped before the job was complete'.format(sys.argv[0]), file=sys.stderr)
+            return 1
+
+
+def run_local(stage, arg_list):
+    '''Runs the given stage's script in this process with the given arguments,
+    as though it had been run directly.'''
+    import importlib
+    sys.argv = [stage + '.py'] + arg_list
+    module = importlib.import_module('pipeline.' + stage)
+    module.main()
+
+
+def parse_client(arg_list):
+    '''Parses command-line arguments and runs the given stage on the daemon
+    accordingly, or runs the stage's script itself if no daemon is listening.'''
+    optlist, args = getopt.getopt(arg_list, 'hs:')
+    socket_path = protocol.get_socket_path()
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - runs clean, translate, or phonemes jobs on the pipeline daemon
+
+    Usage:
+        python3 {0} [-s socket] STAGE [OPTION]...
+
+    Runs the given stage, which is clean, translate, or phonemes, with the
+    given options, which are exactly those of clean.py, translate.py, or
+    phonemes.py, on the daemon started by daemon.py. Reads and writes exactly
+    what the stage's script would, so that {0} STAGE can be used in place of
+    the script, but without loading any dictionaries:
+        $ python3 extract.py A08360.xml | python3 {0} clean | \\
+          python3 {0} translate -d ../dicts/additional_dict.txt
+
+    If no daemon is listening, runs the stage's script itself instead. Files
+    given by the options of the stage are opened by the daemon, relative to
+    the current directory, except those given by -i and -o.
+
+
+    -h              Display this help message. For the options of a stage,
+                        use {0} STAGE -h.
+
+    -s socket       Specify the socket of the daemon. Defaults to the
+                        CTP_SOCKET environment variable if it is set, or else
+                        /tmp/ctp-UID.sock for the current user's id.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-s':
+            socket_path = a
+    if len(args) == 0 or args[0] not in STAGE_OPTIONS:
+        print('ERROR: {}: a stage must be given: {}'.format(sys.argv[0], ', '.join(STAGE_OPTIONS)), file=sys.stderr)
+        exit(1)
+    stage = args[0]
+    try:
+        stage_optlist, stage_args = getopt.getopt(args[1:], STAGE_OPTIONS[stage])
+    except getopt.GetoptError as err:
+        print('ERROR: {}: {}: {}'.format(sys.argv[0], stage, err), file=sys.stderr)
+        exit(1)
+    infile = sys.stdin.buffer
+    outfile = sys.stdout.buffer
+    remote_args = []
+    for o, a in stage_optlist:
+        if o == '-h':
+            run_local(stage, args[1:])
+        elif o == '-i':
+            infile = compression.open_file(a, 'rb')
+        elif o == '-o':
+            outfile = compression.open_file(a, 'wb')
+        elif o[1] + ':' in STAGE_OPTIONS[stage]:
+            remote_args += [o, a]
+        else:
+            remote_args.append(o)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        if infile != sys.stdin.buffer:
+            infile.close()
+        if outfile != sys.stdout.buffer:
+            outfile.close()
+        run_local(stage, args[1:])
+        return
+    status = run_remote(sock, stage, remote_args, infile, outfile)
+    sock.close()
+    if infile != sys.stdin.buffer:
+        infile.close()
+    if outfile != sys.stdout.buffer:
+        outfile.close()
+    if status != 0:
+        exit(status)
+
+
+def main():
+    profiling.run(parse_client, sys.argv[1:], 'client')
+
+
+if __name__ == '__main__':
+    main()
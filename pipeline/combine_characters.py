@@ -2,6 +2,11 @@
 
 import sys
 import getopt
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.compression as compression
+import lib.profiling as profiling
 
 
 def get_character_dictionary(dict_filename, separator='\t'):
@@ -23,42 +28,49 @@ def get_character_dictionary(dict_filename, separator='\t'):
     return character_dict
 
 
-def combine_characters(in_string, dict_filename, separator='\t'):
-    '''Translates raw or abbreviated character names into their complete names,
-    concatenating the speech for all abbreviations which map to the same name
-    into one character. Note that this does not preserve the original ordering
-    of speech for any given character. Any characters which are in the
-    dictionary will be converted, and any which are not in the dictionary will
-    be left unchanged.'''
-    character_dict = get_character_dict(dict_filename, separator)
+def combine_rows(in_rows, character_dict, splitter='\t'):
+    '''Translates the character names of the given Rows using the character
+    dictionary, concatenating the speech of all Rows which map to the same
+    character. The splitter is the separator which will be used to format the
+    Rows, so if it is a space character, spaces in converted names are
+    replaced by hyphens. Returns a list of the combined Rows, sorted by their formatted
+    lines.'''
     speech_dict = {}
-    splitter = ' '
-    if '\t' in in_string:
-        splitter = '\t'
-    for row in in_string.strip().split('\n'):
-        words = row.split(splitter)
-        TCPcode, character = words[:2]
+    for row in in_rows:
+        TCPcode, character = row.code, row.character
         if (TCPcode, character) in character_dict:
             character = character_dict[(TCPcode, character)]
         if splitter == ' ':
             character = character.replace(' ', '-')
         if (TCPcode, character) not in speech_dict:
             speech_dict[(TCPcode, character)] = []
-        speech_dict[(TCPcode, character)].append(words[2:])
-    out_list = []
-    for key in speech_dict:
-        out_list.append(splitter.join(list(key) + speech_dict[key]))
-    return '\n'.join(sorted(out_list)) + '\n'
+        speech_dict[(TCPcode, character)] += row.elements
+    combined = [rows.Row(key[0], key[1], speech_dict[key]) for key in speech_dict]
+    return sorted(combined, key=lambda row: rows.format_row(row, splitter))
+
+
+def combine_characters(in_string, dict_filename, separator='\t'):
+    '''Translates raw or abbreviated character names into their complete names,
+    concatenating the speech for all abbreviations which map to the same name
+    into one character. Note that this does not preserve the original ordering
+    of speech for any given character. Any characters which are in the
+    dictionary will be converted, and any which are not in the dictionary will
+    be left unchanged.'''
+    character_dict = get_character_dictionary(dict_filename, separator)
+    splitter = rows.get_separator(in_string)
+    combined = combine_rows(rows.parse_rows(in_string.strip(), splitter), character_dict, splitter)
+    return rows.format_rows(combined, splitter)
 
 
 def parse_combine_characters(arg_list):
     '''Parses command-line arguments and runs the core combine_characters()
     function accordingly. Writes the output to stdout unless an output file
     is specified using the -o flag.'''
-    optlist, args = getopt.getopt(arg_list, 'hi:o:d:s:')
+    optlist, args = getopt.getopt(arg_list, 'hbi:o:d:s:')
     infile = sys.stdin
     outfile = sys.stdout
     separator = '\t'
+    framed = False
     for o, a in optlist:
         if o == '-h':
             print('''
@@ -116,25 +128,33 @@ Usage information for {0}
                         script into another instance of this script with a
                         different separator flag and the corresponding
                         dictionaries.
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
 '''.format(sys.argv[0]))
             exit(0)
         if o == '-i':
-            infile = open(a, 'r')
+            infile = compression.open_file(a, 'r')
         if o == '-o':
-            outfile = open(a, 'w')
+            outfile = compression.open_file(a, 'w')
         if o == '-d':
             args.append(a)
         if o == '-s':
             separator = a
-    string = infile.read()
+        if o == '-b':
+            framed = True
     if len(args) == 0:
         print('ERROR: {}: Please specify one or more dictionary files as arguments.'.format(sys.argv[0]), file=sys.stderr)
         print('    For usage information, run: python3 {} -h'.format(sys.argv[0]), file=sys.stderr)
         exit(1)
-    string = translate(string, dict_filename, separator, modernize)
+    splitter, in_rows = frames.read_rows(infile)
     for dict_filename in args:
-        string = combine_characters(string, dict_filename, separator)
-    outfile.write(string)
+        with profiling.phase('load'):
+            character_dict = get_character_dictionary(dict_filename, separator)
+        with profiling.phase('core'):
+            in_rows = combine_rows(in_rows, character_dict, splitter)
+    frames.write_rows(outfile, in_rows, splitter, framed)
     if infile != sys.stdin:
         infile.close()
     if outfile != sys.stdout:
@@ -142,7 +162,7 @@ Usage information for {0}
 
 
 def main():
-    parse_combine_characters(sys.argv[1:])
+    profiling.run(parse_combine_characters, sys.argv[1:], 'combine_characters')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+
+import sys
+import getopt
+import os
+import json
+import shlex
+import signal
+import socket
+import threading
+import socketserver
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import pipeline.clean as clean
+import pipeline.translate as translate
+import pipeline.phonemes as phonemes
+import pipeline.stages as stages
+import lib.frames as frames
+import lib.cache as cache
+import lib.compression as compression
+import lib.protocol as protocol
+import lib.profiling as profiling
+
+dictionaries = {}  # Maps each dictionary's key to its generation, file stamps, and contents
+dictionaries_lock = threading.Lock()
+generation = 0  # Incremented to reload every dictionary
+
+
+def get_file_stamp(filename):
+    '''Returns the modification time and size of the given file, or None if it
+    does not exist.'''
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def load_dictionary(key, filenames, load):
+    '''Returns the dictionary with the given key, calling the load function to
+    load it if it has not been loaded, if any of the given files from which it
+    is loaded has changed since it was loaded, or if every dictionary has been
+    reloaded since. Jobs which are already running keep the dictionary with
+    which they began.'''
+    stamps = [get_file_stamp(filename) for filename in filenames]
+    with dictionaries_lock:
+        if key in dictionaries and dictionaries[key][:2] == (generation, stamps):
+            return dictionaries[key][2]
+        if key in dictionaries:
+            print('Reloading {}'.format(' '.join(str(part) for part in key)), file=sys.stderr)
+        for filename in filenames:
+            cache.file_hashes.pop(os.path.abspath(filename), None)
+        dictionary = load()
+        dictionaries[key] = (generation, stamps, dictionary)
+        return dictionary
+
+
+def reload_dictionaries(signum=None, frame=None):
+    '''Causes every dictionary to be reloaded when it is next used.'''
+    global generation
+    generation += 1
+    print('Dictionaries will be reloaded', file=sys.stderr)
+
+
+def load_job(stage, arg_list, cwd):
+    '''Parses the options of the given stage, as they would be given to its
+    script, other than -h, -i, and -o, resolving filenames against the given
+    directory, and loads the dictionaries they require. Returns a tuple of
+    whether the output is framed, the variant file given by -w, or None, and a
+    function which takes a generator of the input Rows and a text file for
+    messages, and returns a generator of the output Rows, or, if there is a
+    variant file, of tuples of the output Row and the variant Row.'''
+    if stage == 'clean':
+        optlist, args = getopt.getopt(arg_list, 'b')
+        framed = len(optlist) > 0
+        conv_dict = load_dictionary(('clean',), [clean.conversion_dict.__file__], clean.load_conversion_dict)
+
+        def job(in_rows, errors):
+            return (clean.clean_row(row, not framed, conv_dict) for row in in_rows)
+        return (framed, None, job)
+    if stage == 'translate':
+        optlist, args = getopt.getopt(arg_list, 'bpd:s:w:')
+        framed = False
+        dict_filename = translate.std_dict_path
+        separator = ':'
+        modernize = True
+        variant_filename = None
+        for o, a in optlist:
+            if o == '-b':
+                framed = True
+            if o == '-p':
+                modernize = False
+            if o == '-d':
+                dict_filename = os.path.join(cwd, a)
+            if o == '-s':
+                separator = a
+            if o == '-w':
+                variant_filename = os.path.join(cwd, a)
+        # The translation written to the output, followed by the other one
+        variants = [modernize] if variant_filename is None else [modernize, not modernize]
+        translation_dicts = []
+        for variant in variants:
+            key = ('translate', dict_filename, separator, variant)
+            translation_dicts.append(load_dictionary(key, [dict_filename], lambda variant=variant: translate.get_translation_table(dict_filename, separator, variant)))
+
+        def job(in_rows, errors):
+            if variant_filename is not None:
+                return translate.translate_variants(in_rows, translation_dicts)
+            return translate.translate_rows(in_rows, translation_dicts[0])
+        return (framed, variant_filename, job)
+    if stage == 'phonemes':
+        optlist, args = getopt.getopt(arg_list, 'bw:' + stages.PHONEMES_OPTIONS)
+        framed = False
+        variant_filename = None
+        for o, a in optlist:
+            if o == '-b':
+                framed = True
+            if o == '-w':
+                variant_filename = os.path.join(cwd, a)
+        preserve_emphasis, unknowns_filename, unknowns_dict, dict_filename, separator = stages.read_phonemes_options(optlist, cwd)
+        if dict_filename != '':
+            key = ('phonemes', dict_filename, separator)
+            phoneme_dict = load_dictionary(key, [dict_filename], lambda: stages.load_phoneme_dict(dict_filename, separator))
+        else:
+            cmudict_filenames = [filename for filename in [phonemes.get_cmudict_filename()] if filename is not None]
+            phoneme_dict = load_dictionary(('cmudict',), cmudict_filenames, phonemes.load_cmudict_table)
+
+        def job(in_rows, errors):
+            if variant_filename is None:
+                yield from phonemes.get_phoneme_rows(in_rows, preserve_emphasis, phoneme_dict, unknowns_dict)
+            elif preserve_emphasis:
+                yield from phonemes.get_phoneme_variants(in_rows, phoneme_dict, unknowns_dict)
+            else:
+                yield from (variants[::-1] for variants in phonemes.get_phoneme_variants(in_rows, phoneme_dict, unknowns_dict))
+            stages.report_unknowns(unknowns_filename, unknowns_dict, errors)
+        return (framed, variant_filename, job)
+    raise getopt.GetoptError('unknown stage: {}'.format(stage))
+
+
+def run_job(request, infile, sock):
+    '''Runs the job described by the given request, reading its input from the
+    given binary file and sending its output, messages, and exit status on the
+    given socket, as chunks of their streams.'''
+    output = protocol.open_stream(sock, protocol.OUTPUT)
+    errors = protocol.open_stream(sock, protocol.ERRORS)
+    status = 0
+    try:
+        try:
+            framed, variant_filename, job = load_job(request['stage'], request['args'], request['cwd'])
+            splitter, in_rows = frames.read_rows(infile)
+            if variant_filename is None:
+                frames.write_rows(output, job(in_rows, errors), ' ', framed)
+            else:
+                with compression.open_file(variant_filename, 'w') as variant_file:
+                    frames.write_variants([output, variant_file], job(in_rows, errors), ' ', framed)
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except SystemExit as err:
+            status = err.code if isinstance(err.code, int) else 1
+        except Exception as err:
+            errors.write('ERROR: {}: {}\n'.format(request['stage'], err))
+            status = 1
+        output.flush()
+        errors.flush()
+        protocol.send_chunk(sock, protocol.STATUS, str(status).encode('ascii'))
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # The client has gone away, so the rest of its output is not needed
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    '''Handles a single client's job on its own thread.'''
+
+    def handle(self):
+        line = self.rfile.readline()
+        if line:
+            run_job(json.loads(line), self.rfile, self.connection)
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def remove_stale_socket(socket_path):
+    '''Removes the given socket if no daemon is listening on it. Raises
+    FileExistsError if a daemon is.'''
+    if not os.path.exists(socket_path):
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        os.remove(socket_path)
+        return
+    finally:
+        sock.close()
+    raise FileExistsError('a daemon is already listening on {}'.format(socket_path))
+
+
+def serve(socket_path, warm_specs=[]):
+    '''Loads the dictionaries of each of the given stage specifications, and
+    runs jobs sent to the given socket until interrupted or terminated.
+    SIGHUP causes every dictionary to be reloaded when it is next used.'''
+    for spec in warm_specs:
+        spec_list = shlex.split(spec)
+        load_job(spec_list[0], spec_list[1:], os.getcwd())
+    remove_stale_socket(socket_path)
+    umask = os.umask(0o077)  # Only the current user may connect
+    try:
+        server = DaemonServer(socket_path, JobHandler)
+    finally:
+        os.umask(umask)
+    signal.signal(signal.SIGHUP, reload_dictionaries)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print('Listening on {}'.format(socket_path), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+def parse_daemon(arg_list):
+    '''Parses command-line arguments and runs the core serve() function
+    accordingly.'''
+    optlist, args = getopt.getopt(arg_list, 'hs:w:')
+    socket_path = protocol.get_socket_path()
+    warm_specs = []
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - keeps the pipeline's dictionaries loaded to run jobs from clients
+
+    Usage:
+        python3 {0} [OPTION]...
+
+    Listens on a Unix domain socket for clean, translate, and phonemes jobs
+    from client.py, which takes exactly the options of clean.py, translate.py,
+    and phonemes.py, and can be used in place of them:
+        $ python3 {0} &
+        $ python3 extract.py A08360.xml | python3 client.py clean | \\
+          python3 client.py translate | python3 client.py phonemes
+
+    Each dictionary is loaded the first time a job needs it, and is kept for
+    every later job, so jobs spend no time loading dictionaries. If a
+    dictionary file changes on disk, including lib/conversion_dict.py and the
+    cmudict corpus, the dictionary is reloaded by the next job which needs it,
+    while running jobs finish with the dictionary they began with. Sending the
+    daemon SIGHUP reloads every dictionary in the same way.
+
+    Any number of clients may run jobs at once, each on its own thread. Each
+    job streams its rows in and out, so it needs no more memory than the
+    script itself. Rows are read as text or framed input, and written as text
+    or framed output if -b is given, exactly as by the scripts.
+
+    Runs until interrupted or sent SIGTERM, then removes the socket.
+
+
+    -h              Display this help message.
+
+    -s socket       Specify the socket on which to listen. Defaults to the
+                        CTP_SOCKET environment variable if it is set, or else
+                        /tmp/ctp-UID.sock for the current user's id.
+
+    -w stage        Load the dictionaries of the given stage, given with its
+                        options as a single argument, before listening, so that
+                        even the first job does not wait for them. May be
+                        given more than once.
+                        Ex:
+                            $ python3 {0} -w translate \\
+                              -w 'phonemes -d ../dicts/bench_phoneme_dict.txt'
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-s':
+            socket_path = a
+        if o == '-w':
+            warm_specs.append(a)
+    try:
+        serve(socket_path, warm_specs)
+    except (getopt.GetoptError, FileExistsError) as err:
+        print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+        exit(1)
+
+
+def main():
+    profiling.run(parse_daemon, sys.argv[1:], 'daemon')
+
+
+if __name__ == '__main__':
+    main()
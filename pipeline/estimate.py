@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+
+import sys
+import csv
+import math
+import getopt
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import pipeline.phonemes as phonemes
+import lib.rows as rows
+import lib.frames as frames
+import lib.sampling as sampling
+import lib.compression as compression
+import lib.profiling as profiling
+
+COLUMNS = ['statistic', 'genre', 'estimate', 'standard_error', 'lower', 'upper']
+Z = 1.96  # For 95% confidence intervals
+
+
+def count_clusters(in_rows, unit, phoneme_dict):
+    '''Returns a dictionary from each sampled cluster of the given Rows of
+    words, which is a play if plays were sampled and a character otherwise,
+    to a list of its count of words and its count of words which are not in
+    the phoneme dictionary, as phonemes.py counts them.'''
+    clusters = {}
+    for row in in_rows:
+        key = (row.code, row.character)
+        if unit == 'play':
+            key = row.code.split('-')[0]
+        if key not in clusters:
+            clusters[key] = [0, 0]
+        counts = clusters[key]
+        for word in rows.iter_words(row):
+            counts[0] += 1
+            if word.lower() not in phoneme_dict:
+                counts[1] += 1
+    return clusters
+
+
+def get_strata(clusters, genres):
+    '''Returns a dictionary from each genre to the list of the counts of its
+    clusters, where genres maps each TCP code to its genre.'''
+    strata = {}
+    for key, counts in clusters.items():
+        if isinstance(key, tuple):
+            key = key[0].split('-')[0]
+        strata.setdefault(genres.get(key), []).append(counts)
+    return strata
+
+
+def get_variance(values):
+    '''Returns the sample variance of the given values, or 0 if there are
+    fewer than two.'''
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+
+
+def estimate_total(strata, weight, fpc):
+    '''Returns a tuple of the estimated total and its variance of the values
+    of the given strata, each a list of the values of its sampled clusters,
+    where each cluster was sampled with probability 1 / weight and fpc is the
+    finite population correction.'''
+    total = 0.0
+    variance = 0.0
+    for values in strata:
+        total += weight * sum(values)
+        variance += weight * weight * fpc * len(values) * get_variance(values)
+    return (total, variance)
+
+
+def estimate_ratio(y_strata, x_strata, weight, fpc):
+    '''Returns a tuple of the estimated ratio of the totals of y and of x,
+    given as by estimate_total(), and its variance, by linearization.'''
+    y_total = estimate_total(y_strata, weight, fpc)[0]
+    x_total = estimate_total(x_strata, weight, fpc)[0]
+    if x_total == 0:
+        return (0.0, 0.0)
+    ratio = y_total / x_total
+    d_strata = [[y - ratio * x for y, x in zip(y_values, x_values)] for y_values, x_values in zip(y_strata, x_strata)]
+    d_variance = estimate_total(d_strata, weight, fpc)[1]
+    return (ratio, d_variance / (x_total * x_total))
+
+
+def get_estimates(clusters, genres, unit, fraction):
+    '''Generates a tuple of the name, the genre, the estimate, and the
+    standard error of each statistic of the whole corpus, over all genres and
+    within each genre, from the counts of the given clusters of a sample of
+    the given unit and fraction, stratified by genre.
+
+    Plays and characters are sampled whole, so the errors are those of a
+    stratified sample of clusters with the finite population correction. When
+    lines are sampled, every character is in the sample, but the errors are
+    still estimated between characters, without the correction, which
+    overstates them.'''
+    weight = 1 / fraction
+    fpc = 1 - fraction
+    cluster_name = 'play' if unit == 'play' else 'character'
+    if unit == 'line':
+        fpc = 1.0
+    strata = get_strata(clusters, genres)
+    domains = [('all', list(strata.values()))]
+    domains += [(str(genre), [strata[genre]]) for genre in sorted(strata, key=str)]
+    for genre, domain in domains:
+        tokens = [[counts[0] for counts in stratum] for stratum in domain]
+        unknowns = [[counts[1] for counts in stratum] for stratum in domain]
+        ones = [[1] * len(stratum) for stratum in domain]
+        sampled = sum(len(stratum) for stratum in domain)
+        yield ('sampled_{}s'.format(cluster_name), genre, sampled, 0.0)
+        total, variance = estimate_total(tokens, weight, fpc)
+        yield ('tokens', genre, total, math.sqrt(variance))
+        if unit == 'line':
+            per_unit, variance = (total / sampled, variance / (sampled * sampled))
+        else:
+            per_unit, variance = estimate_ratio(tokens, ones, weight, fpc)
+        yield ('tokens_per_{}'.format(cluster_name), genre, per_unit, math.sqrt(variance))
+        total, variance = estimate_total(unknowns, weight, fpc)
+        yield ('unknown_tokens', genre, total, math.sqrt(variance))
+        rate, variance = estimate_ratio(unknowns, tokens, weight, fpc)
+        yield ('unknown_rate', genre, rate, math.sqrt(variance))
+
+
+def write_estimates(outfile, estimates):
+    '''Writes the given estimates to the given file as csv, with the bounds of
+    the 95% confidence interval of each.'''
+    writer = csv.writer(outfile)
+    writer.writerow(COLUMNS)
+    for name, genre, estimate, error in estimates:
+        values = [estimate, error, estimate - Z * error, estimate + Z * error]
+        writer.writerow([name, genre] + ['{:.6g}'.format(value) for value in values])
+
+
+def parse_estimate(arg_list):
+    '''Parses command-line arguments and runs the core get_estimates()
+    function accordingly. Writes the csv to stdout unless an output file is
+    specified using the -o flag.'''
+    optlist, args = getopt.getopt(arg_list, 'ha:i:o:d:s:m:')
+    infile = sys.stdin
+    outfile = sys.stdout
+    unit = 'character'
+    fraction = 1.0
+    dict_filename = ''
+    separator = ','
+    metadata_filename = None
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - estimates token and unknown word statistics of the corpus from a sample
+
+    Usage:
+        python3 {0} -a sample [OPTION]...
+
+    Reads one character's words per line of stdin, as written by translate.py,
+    from a sample extracted by extract.py -a. Thus, stdin is of the form:
+        TCPcode character word [word]...\\n
+
+    Writes a csv file of estimates, for the whole corpus from which the sample
+    was taken, of the total count of word tokens, the count of tokens per play
+    or character, the count of tokens which are not in the phoneme dictionary,
+    and the rate of such unknown words, over all genres and within each genre
+    of the VEP metadata, with the standard error and 95% confidence interval
+    of each:
+        statistic,genre,estimate,standard_error,lower,upper
+        $ python3 run.py -s 'extract -d ../data/plays_of_interest \\
+          -c ../data/VEP_metadata.csv -a play:0.1:42' -s clean \\
+          -s translate | python3 {0} -a play:0.1
+
+    The sample is taken to be stratified by genre, and the errors are those of
+    a stratified sample of plays or characters. extract.py -a stratifies
+    plays by genre, and characters more finely, within each <text>, which
+    these errors somewhat overstate.
+    When lines are sampled, every character is in the sample, and the errors
+    are estimated between characters, which overstates them. When few plays
+    are sampled from a genre, a play much longer than the rest is usually
+    missed, which understates them.
+
+
+    -h              Display this help message.
+
+    -a sample       Specify the sample from which the input was extracted, as
+                        given to extract.py -a, as UNIT:FRACTION[:SEED]. The
+                        seed is ignored. Without -a, the input is taken to be
+                        the whole corpus, so every standard error is 0.
+
+    -i filename     Specify an input file from which to read rows, rather
+                        than reading from stdin.
+
+    -o filename     Specify an output file to which to write the csv, rather
+                        than writing to stdout.
+
+    -d dictfile     Specify the phoneme dictionary by which words are known,
+                        as given to phonemes.py -d, rather than the cmudict.
+
+    -s separator    Specify the separator of the phoneme dictionary, as given
+                        to phonemes.py -s.
+
+    -m filename     Specify the VEP metadata csv file from which to read the
+                        genre of each play, rather than data/VEP_metadata.csv.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-a':
+            try:
+                unit, fraction, seed = sampling.parse_sample(a)
+            except getopt.GetoptError as err:
+                print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+                exit(1)
+        if o == '-i':
+            infile = compression.open_file(a, 'r')
+        if o == '-o':
+            outfile = compression.open_file(a, 'w', newline='')
+        if o == '-d':
+            dict_filename = a
+        if o == '-s':
+            separator = a
+            if separator == '\\t' or separator == '\\\\t':
+                separator = '\t'
+        if o == '-m':
+            metadata_filename = a
+    with profiling.phase('load'):
+        if dict_filename != '':
+            phoneme_dict = phonemes.load_phoneme_table(dict_filename, separator)
+        else:
+            phoneme_dict = phonemes.load_cmudict_table()
+    splitter, in_rows = frames.read_rows(infile)
+    with profiling.phase('core'):
+        clusters = count_clusters(in_rows, unit, phoneme_dict)
+        codes = set(key[0] if isinstance(key, tuple) else key for key in clusters)
+        genres = sampling.get_genres([code.split('-')[0] for code in codes], metadata_filename)
+        estimates = list(get_estimates(clusters, genres, unit, fraction))
+    write_estimates(outfile, estimates)
+    if infile != sys.stdin:
+        infile.close()
+    if outfile != sys.stdout:
+        outfile.close()
+
+
+def main():
+    profiling.run(parse_estimate, sys.argv[1:], 'estimate')
+
+
+if __name__ == '__main__':
+    main()
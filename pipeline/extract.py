@@ -1,8 +1,16 @@
 #!/usr/bin/python3
 
 import sys
+import re
 import getopt
 import xml.etree.ElementTree as ET
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.shards as shards
+import lib.errors as errors
+import lib.compression as compression
+import lib.profiling as profiling
 
 
 def get_child_lps(root):
@@ -19,21 +27,107 @@ def get_child_lps(root):
     return lps
 
 
-def extract(filename):
-    '''Returns a tsv string where each row is separated by a newline \\n. The
-    first element of each row is the TCP code followed by a hyphen and the
-    number of the <text> tag in which the character speech was found, the second
-    element of the row is the character name, and the remaining elements are the
-    raw xml <l>...</l> elements, with newline characters within the xml replaced
-    by ' ' in order to allow the tsv formatting.'''
+def get_speaker(sp, url):
+    '''Returns the name of the speaker of the given <sp> element, or an empty
+    string if it has none.'''
+    speaker = ''
+    for s in sp.iter(url + 'speaker'):  # should only loop once
+        speaker = (speaker + ' '.join([text for text in s.itertext()])).replace('\n', ' ').strip()
+    while '  ' in speaker:
+        speaker = speaker.replace('  ', ' ')
+    return speaker
+
+
+def get_speaker_filter(names=(), patterns=()):
+    '''Returns a function which returns True if a speaker's name is one of the
+    given names, or contains a match for one of the given regular expressions,
+    or None if no names or expressions are given.'''
+    if not names and not patterns:
+        return None
+    names = set(names)
+    expressions = [re.compile(pattern) for pattern in patterns]
+
+    def speaker_filter(speaker):
+        return speaker in names or any(expression.search(speaker) for expression in expressions)
+    return speaker_filter
+
+
+def parse_filtered(filename, speaker_filter=None, texts=None):
+    '''Parses the given xml file or binary file object as ET.parse() does,
+    except that each <sp> element whose speaker does not satisfy the speaker
+    filter is removed as soon as it has been parsed, and each <text> element
+    containing no inner <text> element whose number is not in the given set of
+    texts is emptied as soon as it has been parsed, so that none of their
+    contents are kept or serialized. Returns the root element.'''
+    root = None
+    url = ''
+    stack = []
+    count = 0
+    for event, element in ET.iterparse(filename, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+                url = root.tag[:root.tag.find('}') + 1]
+            stack.append(element)
+            continue
+        stack.pop()
+        if element.tag == url + 'sp' and speaker_filter is not None and stack:
+            if not speaker_filter(get_speaker(element, url)):
+                stack[-1].remove(element)
+        elif element.tag == url + 'text' and texts is not None:
+            if not any(sub_text is not element for sub_text in element.iter(url + 'text')):
+                count += 1
+                if count not in texts:
+                    element.clear()
+    return root
+
+
+def parse_root(filename, strict=False, speaker_filter=None, texts=None):
+    '''Parses the given xml file, which may be compressed, discarding the
+    speech of speakers and texts not selected by the given speaker filter and
+    set of <text> numbers, as parse_filtered() does, if either is given.
+    Returns the root element. If the file cannot be read or parsed, raises a
+    PipelineError if strict is True, or else prints an error and returns
+    None.'''
     try:
-        root = ET.parse(filename).getroot()
-    except ET.ParseError:
+        with profiling.phase('parse'), compression.open_file(filename, 'rb') as xml_file:
+            if speaker_filter is None and texts is None:
+                return ET.parse(xml_file).getroot()
+            return parse_filtered(xml_file, speaker_filter, texts)
+    except ET.ParseError as err:
+        if strict:
+            raise errors.PipelineError('File {} could not be parsed: {}'.format(filename, err)) from err
         print('ERROR: File {} could not be parsed.'.format(filename), file=sys.stderr)
-        return ''
+        return None
+    except OSError as err:
+        if strict:
+            raise errors.PipelineError('File {} could not be read: {}'.format(filename, err)) from err
+        print('ERROR: File {} could not be read: {}'.format(filename, err.strerror), file=sys.stderr)
+        return None
+
+
+def extract_rows(filename, strict=False, speaker_filter=None, texts=None):
+    '''Generates a Row for each character of each <text> tag in the given xml
+    file, as get_rows() does. If the file cannot be parsed, raises a
+    PipelineError if strict is True, or else prints an error and generates no
+    Rows. If a speaker filter (as given by get_speaker_filter()) or a set of
+    <text> numbers is given, only the Rows of those speakers and texts are
+    generated, exactly as they would be otherwise, and the speech of any
+    others is discarded while parsing.'''
+    root = parse_root(filename, strict, speaker_filter, texts)
+    if root is not None:
+        yield from get_rows(root, filename)
+
+
+def get_rows(root, filename):
+    '''Generates a Row for each character of each <text> tag under the given
+    root element of the given xml file. The code of each Row is the TCP code
+    followed by a hyphen and the number of the <text> tag in which the
+    character speech was found, and the elements are the raw xml <l>...</l>
+    elements, with newline characters and tabs within the xml replaced by ' '
+    in order to allow the tsv formatting.'''
     root_tag = root.tag
     url = root_tag[:root_tag.find('}') + 1]
-    tsv_list = []
     count = 0
     for text in root.iter(url + 'text'):  # Each "play of interest" has at least one <text> tag
         has_inner_text = False
@@ -47,12 +141,7 @@ def extract(filename):
             count += 1
             parts = {}
             for sp in text.iter(url + 'sp'):
-                speaker_iter = sp.iter(url + 'speaker')
-                speaker = ''
-                for s in speaker_iter:  # should only loop once
-                    speaker = (speaker + ' '.join([text for text in s.itertext()])).replace('\n', ' ').strip()
-                while '  ' in speaker:
-                    speaker = speaker.replace('  ', ' ')
+                speaker = get_speaker(sp, url)
                 if speaker == '':
                     print('WARNING: {}\n    No speaker for <sp> tag with elements:'.format(filename), file=sys.stderr)
                     print(ET.tostring(sp, encoding='unicode'), file=sys.stderr)
@@ -73,28 +162,176 @@ def extract(filename):
                     if text:
                         parts[speaker].append(text)
             for speaker in sorted(parts):
-                filename_id = filename.split('/')[-1]
-                row = [filename_id.replace('.xml', '') + '-' + str(count), speaker] + parts[speaker]
-                tsv_list.append('\t'.join(row))
-    return '\n'.join(tsv_list) + '\n'
+                yield rows.Row(shards.get_code(filename) + '-' + str(count), speaker, parts[speaker])
+
+
+def extract(filename):
+    '''Returns a tsv string where each row is separated by a newline \\n. The
+    first element of each row is the TCP code followed by a hyphen and the
+    number of the <text> tag in which the character speech was found, the second
+    element of the row is the character name, and the remaining elements are the
+    raw xml <l>...</l> elements, with newline characters within the xml replaced
+    by ' ' in order to allow the tsv formatting.'''
+    return rows.format_rows(extract_rows(filename), '\t')
+
+
+def extract_files(filenames, in_directory='', strict=False, speaker_filter=None, texts=None, sample=None):
+    '''Generates the Rows for each of the given xml files in order, prepending
+    the input directory to each filename. Warns if a file contains no <sp>
+    tags, unless it is filtered or sampled. If strict is True, raises a
+    PipelineError if a file cannot be read or parsed. Rows are filtered by
+    speaker and <text> number as by extract_rows(), and the characters or
+    lines of each file are sampled by the given sample, a tuple of the unit,
+    fraction, and seed, if one is given (see lib/sampling.py).'''
+    for filename in filenames:
+        filename = in_directory + filename
+        found = False
+        file_rows = extract_rows(filename, strict, speaker_filter, texts)
+        if sample is not None:
+            import lib.sampling as sampling
+            file_rows = sampling.sample_rows(file_rows, *sample)
+        for row in file_rows:
+            found = True
+            yield row
+        if not found and speaker_filter is None and texts is None and sample is None:
+            print('WARNING: No <sp> tags found in the entirety of file {}'.format(filename), file=sys.stderr)
+
+
+def find_play(code, in_directory=''):
+    '''Returns the filename of the xml file of the given TCP code in the given
+    directory, which may be compressed, as A00011.xml.gz, or None if there is
+    no such file.'''
+    import os
+    for extension in ('',) + compression.EXTENSIONS:
+        filename = code + '.xml' + extension
+        if os.path.exists(in_directory + filename):
+            return filename
+    return None
+
+
+def get_in_directory(optlist):
+    '''Returns the input directory given by -d in the given list of options,
+    with a trailing slash, or an empty string.'''
+    in_directory = ''
+    for o, a in optlist:
+        if o == '-d':
+            in_directory = a.rstrip('/') + '/'
+    return in_directory
+
+
+def parse_csv(filename, column=0, in_directory=''):
+    '''Returns the xml filenames of the TCP codes in the given column of the
+    given csv file, such as the VEP metadata, skipping its header. The file of
+    each code in the given directory may be compressed, and if it has no file,
+    its uncompressed filename is returned, to be reported when it is read.'''
+    import lib.metadata as metadata
+    return [find_play(code, in_directory) or code + '.xml' for code in metadata.read_codes(filename, column)]
+
+
+def get_metadata_filename(optlist):
+    '''Returns the metadata csv file given by -m in the given list of options,
+    or data/VEP_metadata.csv.'''
+    import lib.metadata as metadata
+    metadata_filename = metadata.metadata_path
+    for o, a in optlist:
+        if o == '-m':
+            metadata_filename = a
+    return metadata_filename
 
 
-def parse_csv(filename, column=0):
+def select_metadata(optlist):
+    '''Returns the xml filenames of the TCP codes selected from the metadata
+    by the -q queries in the given list of options, any of which a play may
+    match, from the metadata csv file given by -m, or data/VEP_metadata.csv.
+    The file of each play, in the directory given by -d if any, may be
+    compressed, and plays which have no file are skipped with a warning.
+    Raises a getopt.GetoptError if a query is invalid.'''
+    import lib.metadata as metadata
+    queries = [a for o, a in optlist if o == '-q']
+    if not queries:
+        return []
+    in_directory = get_in_directory(optlist)
     filenames = []
-    with open(filename, newline='') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            filenames.append(row[column] + '.xml')
+    for filename in metadata.select_filenames(' or '.join(queries), get_metadata_filename(optlist)):
+        play_filename = find_play(shards.get_code(filename), in_directory)
+        if play_filename is not None:
+            filenames.append(play_filename)
+        else:
+            print('WARNING: File {} selected by -q does not exist, and is skipped.'.format(in_directory + filename), file=sys.stderr)
     return filenames
 
 
+def parse_filters(optlist):
+    '''Returns a tuple of the speaker filter, the set of <text> numbers, and
+    the set of TCP codes given by the -s, -r, -t, and -p options in the given
+    list, each of which is None if none of its options were given. Raises a
+    getopt.GetoptError if a text number or regular expression is invalid.'''
+    names = []
+    patterns = []
+    texts = None
+    codes = None
+    for o, a in optlist:
+        if o == '-s':
+            names.append(a)
+        if o == '-r':
+            patterns.append(a)
+        if o == '-t':
+            if not a.isdigit():
+                raise getopt.GetoptError('invalid text number: {}'.format(a))
+            texts = (texts or set()) | {int(a)}
+        if o == '-p':
+            codes = (codes or set()) | {a}
+    try:
+        speaker_filter = get_speaker_filter(names, patterns)
+    except re.error as err:
+        raise getopt.GetoptError('invalid regular expression: {}'.format(err))
+    return (speaker_filter, texts, codes)
+
+
+def select_codes(filenames, codes):
+    '''Returns the given filenames whose TCP codes are in the given set of
+    codes, or all of them if it is None.'''
+    if codes is None:
+        return filenames
+    return [filename for filename in filenames if shards.get_code(filename) in codes]
+
+
+def parse_selection(optlist, filenames):
+    '''Returns a tuple of the xml files to extract, which are the given
+    filenames followed by those given by -c and selected by -q in the given
+    list of options, as narrowed by -p and sampled by -a play, and of the
+    arguments of extract_files() which filter and sample their Rows, as given
+    by -s, -r, -t, and -a. Raises a getopt.GetoptError if an option is
+    invalid.'''
+    speaker_filter, texts, codes = parse_filters(optlist)
+    for o, a in optlist:
+        if o == '-c':
+            # Specify a csv file from which to read filenames.
+            # If -d flag is also used, then input directory will be
+            # prepended to each TCP code found in this csv file.
+            filenames = filenames + parse_csv(a, 0, get_in_directory(optlist))
+    filenames = select_codes(filenames + select_metadata(optlist), codes)
+    sample = None
+    for o, a in optlist:
+        if o == '-a':
+            import lib.sampling as sampling
+            sample = sampling.parse_sample(a)
+    if sample is not None and sample[0] == 'play':
+        unit, fraction, seed = sample
+        filenames = sampling.sample_plays(filenames, fraction, seed, sampling.get_genres(filenames, get_metadata_filename(optlist)))
+        sample = None
+    return (filenames, (speaker_filter, texts, sample))
+
+
 def parse_extract(arg_list):
     '''Parses command-line arguments and runs the core extract() function
     accordingly. Writes the output to stdout unless an output file is specified
     using the -o flag.'''
-    optlist, args = getopt.getopt(arg_list, 'hd:c:o:')
+    optlist, args = getopt.getopt(arg_list, 'hbd:c:o:n:s:r:t:p:q:m:a:')
     in_directory = ''
     outfile = sys.stdout
+    framed = False
+    shard = None
     for o, a in optlist:
         if o == '-h':
             print('''
@@ -127,9 +364,86 @@ Usage information for {0}
     -c filename     Specify a csv file containing a list of VEP TCP codes.
                         If -d is also used, then the input directory will be
                         prepended to each VEP code found in this csv file.
+                        Each code is extracted once, and codes listed in
+                        missing_files.txt alongside the csv file are skipped.
+                        The file of each code may be compressed, as
+                        A00011.xml.gz, .bz2, or .xz.
+
+    -q query        Extract the files of each play in the VEP metadata which
+                        matches the given query, in order of TCP code, after
+                        any given as arguments or by -c. Plays whose files are
+                        listed in missing_files.txt, alongside the metadata,
+                        are skipped, and the file of each play may be
+                        compressed, as it may for -c. A query is a list of comparisons of the
+                        fields code, author, title, genre, date (of writing),
+                        printed (the date of the text used), and tokens, by
+                        =, !=, <, <=, >, >=, or ~ (contains, ignoring case),
+                        joined by "and" and "or". A value containing spaces,
+                        "and", or "or" may be quoted, as in
+                        title~"Love and Honor". The metadata is read only the
+                        first time it is queried, and no xml file is opened
+                        until the files have been selected. If -d is also
+                        used, then the input directory will be prepended to
+                        each selected file. Plays whose files do not exist
+                        are skipped with a warning. May be given more than
+                        once.
+                        Ex:
+                            $ python3 {0} -d ../data/plays_of_interest \\
+                              -q "genre=CO and date<1600"
+
+    -m filename     Specify the VEP metadata csv file queried by -q and -a,
+                        rather than data/VEP_metadata.csv.
+
+    -a sample       Extract only a deterministic sample of the plays, of the
+                        characters, or of the lines of each character's speech,
+                        given as UNIT:FRACTION[:SEED], where UNIT is play,
+                        character, or line. Plays are sampled separately within
+                        each genre of the VEP metadata, characters within each
+                        <text>, and lines within each character's speech, so
+                        that each is sampled at the given fraction. Only
+                        plays are stratified by genre: characters and lines
+                        are stratified within each play, which lies within a
+                        single genre, rather than across the plays of a
+                        genre, so that each play is sampled on its own. The
+                        same seed, which defaults to 0, always gives the same
+                        sample. Plays are sampled before any file is opened,
+                        and before -n, so that shards divide the sample. See
+                        estimate.py for statistics of the sample with their
+                        standard errors.
+                        Ex:
+                            $ python3 {0} -d ../data/plays_of_interest \\
+                              -c ../data/VEP_metadata.csv -a play:0.1:42
 
     -o filename     Specify an output file to which to write output, rather
                         than writing to stdout. A tsv file is preferred.
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
+
+    -n K/N          Extract only the files of shard K of N, as given by a
+                        stable hash of their TCP codes, whether they are
+                        given as arguments or by -c. See run.py -n.
+
+    -s name         Extract only the speech of the character with the given
+                        name, exactly as it is written in the output. May be
+                        given more than once.
+
+    -r regex        Extract only the speech of characters whose names contain
+                        a match for the given regular expression. May be given
+                        more than once, and with -s.
+
+    -t N            Extract only the speech of the Nth <text> tag of each
+                        file, as numbered in the TCP codes of the output. May
+                        be given more than once.
+
+    -p code         Extract only the file with the given TCP code, whether it
+                        is given as an argument or by -c. May be given more
+                        than once.
+
+    The speech of other characters and texts is discarded as each file is
+    parsed, and the rows which are extracted are exactly those which would be
+    extracted without these options.
 '''.format(sys.argv[0]))
             exit(0)
         if o == '-d':
@@ -141,24 +455,22 @@ Usage information for {0}
             # please specify directory as part of path to filename,
             # and do not use this option.
             in_directory = a.rstrip('/') + '/'
-        if o == '-c':
-            # Specify a csv file from which to read filenames.
-            # If -d flag is also used, then input directory will be
-            # prepended to each TCP code found in this csv file.
-            args += parse_csv(a)
         if o == '-o':
             # Specify an output file instead of stdout.
-            outfile = open(a, 'w', encoding='utf-8')
-    file_string_list = []
-    for filename in args:
-        filename = in_directory + filename
-        file_string = extract(filename)
-        if file_string.strip():
-            file_string_list.append(extract(filename).strip())
-        else:
-            print('WARNING: No <sp> tags found in the entirety of file {}'.format(filename), file=sys.stderr)
-    tsv_string = '\n'.join(file_string_list) + '\n'
-    outfile.write(tsv_string)
+            outfile = compression.open_file(a, 'w', encoding='utf-8')
+        if o == '-b':
+            framed = True
+    try:
+        for o, a in optlist:
+            if o == '-n':
+                shard = shards.parse_shard(a)
+        args, filters = parse_selection(optlist, args)
+    except getopt.GetoptError as err:
+        print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+        exit(1)
+    if shard is not None:
+        args = shards.select(args, *shard)
+    frames.write_rows(outfile, profiling.timed(extract_files(args, in_directory, False, *filters), 'core'), '\t', framed)
     if outfile != sys.stdout:
         outfile.close()
 
@@ -166,9 +478,9 @@ Usage information for {0}
 def main():
     if len(sys.argv) == 1:
         print('Please include filename of xml file from which to extract text,', file=sys.stderr)
-        print('or include -c csvfile containing metadata with TCP codes.', file=sys.stderr)
+        print('or include -c csvfile containing metadata with TCP codes, or -q query.', file=sys.stderr)
         exit(1)
-    parse_extract(sys.argv[1:])
+    profiling.run(parse_extract, sys.argv[1:], 'extract')
 
 
 if __name__ == '__main__':
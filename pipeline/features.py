@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+
+import sys
+import csv
+import getopt
+import numpy
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.tokens as tokens
+import lib.compression as compression
+import lib.profiling as profiling
+
+TOTAL_COLUMN = '# Word Tokens'
+
+
+def load_metadata_words(filename):
+    '''Loads the words counted by the given VEP metadata csv file, whose word
+    count columns are named prefix:word, as in tcp_top_100:and, and end with a
+    prefix:# Word Tokens column of the total number of words. The text_name
+    column is not a word and is ignored. Returns a tuple of the prefix and the
+    list of words.'''
+    with open(filename, newline='', encoding='utf-8-sig') as csvfile:
+        header = next(csv.reader(csvfile))
+    prefix = None
+    words = []
+    for column in header:
+        if ':' not in column:
+            continue
+        column_prefix, word = column.split(':', 1)
+        if prefix is None:
+            prefix = column_prefix
+        if column_prefix == prefix and word not in ('text_name', TOTAL_COLUMN):
+            words.append(word)
+    return (prefix, words)
+
+
+def iter_row_ids(in_rows, intern):
+    '''Generates a tuple of the TCP code, character, and NumPy array of word
+    ids of each of the given Rows, where each word is given its id by the
+    intern function.'''
+    for row in in_rows:
+        ids = numpy.fromiter((intern(word) for word in rows.iter_words(row)), dtype=numpy.int64)
+        yield (row.code, row.character, ids)
+
+
+def iter_store_ids(store, columns=None):
+    '''Generates a tuple of the TCP code, character, and NumPy array of word
+    ids of each character in the given TokenStore. If columns is given, each
+    id is replaced by columns[id].'''
+    for code, character in store:
+        ids = numpy.asarray(store.get(code, character))
+        if columns is not None:
+            ids = columns[ids]
+        yield (code, character, ids)
+
+
+def count_words(keyed_ids, word_count):
+    '''Counts the words of each character given by keyed_ids, a generator as
+    returned by iter_row_ids(), in which the ids of the counted words are from
+    0 to word_count - 1 and every other word has the id word_count. Generates
+    a tuple of the TCP code, character, and NumPy array of the count of each
+    counted word followed by the total number of words, one character at a
+    time, so that only one character's words are held in memory.'''
+    for code, character, ids in keyed_ids:
+        counts = numpy.bincount(ids, minlength=word_count + 1)
+        counts[word_count] = len(ids)
+        yield (code, character, counts)
+
+
+def count_top_words(keyed_ids, top):
+    '''Counts the words of each character given by keyed_ids, a generator as
+    returned by iter_row_ids(), in which each distinct word has a distinct id.
+    Only the distinct ids of each character and their counts are kept until
+    every character is counted, and the given number of most frequent words
+    are found. Returns a tuple of the array of ids of the most frequent words,
+    in descending order of frequency (in ascending order of id if equally
+    frequent), and the list of tuples of the TCP code, character, and NumPy
+    array of the count of each of those words followed by the total number of
+    words, in order.'''
+    totals = numpy.zeros(0, dtype=numpy.int64)
+    characters = []
+    for code, character, ids in keyed_ids:
+        counts = numpy.bincount(ids)
+        if len(counts) > len(totals):
+            totals = numpy.concatenate([totals, numpy.zeros(max(len(counts), 2 * len(totals)) - len(totals), dtype=numpy.int64)])
+        totals[:len(counts)] += counts
+        distinct = numpy.flatnonzero(counts)
+        characters.append((code, character, distinct, counts[distinct], len(ids)))
+    top_ids = numpy.argsort(-totals, kind='stable')[:top]
+    top_ids = top_ids[totals[top_ids] > 0]
+    columns = numpy.full(len(totals), len(top_ids), dtype=numpy.int64)
+    columns[top_ids] = numpy.arange(len(top_ids))
+    counted = []
+    for code, character, distinct, counts, total in characters:
+        row_counts = numpy.zeros(len(top_ids) + 1, dtype=numpy.int64)
+        row_columns = columns[distinct]
+        found = row_columns < len(top_ids)
+        row_counts[row_columns[found]] = counts[found]
+        row_counts[len(top_ids)] = total
+        counted.append((code, character, row_counts))
+    return (top_ids, counted)
+
+
+def get_features(in_rows=None, store=None, words=None, top=100):
+    '''Counts the words of each character, read from the given Rows, as
+    written by translate.py, or from the given TokenStore. Counts the given
+    list of words, or if words is None, the given number of most frequent
+    words of all the characters. Returns a tuple of the list of counted words
+    and a generator of tuples of the TCP code, character, and NumPy array of
+    the count of each word followed by the total number of words.'''
+    if words is not None:
+        word_ids = {word: i for i, word in enumerate(words)}
+        if store is None:
+            keyed_ids = iter_row_ids(in_rows, lambda word: word_ids.get(word, len(words)))
+        else:
+            columns = numpy.array([word_ids.get(token, len(words)) for token in store.vocabulary], dtype=numpy.int64)
+            keyed_ids = iter_store_ids(store, columns)
+        return (words, count_words(keyed_ids, len(words)))
+    if store is None:
+        vocabulary = {}
+        keyed_ids = iter_row_ids(in_rows, lambda word: vocabulary.setdefault(word, len(vocabulary)))
+    else:
+        vocabulary = store.vocabulary
+        keyed_ids = iter_store_ids(store)
+    top_ids, counted = count_top_words(keyed_ids, top)
+    tokens = list(vocabulary)
+    return ([tokens[i] for i in top_ids], iter(counted))
+
+
+def write_features(outfile, words, counted, prefix, keep=False):
+    '''Writes the given word counts to the given file as csv, with a column for
+    the TCP code, the character, each word, and the total number of words, in
+    the style of the word count columns of VEP_metadata.csv. If keep is True,
+    returns the list of arrays of counts written, in order.'''
+    writer = csv.writer(outfile, quoting=csv.QUOTE_ALL)
+    writer.writerow(['TCP', 'character'] + ['{}:{}'.format(prefix, word) for word in words + [TOTAL_COLUMN]])
+    written = []
+    for code, character, counts in counted:
+        writer.writerow([code, character] + counts.tolist())
+        if keep:
+            written.append(counts)
+    return written
+
+
+def parse_features(arg_list):
+    '''Parses command-line arguments and runs the core get_features() function
+    accordingly. Writes the csv to stdout unless an output file is specified
+    using the -o flag.'''
+    optlist, args = getopt.getopt(arg_list, 'hi:o:k:m:s:n:')
+    infile = sys.stdin
+    outfile = sys.stdout
+    top = 100
+    words = None
+    prefix = None
+    store = None
+    matrix_filename = None
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - counts the most frequent words of each character
+
+    Usage:
+        python3 {0} [OPTION]...
+
+    Reads one character's words per line of stdin, as written by translate.py
+    (or clean.py). Thus, stdin is of the form:
+        TCPcode character word [word]...\\n
+
+    Writes a csv file with a row for each character, in order, of the number
+    of times the character speaks each of the most frequent words, followed by
+    the total number of words the character speaks, in the style of the
+    tcp_top_100 columns of data/VEP_metadata.csv:
+        "TCP","character","top_100:and",...,"top_100:# Word Tokens"
+
+    Words are counted by their integer ids with NumPy, in a single pass. If
+    the words to count are given with -m, only their counts are kept, so each
+    character is written as soon as it is read. Otherwise, the counts of the
+    distinct words of every character are kept until the most frequent words
+    of all the characters are known.
+
+
+    -h              Display this help message.
+
+    -i filename     Specify an input file from which to read rows, rather
+                        than reading from stdin.
+
+    -o filename     Specify an output file to which to write the csv, rather
+                        than writing to stdout.
+
+    -k number       Count the given number of most frequent words. Default 100.
+
+    -m filename     Count the words counted by the given metadata csv file,
+                        such as data/VEP_metadata.csv, rather than the most
+                        frequent words, and name the columns as it does.
+
+    -s filename     Read words from the given token store, as written by
+                        store.py, rather than from stdin or -i.
+
+    -n filename     Also write the counts as a NumPy .npy matrix of int64s to
+                        the given file, with a row for each row of the csv and
+                        a column for each column of the csv after the
+                        character.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-i':
+            infile = compression.open_file(a, 'r')
+        if o == '-o':
+            outfile = compression.open_file(a, 'w', newline='')
+        if o == '-k':
+            top = int(a)
+        if o == '-m':
+            prefix, words = load_metadata_words(a)
+        if o == '-s':
+            store = tokens.TokenStore(a)
+        if o == '-n':
+            matrix_filename = a
+    if prefix is None:
+        prefix = 'top_{}'.format(top)
+    in_rows = None
+    if store is None:
+        splitter, in_rows = frames.read_rows(infile)
+    words, counted = get_features(in_rows, store, words, top)
+    written = write_features(outfile, words, profiling.timed(counted, 'core'), prefix, matrix_filename is not None)
+    if matrix_filename is not None:
+        with profiling.phase('write'):
+            matrix = numpy.zeros((len(written), len(words) + 1), dtype=numpy.int64)
+            if written:
+                matrix = numpy.stack(written)
+            numpy.save(matrix_filename, matrix)
+    if infile != sys.stdin:
+        infile.close()
+    if outfile != sys.stdout:
+        outfile.close()
+
+
+def main():
+    profiling.run(parse_features, sys.argv[1:], 'features')
+
+
+if __name__ == '__main__':
+    main()
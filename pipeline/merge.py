@@ -3,6 +3,11 @@
 import sys
 import getopt
 import os
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.compression as compression
+import lib.profiling as profiling
 
 
 def check_tab(filenames):
@@ -46,6 +51,31 @@ def check_filenames(filenames, filename_separator='_', lstrip=0, rstrip=0):
     return rax
 
 
+def get_separator(filenames, separator=None):
+    '''Returns the given separator, or if it is None, returns a tab character
+    if a tab exists in any of the given files, else a space character.'''
+    if separator is None:
+        separator = ' '
+        if check_tab(filenames):
+            separator = '\t'
+    return separator
+
+
+def merge_rows(filenames, separator, filename_separator='_', lstrip=0, rstrip=0):
+    '''Generates a Row for each of the given filenames, where the code and
+    character are taken from the filename as described for merge(), and the
+    elements are the contents of the file split by the given separator.'''
+    for filename in filenames:
+        filename_str = '.'.join(filename.split('.')[:-1])  # Removes file extension, so assumes there is one, or that removing a trailing . is not harmful
+        filename_list = filename_str.split(filename_separator)[lstrip:]
+        if abs(rstrip) > 0:
+            filename_list = filename_list[:-abs(rstrip)]
+        TCPcode, speaker = filename_list
+        with open(filename, 'r') as infile:
+            text = infile.read()
+            yield rows.Row(TCPcode, speaker, text.strip().split(separator))
+
+
 def merge(filenames, separator=None, filename_separator='_', lstrip=0, rstrip=0):
     '''Merges the given filenames into a single string of the form expected by
     all the other scripts (besides extract) in the pipeline. The separation
@@ -68,20 +98,9 @@ def merge(filenames, separator=None, filename_separator='_', lstrip=0, rstrip=0)
         Ham Hamlet word [word]...\\n'''
     assert(check_filenames(filenames, filename_separator, lstrip, rstrip))
     out_list = []
-    if separator is None:
-        separator = ' '
-        if check_tab(filenames):
-            separator = '\t'
-    for filename in filenames:
-        filename_str = '.'.join(filename.split('.')[:-1])  # Removes file extension, so assumes there is one, or that removing a trailing . is not harmful
-        filename_list = filename_str.split(filename_separator)[lstrip:]
-        if abs(rstrip) > 0:
-            filename_list = filename_list[:-abs(rstrip)]
-        TCPcode, speaker = filename_list
-        with open(filename, 'r') as infile:
-            text = infile.read()
-            line_string = separator.join([TCPcode, speaker, text.strip()])
-            out_list.append(line_string)
+    separator = get_separator(filenames, separator)
+    for row in merge_rows(filenames, separator, filename_separator, lstrip, rstrip):
+        out_list.append(rows.format_row(row, separator))
     return '\n'.join(out_list)
 
 
@@ -89,13 +108,14 @@ def parse_merge(arg_list):
     '''Parses command-line arguments and runs the core merge() function
     accordingly. Writes the output to stdout unless an output file is specified
     using the -o flag.'''
-    optlist, args = getopt.getopt(arg_list, 'ho:s:t:l:r:')
+    optlist, args = getopt.getopt(arg_list, 'hbo:s:t:l:r:')
     in_directory = ''
     outfile = sys.stdout
     lstrip = 0
     rstrip = 0
     separator = None
     filename_separator = '_'
+    framed = False
     for o, a in optlist:
         if o == '-h':
             print('''
@@ -166,10 +186,14 @@ Usage information for {0}
                             python3 {0} -s : -t - -l 2 -r 1 orig-text-Ham-Hamlet-cleaned_ready.txt
                         produces
                             Ham:Hamlet:word[:word]...\\n
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
 '''.format(sys.argv[0]), file=sys.stderr)
             exit(0)
         if o == '-o':
-            outfile = open(a, 'w')
+            outfile = compression.open_file(a, 'w')
         if o == '-s':
             separator = a
         if o == '-t':
@@ -178,8 +202,16 @@ Usage information for {0}
             lstrip = int(a)
         if o == '-r':
             rstrip = int(a)
-    out_string = merge(args, separator, filename_separator, lstrip, rstrip)
-    outfile.write(out_string)
+        if o == '-b':
+            framed = True
+    if framed:
+        assert(check_filenames(args, filename_separator, lstrip, rstrip))
+        separator = get_separator(args, separator)
+        in_rows = profiling.timed(merge_rows(args, separator, filename_separator, lstrip, rstrip), 'core')
+        frames.write_rows(outfile, in_rows, separator, framed)
+    else:
+        out_string = merge(args, separator, filename_separator, lstrip, rstrip)
+        outfile.write(out_string)
     if outfile != sys.stdout:
         outfile.close()
 
@@ -187,7 +219,7 @@ Usage information for {0}
 def main():
     if len(sys.argv) == 1:
         sys.argv.append('-h')
-    parse_merge(sys.argv[1:])
+    profiling.run(parse_merge, sys.argv[1:], 'merge')
 
 
 if __name__ == '__main__':
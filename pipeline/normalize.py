@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+
+import sys
+import getopt
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import pipeline.phonemes as phonemes
+import lib.rows as rows
+import lib.frames as frames
+import lib.cache as cache
+import lib.spelling as spelling
+import lib.compression as compression
+import lib.profiling as profiling
+
+
+def load_spelling_index(dict_filename='', separator=',', max_distance=2):
+    '''Returns the phoneme table of the given dictionary file, as phonemes.py
+    loads it, or of the cmudict if none is given, and the spelling index of
+    its vocabulary with the given maximum edit distance.'''
+    if dict_filename != '':
+        phoneme_dict = phonemes.load_phoneme_table(dict_filename, separator)
+        fingerprint = cache.fingerprint(cache.hash_file(dict_filename), separator)
+    else:
+        phoneme_dict = phonemes.load_cmudict_table()
+        fingerprint = phonemes.get_cmudict_fingerprint()
+    return spelling.load_index(phoneme_dict, fingerprint, max_distance)
+
+
+def resolve(word, index, resolutions):
+    '''Returns the known word to which the given word, which is not in the
+    phoneme dictionary, is resolved, or None if it cannot be resolved. Each
+    word is looked up only once, and its resolution is recorded in the
+    resolutions dictionary, which is modified in place, as a tuple of the
+    edit distance and the closest known words.'''
+    if word not in resolutions:
+        if spelling.WORD.fullmatch(word):
+            resolutions[word] = spelling.lookup(index, word)
+        else:
+            resolutions[word] = (None, [])
+    distance, known = resolutions[word]
+    if len(known) == 1:
+        return known[0]
+    return None
+
+
+def normalize_rows(in_rows, index, resolutions):
+    '''Generates a Row for each of the given Rows of words, in which each word
+    which is not in the phoneme dictionary is replaced by the known word to
+    which it is resolved, if it can be resolved.'''
+    for row in in_rows:
+        row_list = []
+        for word in rows.iter_words(row):
+            lower = word.lower()
+            if lower not in index.vocabulary:
+                resolved = resolve(lower, index, resolutions)
+                if resolved is not None:
+                    word = resolved
+            row_list.append(word)
+        yield rows.Row(row.code, row.character, row_list)
+
+
+def format_resolutions(resolutions):
+    '''Returns the given resolutions as a dictionary file in the format of the
+    standardizer dictionary, ordered by edit distance and then by word. Each
+    resolution is written with the priority ?, as old:new:?, which
+    translate.py ignores, so that none of them is applied until a reviewer
+    changes its priority to 0. Words with more than one closest known word are
+    listed in comments.'''
+    lines = ['# Words not in the phoneme dictionary, resolved by normalize.py',
+             '# Suggestions only: change the priority ? to 0 to accept a resolution']
+    resolved = sorted((distance, word, known[0]) for word, (distance, known) in resolutions.items() if len(known) == 1)
+    ambiguous = sorted((distance, word, known) for word, (distance, known) in resolutions.items() if len(known) > 1)
+    last_distance = None
+    for distance, word, known in resolved:
+        if distance != last_distance:
+            if distance == 0:
+                lines.append('# Resolved by early modern spelling substitutions')
+            else:
+                lines.append('# Resolved within edit distance {}'.format(distance))
+            last_distance = distance
+        lines.append('{}:{}:?'.format(word, known))
+    if ambiguous:
+        lines.append('# Not resolved, because more than one known word is closest')
+    for distance, word, known in ambiguous:
+        lines.append('# {}: {}'.format(word, ' '.join(known)))
+    return '\n'.join(lines) + '\n'
+
+
+def parse_normalize(arg_list):
+    '''Parses command-line arguments and runs the core normalize_rows()
+    function accordingly. Writes the output to stdout unless an output file is
+    specified using the -o flag.'''
+    optlist, args = getopt.getopt(arg_list, 'hbi:o:d:s:e:w:')
+    infile = sys.stdin
+    outfile = sys.stdout
+    dict_filename = ''
+    separator = ','
+    max_distance = 2
+    resolutions_filename = None
+    framed = False
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - resolves unknown words to the closest words of the phoneme dictionary
+
+    Usage:
+        python3 {0} [OPTION]...
+
+    Reads one character's words per line of stdin, as written by translate.py,
+    and writes them to stdout in the same form, with each word which is not in
+    the phoneme dictionary replaced by the known word which it most closely
+    resembles, so that it may be inserted between translate.py and
+    phonemes.py:
+        TCPcode character word [word]...\\n
+
+    Words are compared by their skeletons, in which the substitutions of early
+    modern spelling are undone: vv becomes w, v becomes u, j becomes i, y
+    becomes i, ck becomes c, doubled letters become single letters, and final
+    e is dropped. Thus haue, iust, sonne, and citie resolve to have, just, son,
+    and city. A word whose skeleton is not known is resolved to the known word
+    with the closest skeleton within the maximum edit distance, counting
+    adjacent transpositions as single edits, or, if several are equally
+    close, to the one closest to the word itself. Words of fewer than 4
+    letters are resolved only by spelling substitutions, and words of fewer
+    than 7 letters only within distance 1. A word is left as it is if no known
+    word is close enough, or if several are equally close.
+
+    Close words are found through a symmetric delete index of the dictionary,
+    in a fixed number of lookups per word, and each word is resolved only once.
+    The index is compiled into dicts/compiled the first time each dictionary
+    and distance are used.
+
+
+    -h              Display this help message.
+
+    -i filename     Specify an input file from which to read rows, rather
+                        than reading from stdin.
+
+    -o filename     Specify an output file to which to write output, rather
+                        than writing to stdout.
+
+    -d dictfile     Specify the phoneme dictionary of known words, as given to
+                        phonemes.py -d, rather than the cmudict.
+
+    -s separator    Specify the separator of the phoneme dictionary, as given
+                        to phonemes.py -s.
+
+    -e distance     Specify the maximum edit distance between skeletons at
+                        which words are resolved (default is 2). Distance 0
+                        resolves words by spelling substitutions alone.
+
+    -w filename     Write each resolution to the given file, in the format of
+                        the standardizer dictionary, ordered by edit distance,
+                        with words which could not be resolved because several
+                        known words are equally close listed in comments.
+                        Resolutions are suggestions, written as old:new:?, and
+                        translate.py ignores the priority ?, since even
+                        resolutions by spelling substitutions may be wrong
+                        (goods is not gods). Change the priority of each
+                        accepted resolution to 0, and the file may then be
+                        given to translate.py -d, so that the words are
+                        translated before they reach phonemes.py.
+                        Ex:
+                            $ python3 translate.py -i clean.txt | \\
+                              python3 {0} -w resolutions.txt | \\
+                              python3 phonemes.py
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-i':
+            infile = compression.open_file(a, 'r')
+        if o == '-o':
+            outfile = compression.open_file(a, 'w')
+        if o == '-d':
+            dict_filename = a
+        if o == '-s':
+            separator = a
+            if separator == '\\t' or separator == '\\\\t':
+                separator = '\t'
+        if o == '-e':
+            if not a.isdigit():
+                print('ERROR: {}: edit distance must be a whole number: {}'.format(sys.argv[0], a), file=sys.stderr)
+                exit(1)
+            max_distance = int(a)
+        if o == '-w':
+            resolutions_filename = a
+        if o == '-b':
+            framed = True
+    with profiling.phase('load'):
+        index = load_spelling_index(dict_filename, separator, max_distance)
+    resolutions = {}
+    splitter, in_rows = frames.read_rows(infile)
+    frames.write_rows(outfile, profiling.timed(normalize_rows(in_rows, index, resolutions), 'core'), ' ', framed)
+    if resolutions_filename is not None:
+        with open(resolutions_filename, 'w') as resolutions_file:
+            resolutions_file.write(format_resolutions(resolutions))
+    if infile != sys.stdin:
+        infile.close()
+    if outfile != sys.stdout:
+        outfile.close()
+
+
+def main():
+    profiling.run(parse_normalize, sys.argv[1:], 'normalize')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,15 @@
 #!/usr/bin/python3
 
 import sys
+import os
 import getopt
-import nltk
-# nltk.download('cmudict')
-# OR
-# $ python3 -m nltk.downloader [-d /usr/share/nltk_data] cmudict
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.profiling as profiling
+import lib.cache as cache
+import lib.table as table
+import lib.compression as compression
 
 
 def load_phoneme_dict(dict_filename, separator=' '):
@@ -30,6 +34,82 @@ def load_phoneme_dict(dict_filename, separator=' '):
     return phoneme_dict
 
 
+def load_cmudict():
+    '''Loads the Carnegie Mellon University phoneme dictionary from
+    nltk.corpus.cmudict.dict(). nltk is imported here rather than when this
+    module is imported, so that phonemes can be found offline and without nltk
+    installed when a phoneme dictionary file is given. The cmudict corpus must
+    first be downloaded:
+        nltk.download('cmudict')
+    OR
+        $ python3 -m nltk.downloader [-d /usr/share/nltk_data] cmudict
+    Returns the dictionary.'''
+    import nltk
+    return nltk.corpus.cmudict.dict()
+
+
+def encode_pronunciations(pronunciations):
+    '''Encodes a list of pronunciations, each a list of phonemes, as a string
+    for a compiled table, using the ascii unit and record separators.'''
+    return '\x1e'.join('\x1f'.join(pronunciation) for pronunciation in pronunciations)
+
+
+def decode_pronunciations(value):
+    '''Decodes a list of pronunciations encoded by encode_pronunciations().'''
+    return [pronunciation.split('\x1f') for pronunciation in value.split('\x1e')]
+
+
+def load_phoneme_table(dict_filename, separator=' '):
+    '''Returns the phoneme dictionary of load_phoneme_dict() as a compiled
+    table, which is memory-mapped rather than loaded, and so is shared by
+    every process using the same dictionary.'''
+    fingerprint = cache.fingerprint(cache.hash_file(dict_filename), separator)
+    return table.load_table('phonemes', fingerprint, lambda: load_phoneme_dict(dict_filename, separator), encode_pronunciations, decode_pronunciations)
+
+
+def get_nltk_data_path():
+    '''Returns the directories in which nltk looks for its data by default,
+    in the same order as nltk.data.path, without importing nltk.'''
+    path = []
+    if 'NLTK_DATA' in os.environ:
+        path += os.environ['NLTK_DATA'].split(os.pathsep)
+    path.append(os.path.expanduser('~/nltk_data'))
+    path += [os.path.join(sys.prefix, 'nltk_data'), os.path.join(sys.prefix, 'share', 'nltk_data'), os.path.join(sys.prefix, 'lib', 'nltk_data')]
+    path += ['/usr/share/nltk_data', '/usr/local/share/nltk_data', '/usr/lib/nltk_data', '/usr/local/lib/nltk_data']
+    return path
+
+
+def get_cmudict_filename():
+    '''Returns the filename of the cmudict corpus which nltk would load, or
+    None if it cannot be found.'''
+    for directory in get_nltk_data_path():
+        for corpus in ('corpora/cmudict/cmudict', 'corpora/cmudict.zip'):
+            filename = os.path.join(directory, corpus)
+            if os.path.isfile(filename):
+                return os.path.abspath(filename)
+    return None
+
+
+def get_cmudict_fingerprint():
+    '''Returns a fingerprint of the cmudict corpus which nltk would load, from
+    its path, modification time, and size, so that a changed or upgraded
+    cmudict is compiled again. If the corpus cannot be found, the cmudict
+    cannot be loaded, and the table compiled from it before, if any, is
+    used.'''
+    filename = get_cmudict_filename()
+    if filename is None:
+        return 'nltk.corpus.cmudict'
+    stat = os.stat(filename)
+    return cache.fingerprint('nltk.corpus.cmudict', filename, stat.st_mtime_ns, stat.st_size)
+
+
+def load_cmudict_table():
+    '''Returns the cmudict as a compiled table. Once the table is compiled,
+    neither nltk nor the cmudict need to be loaded again, until the cmudict
+    corpus changes.'''
+    return table.load_table('cmudict', get_cmudict_fingerprint(), load_cmudict, encode_pronunciations, decode_pronunciations)
+
+
 def load_unknowns_dict(unknowns_file):
     '''Loads an existing unknowns dictionary from the tsv file given by the
     unknowns file parameter. Returns the dictionary.'''
@@ -57,7 +137,57 @@ def dict_to_tsv(dictionary):
     return '\n'.join(out_list) + '\n'
 
 
-def get_phonemes_and_unknowns(in_string, preserve_emphasis=False, phoneme_dict=nltk.corpus.cmudict.dict(), unknowns_dict={}):
+def get_phoneme_rows(in_rows, preserve_emphasis, phoneme_dict, unknowns_dict):
+    '''Generates a Row of phonemes for each of the given Rows of words, using
+    the first pronunciation given by the phoneme dictionary for each word.
+    Words which are not in the phoneme dictionary are counted in the unknowns
+    dictionary, which is modified in place.'''
+    for row in in_rows:
+        row_list = []
+        for word in rows.iter_words(row):
+            word = word.lower()
+            if word in phoneme_dict:
+                pronunciation = phoneme_dict[word][0]  # Use first pronunciation
+                for phon in pronunciation:
+                    if phon[-1].isdigit() and not preserve_emphasis:
+                        row_list.append(phon[:-1])
+                    else:
+                        row_list.append(phon)
+            else:
+                if word not in unknowns_dict:
+                    unknowns_dict[word] = 0
+                unknowns_dict[word] += 1
+        yield rows.Row(row.code, row.character, row_list)
+
+
+def get_phoneme_variants(in_rows, phoneme_dict, unknowns_dict):
+    '''Generates a tuple of a Row of phonemes with emphasis markings and a Row
+    of phonemes without them for each of the given Rows of words, as
+    get_phoneme_rows() would generate them with and without preserve_emphasis,
+    looking up each word only once. Words which are not in the phoneme
+    dictionary are counted once in the unknowns dictionary, which is modified
+    in place.'''
+    for row in in_rows:
+        emphasis_list = []
+        plain_list = []
+        for word in rows.iter_words(row):
+            word = word.lower()
+            if word in phoneme_dict:
+                pronunciation = phoneme_dict[word][0]  # Use first pronunciation
+                for phon in pronunciation:
+                    emphasis_list.append(phon)
+                    if phon[-1].isdigit():
+                        plain_list.append(phon[:-1])
+                    else:
+                        plain_list.append(phon)
+            else:
+                if word not in unknowns_dict:
+                    unknowns_dict[word] = 0
+                unknowns_dict[word] += 1
+        yield (rows.Row(row.code, row.character, emphasis_list), rows.Row(row.code, row.character, plain_list))
+
+
+def get_phonemes_and_unknowns(in_string, preserve_emphasis=False, phoneme_dict=None, unknowns_dict={}):
     '''Converts character text into phonemes by using the Carnegie Mellon
     University phoneme dictionary from nltk.corpus.cmudict.dict(), or another
     dictionary provided by the phoneme_dict argument which maps words to
@@ -72,28 +202,10 @@ def get_phonemes_and_unknowns(in_string, preserve_emphasis=False, phoneme_dict=n
     the number of times they occur. Existing dictionaries may be passed in, and
     the counts for existing entries will be incremented. The output string of
     phonemes and the unknowns_dict are returned as a tuple.'''
-    out_list = []
-    for row in in_string.strip().split('\n'):
-        words = row.split()
-        assert(len(words) >= 2)
-        TCPcode = words[0]
-        character = words[1]
-        row_list = [TCPcode, character]
-        for word in words[2:]:
-            word = word.lower()
-            if word in phoneme_dict:
-                pronunciation = phoneme_dict[word][0]  # Use first pronunciation
-                for phon in pronunciation:
-                    if phon[-1].isdigit() and not preserve_emphasis:
-                        row_list.append(phon[:-1])
-                    else:
-                        row_list.append(phon)
-            else:
-                if word not in unknowns_dict:
-                    unknowns_dict[word] = 0
-                unknowns_dict[word] += 1
-        out_list.append(' '.join(row_list))
-    return ('\n'.join(out_list) + '\n', unknowns_dict)
+    if phoneme_dict is None:
+        phoneme_dict = load_cmudict()
+    phoneme_rows = get_phoneme_rows(rows.parse_word_rows(in_string), preserve_emphasis, phoneme_dict, unknowns_dict)
+    return (rows.format_rows(phoneme_rows, ' '), unknowns_dict)
 
 
 def parse_phonemes(arg_list):
@@ -101,14 +213,16 @@ def parse_phonemes(arg_list):
     function accordingly. Writes the output to stdout unless an output file is
     specified using the -o flag. Writes unknowns to stderr in tsv format unless
     an unknowns file is specified using the -u flag.'''
-    optlist, args = getopt.getopt(arg_list, 'hei:o:u:l:d:s:')
+    optlist, args = getopt.getopt(arg_list, 'hbei:o:u:l:d:s:w:')
     preserve_emphasis = False
     infile = sys.stdin
     outfile = sys.stdout
+    variant_file = None
     unknowns_file = sys.stderr
     unknowns_dict = {}
     dict_filename = ''
     separator = ','
+    framed = False
     for o, a in optlist:
         if o == '-h':
             print('''
@@ -146,6 +260,15 @@ Usage information for {0}
     -o filename     Specify an output file to which to write output, rather
                         than writing to stdout.
 
+    -w filename     Also write the phonemes of the other stress variant to the
+                        given file, in the same pass: the phonemes without
+                        emphasis markings if -e is given, and with them
+                        otherwise. Each word is looked up only once, and its
+                        unknown word count is counted only once.
+                        Ex:
+                            $ python3 {0} -e -i translated.txt \\
+                              -o stressed.txt -w unstressed.txt
+
     -u filename     Specify an output file to which to write the unknown word
                         counts in tsv format, rather than writing to stderr.
 
@@ -168,14 +291,20 @@ Usage information for {0}
     -s separator    Specify the separator used by the dictionary file.
                         To use a space character, use the flag as -s " "
                         To use a tab character, use the flag as -s "\\t"
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
 '''.format(sys.argv[0]))
             exit(0)
         if o == '-e':
             preserve_emphasis = True
         if o == '-i':
-            infile = open(a, 'r')
+            infile = compression.open_file(a, 'r')
         if o == '-o':
-            outfile = open(a, 'w')
+            outfile = compression.open_file(a, 'w')
+        if o == '-w':
+            variant_file = compression.open_file(a, 'w')
         if o == '-u':
             unknowns_file = open(a, 'w')
         if o == '-l':
@@ -185,15 +314,27 @@ Usage information for {0}
         if o == '-s':
             separator = a
             if separator == '\\t' or separator == '\\\\t':
-                separator == '\t'
-    if dict_filename != '':
-        phoneme_dict = load_phoneme_dict(a, separator)
+                separator = '\t'
+        if o == '-b':
+            framed = True
+    with profiling.phase('load'):
+        if dict_filename != '':
+            phoneme_dict = load_phoneme_table(dict_filename, separator)
+        else:
+            phoneme_dict = load_cmudict_table()
+    splitter, in_rows = frames.read_rows(infile)
+    if variant_file is not None:
+        outfiles = [outfile, variant_file]
+        if not preserve_emphasis:
+            outfiles = outfiles[::-1]
+        phoneme_rows = profiling.timed(get_phoneme_variants(in_rows, phoneme_dict, unknowns_dict), 'core')
+        frames.write_variants(outfiles, phoneme_rows, ' ', framed)
+        variant_file.close()
     else:
-        phoneme_dict = nltk.corpus.cmudict.dict()
-    in_string = infile.read()
-    out_string, unknowns_dict = get_phonemes_and_unknowns(in_string, preserve_emphasis, phoneme_dict, unknowns_dict)
-    outfile.write(out_string)
-    unknowns_file.write(dict_to_tsv(unknowns_dict))
+        phoneme_rows = profiling.timed(get_phoneme_rows(in_rows, preserve_emphasis, phoneme_dict, unknowns_dict), 'core')
+        frames.write_rows(outfile, phoneme_rows, ' ', framed)
+    with profiling.phase('write'):
+        unknowns_file.write(dict_to_tsv(unknowns_dict))
     if infile != sys.stdin:
         infile.close()
     if outfile != sys.stdout:
@@ -203,7 +344,7 @@ Usage information for {0}
 
 
 def main():
-    parse_phonemes(sys.argv[1:])
+    profiling.run(parse_phonemes, sys.argv[1:], 'phonemes')
 
 
 if __name__ == '__main__':
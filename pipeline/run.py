@@ -0,0 +1,505 @@
+#!/usr/bin/python3
+
+import sys
+import getopt
+import os
+import shlex
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.frames as frames
+import lib.cache as cache
+import lib.shards as shards
+import lib.errors as errors
+import lib.compression as compression
+import lib.profiling as profiling
+import pipeline.stages as stages
+
+def timed_stage(stage, name):
+    '''Returns the given stage with the time spent within it, and in
+    generating each of its rows, counted toward the phase with the given name
+    when profiling.'''
+    def wrapped(in_rows, splitter):
+        with profiling.phase(name):
+            out_rows, splitter = stage(in_rows, splitter)
+        return (profiling.timed(out_rows, name), splitter)
+    return wrapped
+
+
+def build_stages(stage_specs, filenames=[]):
+    '''Builds a list of stages from the given stage specifications, each of
+    which is a stage name followed by that stage's options, such as
+        'translate -p -d ../dicts/additional_dict.txt'
+    Any filenames are passed to the extract stage.'''
+    builders = stages.get_stage_builders()
+    built = []
+    for spec_list in stages.split_stage_specs(stage_specs):
+        with profiling.phase('load'):
+            stage = builders[spec_list[0]](spec_list[1:], filenames)
+        built.append(timed_stage(stage, spec_list[0]))
+    return built
+
+
+def run_rows(stages, in_rows, splitter):
+    '''Composes the given stages over the given rows. Returns a tuple of the
+    generator of output rows and the separator with which to format them.'''
+    for stage in stages:
+        in_rows, splitter = stage(in_rows, splitter)
+    return (in_rows, splitter)
+
+
+def run(stages, infile, outfile, read_input=True, framed=False):
+    '''Runs the given stages in-process, reading pipeline text or framed data
+    from the input file if read_input is True, and writing each output row to
+    the output file as soon as it is generated, as framed data if framed is
+    True.'''
+    splitter = ' '
+    in_rows = iter(())
+    if read_input:
+        splitter, in_rows = frames.read_rows(infile)
+    out_rows, splitter = run_rows(stages, in_rows, splitter)
+    frames.write_rows(outfile, out_rows, splitter, framed)
+
+
+def init_batch_stage(spec_list, splitter):
+    '''Builds the given stage in a worker process, for run_batch().'''
+    global batch_stage, batch_splitter
+    batch_stage = stages.build_play_stage(spec_list)
+    batch_splitter = splitter
+
+
+def run_batch(batch):
+    '''Runs the stage built by init_batch_stage() over a batch of rows in a
+    worker process. Returns a tuple of the output rows and the unknown word
+    counts of the batch, or None.'''
+    out_rows, splitter, unknowns_dict = batch_stage(batch, batch_splitter)
+    return (out_rows, unknowns_dict)
+
+
+def get_batch_task(stage, splitter):
+    '''Returns a function which runs the given stage, built by
+    stages.build_play_stage(), over a batch of rows, as run_batch() does.'''
+    def task(batch):
+        out_rows, out_splitter, unknowns_dict = stage(batch, splitter)
+        return (out_rows, unknowns_dict)
+    return task
+
+
+def run_concurrently(stage_specs, filenames, infile, outfile, read_input=True, framed=False, queue_size=8, workers={}):
+    '''Runs the given stages as run() does, but with each stage in its own
+    thread, connected by queues of at most the given number of batches of
+    rows, so that a slow stage holds back the stages before it. Stages given
+    in the workers dictionary, which maps stage names to tuples of a number of
+    workers and whether they are processes, run each batch on a pool of that
+    many threads or processes. Only clean, translate, phonemes, and separate
+    may have several workers. Returns the metrics of the pipeline.'''
+    import lib.executor as executor
+    pipeline = executor.Pipeline(queue_size)
+    splitter = ' '
+    if read_input:
+        splitter, in_rows = frames.read_rows(infile)
+        pipeline.add_source('read', lambda: in_rows)
+    builders = stages.get_stage_builders()
+    unknowns = []
+
+    def collect(result):
+        out_rows, unknowns_dict = result
+        if unknowns_dict is not None:
+            unknowns.append(unknowns_dict)
+        return out_rows
+
+    spec_lists = stages.split_stage_specs(stage_specs)
+    for spec_list in spec_lists:
+        name = spec_list[0]
+        count, processes = workers.get(name, (1, False))
+        if count == 1 and not processes:
+            stage = builders[name](spec_list[1:], filenames)
+            pipeline.add_stream(name, lambda in_rows, stage=stage, splitter=splitter: stage(in_rows, splitter)[0])
+        elif name not in ('clean', 'translate', 'phonemes', 'separate'):
+            raise getopt.GetoptError('{} stage cannot run on several workers'.format(name))
+        elif processes:
+            pipeline.add_map(name, run_batch, count, True, init_batch_stage, (spec_list, splitter), collect)
+        else:
+            pipeline.add_map(name, get_batch_task(stages.build_play_stage(spec_list), splitter), count, collect=collect)
+        splitter = stages.get_stage_splitter(name, splitter)
+    frames.write_rows(outfile, pipeline.run(), splitter, framed)
+
+    names = [spec_list[0] for spec_list in spec_lists]
+    if 'phonemes' in names and workers.get('phonemes', (1, False)) != (1, False):
+        optlist, args = getopt.getopt(spec_lists[names.index('phonemes')][1:], stages.PHONEMES_OPTIONS)
+        preserve_emphasis, unknowns_filename, unknowns_dict, dict_filename, separator = stages.read_phonemes_options(optlist)
+        for batch_unknowns in unknowns:
+            for word, count in batch_unknowns.items():
+                unknowns_dict[word] = unknowns_dict.get(word, 0) + count
+        stages.report_unknowns(unknowns_filename, unknowns_dict)
+    return pipeline.get_metrics()
+
+
+def parse_workers(arg):
+    '''Parses a stage's workers, given as stage:N or stage:N:process. Returns
+    a tuple of the stage name, the number of workers, and whether they are
+    processes rather than threads.'''
+    parts = arg.split(':')
+    if len(parts) not in (2, 3) or not parts[1].isdigit() or int(parts[1]) < 1 or parts[2:] not in ([], ['thread'], ['process']):
+        raise getopt.GetoptError('workers must be given as stage:N[:thread|process]: {}'.format(arg))
+    return (parts[0], int(parts[1]), parts[2:] == ['process'])
+
+
+def read_manifest(manifest_filename, checkpoint_id):
+    '''Reads the TCP codes of the plays completed by an earlier run from the
+    given manifest, which must have been written by a run of the same stages,
+    as given by the checkpoint id. Returns the set of completed codes.'''
+    completed = set()
+    with open(manifest_filename, 'r') as manifest:
+        header = manifest.readline().strip()
+        if header != '# ' + checkpoint_id:
+            raise getopt.GetoptError('checkpoint in {} was written by different stages'.format(manifest_filename))
+        for line in manifest:
+            if line.endswith('\n'):  # A partially written line is not a completed play
+                completed.add(line.strip())
+    return completed
+
+
+def end_manifest(manifest_filename):
+    '''Ends the partially written last line of the given manifest, if any, so
+    that the codes recorded after it are on lines of their own.'''
+    with open(manifest_filename, 'rb+') as manifest:
+        manifest.seek(-1, os.SEEK_END)
+        if manifest.read(1) != b'\n':
+            manifest.write(b'\n')
+
+
+def get_checkpoint_stages(stage_specs, filenames):
+    '''Checks that the given stages may be checkpointed, which requires that
+    the first is extract. Returns a tuple of the list of each stage's split
+    specification, the input directory of extract, the xml filenames selected
+    by its options, and a tuple of its arguments to extract_files() which
+    filter and sample their rows.'''
+    import pipeline.extract as extract
+    spec_lists = [shlex.split(spec) for spec in stage_specs]
+    builders = stages.get_stage_builders()
+    if len(spec_lists) == 0 or len(spec_lists[0]) == 0 or spec_lists[0][0] != 'extract':
+        raise getopt.GetoptError('checkpointing requires extract as the first stage')
+    for spec_list in spec_lists[1:]:
+        if len(spec_list) == 0 or spec_list[0] not in builders or spec_list[0] == 'extract':
+            raise getopt.GetoptError('unknown stage: {}'.format(' '.join(spec_list)))
+    optlist, args = getopt.getopt(spec_lists[0][1:], 'd:c:s:r:t:p:q:m:a:')
+    in_directory = ''
+    for o, a in optlist:
+        if o == '-d':
+            in_directory = a.rstrip('/') + '/'
+    filenames, filters = extract.parse_selection(optlist, args + filenames)
+    return (spec_lists, in_directory, filenames, filters)
+
+
+def get_segment(checkpoint_dir, filename):
+    '''Returns the filename of the checkpointed output of the given xml file.'''
+    return '{}/{}.ctpf'.format(checkpoint_dir, shards.get_code(filename))
+
+
+def run_checkpointed(stage_specs, filenames, checkpoint_dir, outfile, resume=False, framed=False, shard=None):
+    '''Runs the given stages, the first of which must be extract, over one xml
+    file at a time, writing the output of each play atomically to its own
+    segment in the checkpoint directory and then recording its TCP code in the
+    manifest there. If resume is True, plays recorded in the manifest by an
+    interrupted run of the same stages are not run again. Once every play is
+    complete, the segments are assembled and written to the output file, which
+    is then identical to the output of run() over the same files.
+
+    If a shard is given, as a tuple of K and N, only the plays of shard K of N
+    are run, under a lock file in the checkpoint directory, and a done file is
+    written in place of the output once they are complete. The output of all N
+    shards is then assembled by gather().'''
+    import pipeline.build as build
+    import pipeline.extract as extract
+    spec_lists, in_directory, filenames, filters = get_checkpoint_stages(stage_specs, filenames)
+    checkpoint_id = cache.fingerprint(*stage_specs)
+    manifest_filename = checkpoint_dir + '/manifest.txt'
+    if shard is not None:
+        filenames = shards.select(filenames, *shard)
+        shard_name = 'shard-{}-of-{}'.format(*shard)
+        manifest_filename = '{}/{}.manifest'.format(checkpoint_dir, shard_name)
+        os.makedirs(checkpoint_dir, 0o755, exist_ok=True)
+        lock_filename = '{}/{}.lock'.format(checkpoint_dir, shard_name)
+        shards.acquire_lock(lock_filename)
+    try:
+        completed = set()
+        if resume and os.path.exists(manifest_filename):
+            completed = read_manifest(manifest_filename, checkpoint_id)
+            end_manifest(manifest_filename)
+        else:
+            cache.atomic_write(manifest_filename, '# {}\n'.format(checkpoint_id))
+        with profiling.phase('load'):
+            play_stages = [stages.build_play_stage(spec_list) for spec_list in spec_lists[1:]]
+
+        with open(manifest_filename, 'a') as manifest:
+            for filename in filenames:
+                segment = get_segment(checkpoint_dir, filename)
+                if shards.get_code(filename) in completed and os.path.exists(segment):
+                    continue
+                splitter = '\t'
+                with profiling.phase('extract'):
+                    in_rows = list(extract.extract_files([in_directory + filename], '', False, *filters))
+                unknowns_dict = None
+                for spec_list, stage in zip(spec_lists[1:], play_stages):
+                    with profiling.phase(spec_list[0]):
+                        in_rows, splitter, play_unknowns = stage(in_rows, splitter)
+                    if play_unknowns is not None:
+                        unknowns_dict = play_unknowns
+                if unknowns_dict is not None:
+                    build.write_unknowns(build.get_unknowns_filename(segment), unknowns_dict)
+                with cache.atomic_open(segment) as segment_file:
+                    frames.write_frames(segment_file, in_rows, splitter)
+                manifest.write(shards.get_code(filename) + '\n')
+                manifest.flush()
+                os.fsync(manifest.fileno())
+        if shard is not None:
+            cache.atomic_write('{}/{}.done'.format(checkpoint_dir, shard_name), '# {}\n'.format(checkpoint_id))
+    finally:
+        # Released after an error too, so that the shard may be resumed
+        if shard is not None:
+            shards.release_lock(lock_filename)
+    if shard is not None:
+        return
+    segments = [get_segment(checkpoint_dir, filename) for filename in filenames]
+    unknowns_filenames = [build.get_unknowns_filename(segment) for segment in segments]
+    build.assemble(spec_lists, segments, unknowns_filenames, outfile, framed)
+
+
+def gather(stage_specs, filenames, checkpoint_dir, shard_count, outfile, framed=False):
+    '''Assembles the output of every shard of a sharded run of the given
+    stages over the given xml files, once all of the shards are done, and
+    writes it to the output file in the same order as an unsharded run.'''
+    import pipeline.build as build
+    spec_lists, in_directory, filenames, filters = get_checkpoint_stages(stage_specs, filenames)
+    checkpoint_id = cache.fingerprint(*stage_specs)
+    missing = []
+    for shard in range(1, shard_count + 1):
+        done_filename = '{}/shard-{}-of-{}.done'.format(checkpoint_dir, shard, shard_count)
+        if not os.path.exists(done_filename):
+            missing.append(str(shard))
+        else:
+            read_manifest(done_filename, checkpoint_id)
+    if missing:
+        raise getopt.GetoptError('shards not done: {}'.format(', '.join(missing)))
+    segments = [get_segment(checkpoint_dir, filename) for filename in filenames]
+    for segment in segments:
+        if not os.path.exists(segment):
+            raise getopt.GetoptError('missing segment {}; were the shards run over the same files?'.format(segment))
+    unknowns_filenames = [build.get_unknowns_filename(segment) for segment in segments]
+    build.assemble(spec_lists, segments, unknowns_filenames, outfile, framed)
+
+
+def parse_run(arg_list):
+    '''Parses command-line arguments and runs the core run() function
+    accordingly. Writes the output to stdout unless an output file is specified
+    using the -o flag.'''
+    optlist, args = getopt.getopt(arg_list, 'hbrs:i:o:k:n:g:q:w:m:', ['resume'])
+    infile = sys.stdin
+    outfile = sys.stdout
+    stage_specs = []
+    framed = False
+    checkpoint_dir = None
+    resume = False
+    shard = None
+    gather_count = None
+    queue_size = None
+    workers = {}
+    metrics_filename = None
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - run several stages of the pipeline in a single process
+
+    Usage:
+        python3 {0} [OPTION]... [FILE]...
+
+    Runs the selected stages in the order given, passing structured rows from
+    one stage to the next as generators rather than writing and re-reading
+    text between separate scripts. Text is only read from the input (unless
+    the first stage is extract, which reads the xml files given as arguments)
+    and written to the output, in the same form as the final stage's script
+    would write it. Thus,
+        python3 {0} -s extract -s clean -s translate A08360.xml
+    produces the same output as
+        python3 extract.py A08360.xml | python3 clean.py | python3 translate.py
+
+    The existing scripts are unchanged and may still be used on their own.
+    If no stages are given, rows are copied from the input to the output,
+    which converts between pipeline text and the framed binary format.
+
+
+    -h              Display this help message.
+
+    -s stage        Add a stage to the pipeline. The stage is given by its
+                        name, optionally followed by the options of its
+                        script, quoted as a single argument. Stages are:
+                            extract     [-d directory] [-c csvfile]
+                                        [-s name] [-r regex] [-t N]
+                                        [-p code] [-q query]
+                                        [-m metadata] [-a sample]
+                            clean
+                            translate   [-p] [-d dictfile] [-s separator]
+                            combine     [-s separator] dictfile [dictfile]...
+                            normalize   [-e distance] [-d dictfile]
+                                        [-s separator] [-w filename]
+                            phonemes    [-e] [-d dictfile] [-s separator]
+                                        [-u filename] [-l filename]
+                            separate    [-m] [-d directory]
+                            store       [-f] filename
+                        Ex:
+                            $ python3 {0} -s extract -s clean \\
+                              -s 'translate -d ../dicts/additional_dict.txt' \\
+                              -s 'separate -m -d ready_for_ml' A08360.xml
+
+    -i filename     Specify an input file from which to read rows, rather than
+                        reading from stdin. Ignored if the first stage is
+                        extract.
+
+    -o filename     Specify an output file to which to write output, rather
+                        than writing to stdout.
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
+
+    -k directory    Checkpoint the run in the given directory. The first stage
+                        must be extract. Each xml file is run through every
+                        stage on its own, and its output is written to a
+                        segment in this directory named by its TCP code, which
+                        is then recorded in the directory's manifest. The
+                        output is assembled from the segments once every file
+                        is complete, and is identical to the output of the
+                        same run without checkpointing.
+
+    -r, --resume    Resume an interrupted checkpointed run, skipping the files
+                        recorded in the manifest as complete. The stages must
+                        be the same as those of the interrupted run. Implies
+                        -k checkpoint, unless another directory is given.
+
+    -n K/N          Run only shard K of N of a checkpointed run, for running a
+                        corpus on N machines sharing the checkpoint directory.
+                        Each xml file belongs to the shard given by a stable
+                        hash of its TCP code, so every machine must be given
+                        the same files. The shard's segments and unknown word
+                        counts are written to the checkpoint directory, under
+                        a lock file which prevents the shard from running
+                        twice at once, and a done file is written once they
+                        are complete. Nothing is written to the output.
+                        Ex:
+                            host1$ python3 {0} -k /shared/ck -n 1/2 -s extract ... FILE...
+                            host2$ python3 {0} -k /shared/ck -n 2/2 -s extract ... FILE...
+
+    -g N            Gather the output of all N shards of a checkpointed run
+                        once they are done, given the same stages and files,
+                        writing exactly the output of an unsharded run.
+                        Ex:
+                            $ python3 {0} -k /shared/ck -g 2 -s extract ... FILE...
+
+    -q size         Run each stage concurrently in its own thread, connected by
+                        queues of at most the given number of batches of 64
+                        rows, so that a slow stage holds back the stages
+                        before it rather than letting rows pile up in memory.
+                        The output is the same as without -q.
+
+    -w stage:N[:thread|process]
+                    Run the given stage on N worker threads, or processes, each
+                        taking a batch of rows at a time, while keeping the
+                        rows in order. Processes suit CPU-bound stages such
+                        as clean, and threads suit I/O-bound stages such as
+                        separate. Only clean, translate, phonemes, and
+                        separate may have several workers. Implies -q 8,
+                        unless another size is given.
+                        Ex:
+                            $ python3 {0} -s extract -s clean -w clean:4:process \\
+                              -s 'separate -m -d ready_for_ml' -w separate:2 A08360.xml
+
+    -m filename     Write the metrics of a concurrent run to the given file as
+                        json, or to stderr if the filename is -. For each
+                        stage, these include the time spent waiting for input
+                        and for room in its output queue, and the maximum and
+                        mean depth of that queue. The stage which waits least
+                        is the bottleneck. Implies -q 8, unless another size
+                        is given.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-k':
+            checkpoint_dir = a.rstrip('/')
+        if o == '-r' or o == '--resume':
+            resume = True
+        if o == '-n':
+            try:
+                shard = shards.parse_shard(a)
+            except getopt.GetoptError as err:
+                print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+                exit(1)
+        if o == '-g':
+            gather_count = int(a)
+        if o == '-q':
+            queue_size = int(a)
+        if o == '-w':
+            try:
+                name, count, processes = parse_workers(a)
+            except getopt.GetoptError as err:
+                print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+                exit(1)
+            workers[name] = (count, processes)
+        if o == '-m':
+            metrics_filename = a
+        if o == '-s':
+            stage_specs.append(a)
+        if o == '-i':
+            infile = compression.open_file(a, 'r', encoding='utf-8')
+        if o == '-o':
+            outfile = compression.open_file(a, 'w', encoding='utf-8')
+        if o == '-b':
+            framed = True
+    if checkpoint_dir is None and (resume or shard is not None or gather_count is not None):
+        checkpoint_dir = 'checkpoint'
+    if checkpoint_dir is not None:
+        try:
+            if gather_count is not None:
+                gather(stage_specs, args, checkpoint_dir, gather_count, outfile, framed)
+            else:
+                run_checkpointed(stage_specs, args, checkpoint_dir, outfile, resume, framed, shard)
+        except (getopt.GetoptError, FileExistsError, errors.PipelineError) as err:
+            print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+            exit(1)
+        if outfile != sys.stdout:
+            outfile.close()
+        return
+    read_input = len(stage_specs) == 0 or shlex.split(stage_specs[0])[0] != 'extract'
+    if queue_size is None and (workers or metrics_filename is not None):
+        queue_size = 8
+    if queue_size is not None:
+        try:
+            metrics = run_concurrently(stage_specs, args, infile, outfile, read_input, framed, queue_size, workers)
+        except (getopt.GetoptError, errors.PipelineError) as err:
+            print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+            exit(1)
+        import json
+        if metrics_filename == '-':
+            print(json.dumps(metrics, indent=2), file=sys.stderr)
+        elif metrics_filename is not None:
+            with open(metrics_filename, 'w') as metrics_file:
+                json.dump(metrics, metrics_file, indent=2)
+                metrics_file.write('\n')
+    else:
+        try:
+            stages = build_stages(stage_specs, args)
+            run(stages, infile, outfile, read_input, framed)
+        except (getopt.GetoptError, errors.PipelineError) as err:
+            print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+            exit(1)
+    if infile != sys.stdin:
+        infile.close()
+    if outfile != sys.stdout:
+        outfile.close()
+
+
+def main():
+    profiling.run(parse_run, sys.argv[1:], 'run')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,11 @@
 import sys
 import getopt
 import os
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.compression as compression
+import lib.profiling as profiling
 
 
 def verify_string(in_string):
@@ -40,27 +45,35 @@ def separate(in_string, directory='', match=False):
     are the contents of the line with the TCP code and character removed.
     '''
     assert(verify_string)
+    splitter = rows.get_separator(in_string)
+    for row in separate_rows(rows.parse_rows(in_string, splitter), directory, match, splitter):
+        pass
+
+
+def separate_rows(in_rows, directory='', match=False, splitter=' '):
+    '''Writes the speech of each of the given Rows to a separate character
+    file, joining the elements with the given splitter, where the filename is
+    given by <TCPcode>_<character>.txt, with the character's name as it is
+    written in pipeline text with the given splitter, so that the filenames
+    are the same whether the Rows were read as text or as frames. Generates
+    each Row unchanged after it has been written, so that the Rows can
+    continue through the pipeline.'''
     if directory:
         directory = directory.rstrip('/') + '/'
-    splitter = ' '
-    if '\t' in in_string:
-        splitter = '\t'
-    for line in in_string.split('\n'):
-        if line.strip() == '':
-            continue
-        line_split = line.split(splitter)
-        TCPcode, speaker = line_split[:2]
-        speech = splitter.join(line_split[2:])
+    for row in in_rows:
+        speech = splitter.join(row.elements)
         out_dir = directory
         if match:
-            out_dir = out_dir + TCPcode + '/'
+            out_dir = out_dir + row.code + '/'
         if out_dir:
             try:
                 os.makedirs(out_dir, 0o755)
             except FileExistsError:
                 pass
-        with open(out_dir + TCPcode + '_' + speaker + '.txt', 'w') as outfile:
+        character = rows.format_character(row.character, splitter)
+        with open(out_dir + row.code + '_' + character + '.txt', 'w') as outfile:
             outfile.write(speech)
+        yield row
 
 
 def parse_separate(arg_list):
@@ -68,11 +81,12 @@ def parse_separate(arg_list):
     accordingly. Writes each character's text to a separate file, and writes
     the original input to stdout so that separate.py can be inserted into the
     pipeline without interrupting it.''' 
-    optlist, args = getopt.getopt(arg_list, 'hmi:o:d:')
+    optlist, args = getopt.getopt(arg_list, 'hbmi:o:d:')
     infile = sys.stdin
     outfile = sys.stdout
     directory = ''
     match = False
+    framed = False
     for o, a in optlist:
         if o == '-h':
             print('''
@@ -120,19 +134,25 @@ Usage information for {0}
                         according to the TCP code of the xml file from which
                         they originate. If -d is used, these directories will
                         all be within the directory given by -d.
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
 '''.format(sys.argv[0]))
             exit(0)
         if o == '-i':
-            infile = open(a, 'r')
+            infile = compression.open_file(a, 'r')
         if o == '-o':
-            outfile = open(a, 'w')
+            outfile = compression.open_file(a, 'w')
         if o == '-d':
             directory = a.rstrip('/') + '/'
         if o == '-m':
             match = True
-    in_string = infile.read()
-    separate(in_string, directory, match)
-    outfile.write(in_string)
+        if o == '-b':
+            framed = True
+    splitter, in_rows = frames.copy_rows(infile, outfile, framed)
+    for row in profiling.timed(separate_rows(in_rows, directory, match, splitter), 'core'):
+        pass
     if infile != sys.stdin:
         infile.close()
     if outfile != sys.stdout:
@@ -140,7 +160,7 @@ Usage information for {0}
 
 
 def main():
-    parse_separate(sys.argv[1:])
+    profiling.run(parse_separate, sys.argv[1:], 'separate')
 
 
 if __name__ == '__main__':
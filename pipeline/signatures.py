@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+
+import sys
+import csv
+import getopt
+import numpy
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.errors as errors
+import lib.compression as compression
+import lib.profiling as profiling
+
+VOWELS = ['AA', 'AE', 'AH', 'AO', 'AW', 'AY', 'EH', 'ER', 'EY', 'IH', 'IY', 'OW', 'OY', 'UH', 'UW']
+CONSONANTS = ['B', 'CH', 'D', 'DH', 'F', 'G', 'HH', 'JH', 'K', 'L', 'M', 'N', 'NG', 'P', 'R', 'S', 'SH', 'T', 'TH', 'V', 'W', 'Y', 'Z', 'ZH']
+PHONEMES = VOWELS + CONSONANTS  # The ARPAbet inventory of the cmudict
+STRESSED_PHONEMES = [vowel + stress for vowel in VOWELS for stress in '012'] + CONSONANTS
+
+
+def get_phoneme_ids(stressed=False):
+    '''Returns a dictionary of the id of each phoneme of the ARPAbet
+    inventory, which is its index in PHONEMES, or in STRESSED_PHONEMES if
+    stressed is True. Unless stressed is True, vowels with stress markings, as
+    written by phonemes.py -e, have the same id as the vowel without them.'''
+    if stressed:
+        return {phoneme: i for i, phoneme in enumerate(STRESSED_PHONEMES)}
+    phoneme_ids = {phoneme: i for i, phoneme in enumerate(PHONEMES)}
+    for vowel in VOWELS:
+        for stress in '012':
+            phoneme_ids[vowel + stress] = phoneme_ids[vowel]
+    return phoneme_ids
+
+
+def get_columns(stressed=False, bigrams=False):
+    '''Returns the list of names of the columns of each signature.'''
+    columns = list(PHONEMES)
+    if stressed:
+        columns += STRESSED_PHONEMES
+    if bigrams:
+        columns += [first + '-' + second for first in PHONEMES for second in PHONEMES]
+    return columns
+
+
+def count_phonemes(ids, inventory_size):
+    '''Returns a NumPy array of the number of times each phoneme occurs in the
+    given array of ids, ignoring ids of -1.'''
+    return numpy.bincount(ids[ids >= 0], minlength=inventory_size)
+
+
+def count_bigrams(ids, inventory_size):
+    '''Returns a NumPy array of the number of times each pair of phonemes
+    occurs in sequence in the given array of ids, where the pair (a, b) is
+    counted at index a * inventory_size + b. Pairs including an id of -1 are
+    ignored.'''
+    first = ids[:-1]
+    second = ids[1:]
+    found = (first >= 0) & (second >= 0)
+    return numpy.bincount(first[found] * inventory_size + second[found], minlength=inventory_size * inventory_size)
+
+
+def normalize(counts, normalized=True):
+    '''Returns the given counts as frequencies which sum to 1, or as floats if
+    normalized is False. Counts which are all 0 remain 0.'''
+    counts = counts.astype(numpy.float64)
+    if normalized:
+        total = counts.sum()
+        if total > 0:
+            counts /= total
+    return counts
+
+
+def get_signatures(in_rows, stressed=False, bigrams=False, normalized=True):
+    '''Converts the phonemes of each of the given Rows, as written by
+    phonemes.py, into a signature of the frequency of each phoneme of the
+    ARPAbet inventory, regardless of stress. If stressed is True, the
+    signature also contains the frequency of each stressed vowel and
+    consonant, for which phonemes.py must have been run with -e. If bigrams is
+    True, the signature also contains the frequency of each pair of phonemes
+    (regardless of stress) spoken in sequence. Each part of the signature sums
+    to 1, or contains the counts themselves if normalized is False. Words for
+    which no phonemes were found are ignored. Generates a tuple of the TCP
+    code, character, and NumPy array of the signature of each Row. Raises a
+    PipelineError if stressed is True and a Row has a vowel without a stress
+    marking, which would otherwise be left out of the stressed part.'''
+    phoneme_ids = get_phoneme_ids()
+    stressed_ids = get_phoneme_ids(True)
+    for row in in_rows:
+        phonemes = list(rows.iter_words(row))
+        ids = numpy.fromiter((phoneme_ids.get(phoneme, -1) for phoneme in phonemes), dtype=numpy.int64, count=len(phonemes))
+        parts = [normalize(count_phonemes(ids, len(PHONEMES)), normalized)]
+        if stressed:
+            ids_stressed = numpy.fromiter((stressed_ids.get(phoneme, -1) for phoneme in phonemes), dtype=numpy.int64, count=len(phonemes))
+            unstressed = (ids >= 0) & (ids_stressed < 0)
+            if unstressed.any():
+                vowel = phonemes[int(numpy.argmax(unstressed))]
+                raise errors.PipelineError('{} {}: vowel {} has no stress marking; stressed signatures require the phonemes to be written by phonemes.py -e'.format(row.code, row.character, vowel))
+            parts.append(normalize(count_phonemes(ids_stressed, len(STRESSED_PHONEMES)), normalized))
+        if bigrams:
+            parts.append(normalize(count_bigrams(ids, len(PHONEMES)), normalized))
+        yield (row.code, row.character, numpy.concatenate(parts))
+
+
+def write_signatures(outfile, columns, signatures, keep=False):
+    '''Writes the given signatures to the given file as csv, with a column for
+    the TCP code, the character, and each column of the signatures. If keep is
+    True, returns a tuple of the list of TCP codes, the list of characters,
+    and the list of signatures written, in order.'''
+    writer = csv.writer(outfile)
+    writer.writerow(['TCP', 'character'] + columns)
+    codes = []
+    characters = []
+    written = []
+    for code, character, signature in signatures:
+        writer.writerow([code, character] + signature.tolist())
+        if keep:
+            codes.append(code)
+            characters.append(character)
+            written.append(signature)
+    return (codes, characters, written)
+
+
+def save_matrix(filename, columns, codes, characters, signatures):
+    '''Writes the given signatures to the given file as a NumPy .npz archive of
+    the dense matrix of signatures, one per row, along with the row index
+    arrays codes and characters and the array of column names, none of which
+    require pickling to load:
+        archive = numpy.load(filename)
+        archive['matrix'], archive['codes'], archive['characters'], archive['columns']'''
+    matrix = numpy.zeros((len(signatures), len(columns)), dtype=numpy.float64)
+    if signatures:
+        matrix = numpy.stack(signatures)
+    numpy.savez(filename, matrix=matrix, codes=numpy.array(codes, dtype=str),
+                characters=numpy.array(characters, dtype=str), columns=numpy.array(columns, dtype=str))
+
+
+def parse_signatures(arg_list):
+    '''Parses command-line arguments and runs the core get_signatures()
+    function accordingly. Writes the csv to stdout unless an output file is
+    specified using the -o flag.'''
+    optlist, args = getopt.getopt(arg_list, 'hecgi:o:n:')
+    infile = sys.stdin
+    outfile = sys.stdout
+    stressed = False
+    bigrams = False
+    normalized = True
+    matrix_filename = None
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - converts character phonemes into phoneme frequency signatures
+
+    Usage:
+        python3 {0} [OPTION]...
+
+    Reads one character's phonemes per line of stdin, as written by
+    phonemes.py. Thus, stdin is of the form:
+        TCPcode character phoneme [phoneme]...\\n
+
+    Writes a csv file with a row for each character, in order, of the
+    frequency with which the character speaks each of the 39 phonemes of the
+    ARPAbet inventory used by the cmudict, regardless of stress, such that the
+    frequencies of each character sum to 1:
+        TCP,character,AA,AE,...,ZH
+
+    Signatures are computed with NumPy, one character at a time, so a corpus
+    of any size is converted in a single pass.
+
+
+    -h              Display this help message.
+
+    -e              Also include the frequency of each of the 69 stressed
+                        vowels and consonants, such as AA0, AA1, and AA2, as
+                        a second part of the signature which sums to 1.
+                        Requires the phonemes to have been written by
+                        phonemes.py -e, and exits with an error at the first
+                        vowel without a stress marking.
+
+    -g              Also include the frequency of each of the 1521 pairs of
+                        phonemes spoken in sequence, regardless of stress,
+                        such as DH-AH, as a final part of the signature which
+                        sums to 1. Word boundaries are not preserved by
+                        phonemes.py, so pairs span words.
+
+    -c              Write the counts of phonemes and pairs of phonemes rather
+                        than their frequencies.
+
+    -i filename     Specify an input file from which to read rows, rather
+                        than reading from stdin.
+
+    -o filename     Specify an output file to which to write the csv, rather
+                        than writing to stdout.
+
+    -n filename     Also write the signatures as a dense NumPy matrix, with a
+                        row for each row of the csv, to the given .npz file,
+                        along with the TCP code and character of each row and
+                        the name of each column.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-e':
+            stressed = True
+        if o == '-g':
+            bigrams = True
+        if o == '-c':
+            normalized = False
+        if o == '-i':
+            infile = compression.open_file(a, 'r')
+        if o == '-o':
+            outfile = compression.open_file(a, 'w', newline='')
+        if o == '-n':
+            matrix_filename = a
+    splitter, in_rows = frames.read_rows(infile)
+    columns = get_columns(stressed, bigrams)
+    signatures = profiling.timed(get_signatures(in_rows, stressed, bigrams, normalized), 'core')
+    try:
+        codes, characters, written = write_signatures(outfile, columns, signatures, matrix_filename is not None)
+    except errors.PipelineError as err:
+        print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+        exit(1)
+    if matrix_filename is not None:
+        with profiling.phase('write'):
+            save_matrix(matrix_filename, columns, codes, characters, written)
+    if infile != sys.stdin:
+        infile.close()
+    if outfile != sys.stdout:
+        outfile.close()
+
+
+def main():
+    profiling.run(parse_signatures, sys.argv[1:], 'signatures')
+
+
+if __name__ == '__main__':
+    main()
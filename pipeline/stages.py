@@ -0,0 +1,295 @@
+'''Construction of the stages which run.py, build.py, and daemon.py run
+in-process.
+
+A stage is built from its name and the options of its script, other than -h,
+-i, -o, and -b, by the stage builder of that name, which loads any
+dictionaries the stage needs once, when it is built. The stage is a function
+which takes a generator of Rows and their separator, and returns a tuple of a
+generator of its output Rows and their separator. build_play_stage() instead
+builds a stage which runs over the list of Rows of a single play, as build.py
+and the checkpointed and concurrent runs of run.py need.
+
+Stage modules are imported by the stage builders rather than here, so that
+only the modules (and dependencies, such as nltk) of selected stages load.
+'''
+
+import sys
+import os
+import getopt
+import shlex
+
+PHONEMES_OPTIONS = 'eu:l:d:s:'  # The options of phonemes.py shared by every stage
+
+
+def read_phonemes_options(optlist, cwd=''):
+    '''Reads the -e, -u, -l, -d, and -s options of phonemes.py from the given
+    list of options, ignoring any others, resolving filenames against the given
+    directory, and loading any existing unknowns dictionary. Returns a tuple of
+    whether to preserve emphasis, the unknowns filename (or None), the unknowns
+    dictionary, the phoneme dictionary filename (or an empty string, for the
+    cmudict), and its separator.'''
+    import pipeline.phonemes as phonemes
+    preserve_emphasis = False
+    unknowns_filename = None
+    unknowns_dict = {}
+    dict_filename = ''
+    separator = ','
+    for o, a in optlist:
+        if o == '-e':
+            preserve_emphasis = True
+        if o == '-u':
+            unknowns_filename = os.path.join(cwd, a)
+        if o == '-l':
+            unknowns_dict = phonemes.load_unknowns_dict(os.path.join(cwd, a))
+        if o == '-d':
+            dict_filename = os.path.join(cwd, a)
+        if o == '-s':
+            separator = a
+            if separator == '\\t' or separator == '\\\\t':
+                separator = '\t'
+    return (preserve_emphasis, unknowns_filename, unknowns_dict, dict_filename, separator)
+
+
+def load_phoneme_dict(dict_filename, separator):
+    '''Returns the compiled phoneme table of the given dictionary file, or of
+    the cmudict if the filename is empty.'''
+    import pipeline.phonemes as phonemes
+    if dict_filename != '':
+        return phonemes.load_phoneme_table(dict_filename, separator)
+    return phonemes.load_cmudict_table()
+
+
+def report_unknowns(unknowns_filename, unknowns_dict, errfile=None):
+    '''Writes the given unknown word counts as phonemes.py does, to the given
+    file, or if it is None, to the given text file for messages, or stderr.'''
+    import pipeline.phonemes as phonemes
+    if unknowns_filename is None:
+        (sys.stderr if errfile is None else errfile).write(phonemes.dict_to_tsv(unknowns_dict))
+    else:
+        with open(unknowns_filename, 'w') as unknowns_file:
+            unknowns_file.write(phonemes.dict_to_tsv(unknowns_dict))
+
+
+def build_extract(arg_list, filenames):
+    '''Returns an extract stage which ignores its input rows and generates the
+    rows of the given xml files, along with any given as stage arguments.'''
+    import pipeline.extract as extract
+    optlist, args = getopt.getopt(arg_list, 'd:c:s:r:t:p:q:m:a:')
+    in_directory = ''
+    for o, a in optlist:
+        if o == '-d':
+            in_directory = a.rstrip('/') + '/'
+    filenames, filters = extract.parse_selection(optlist, args + filenames)
+
+    def stage(in_rows, splitter):
+        return (extract.extract_files(filenames, in_directory, False, *filters), '\t')
+    return stage
+
+
+def build_clean(arg_list, filenames):
+    '''Returns a clean stage, which takes no options.'''
+    import pipeline.clean as clean
+    getopt.getopt(arg_list, '')
+
+    def stage(in_rows, splitter):
+        return ((clean.clean_row(row) for row in in_rows), ' ')
+    return stage
+
+
+def build_translate(arg_list, filenames):
+    '''Returns a translate stage, loading its dictionary once when the stage
+    is built. Accepts the -d, -s, and -p options of translate.py.'''
+    import pipeline.translate as translate
+    optlist, args = getopt.getopt(arg_list, 'pd:s:')
+    dict_filename = translate.std_dict_path
+    separator = ':'
+    modernize = True
+    for o, a in optlist:
+        if o == '-d':
+            dict_filename = a
+        if o == '-s':
+            separator = a
+        if o == '-p':
+            modernize = False
+    translation_dict = translate.get_translation_table(dict_filename, separator, modernize)
+
+    def stage(in_rows, splitter):
+        return (translate.translate_rows(in_rows, translation_dict), ' ')
+    return stage
+
+
+def build_combine(arg_list, filenames):
+    '''Returns a combine stage, which must collect all of its input rows before
+    generating any output. Accepts the dictionary arguments and the -d and -s
+    options of combine_characters.py.'''
+    import pipeline.combine_characters as combine_characters
+    optlist, args = getopt.getopt(arg_list, 'd:s:')
+    separator = '\t'
+    for o, a in optlist:
+        if o == '-d':
+            args.append(a)
+        if o == '-s':
+            separator = a
+    if len(args) == 0:
+        raise getopt.GetoptError('combine stage requires one or more dictionary files')
+    character_dicts = [combine_characters.get_character_dictionary(dict_filename, separator) for dict_filename in args]
+
+    def stage(in_rows, splitter):
+        for character_dict in character_dicts:
+            in_rows = combine_characters.combine_rows(in_rows, character_dict, splitter)
+        return (iter(in_rows), splitter)
+    return stage
+
+
+def build_phonemes(arg_list, filenames):
+    '''Returns a phonemes stage, loading its phoneme dictionary once when the
+    stage is built. Accepts the -e, -u, -l, -d, and -s options of phonemes.py.
+    The unknown word counts are written once all rows have passed through.'''
+    import pipeline.phonemes as phonemes
+    optlist, args = getopt.getopt(arg_list, PHONEMES_OPTIONS)
+    preserve_emphasis, unknowns_filename, unknowns_dict, dict_filename, separator = read_phonemes_options(optlist)
+    phoneme_dict = load_phoneme_dict(dict_filename, separator)
+
+    def generate_rows(in_rows):
+        yield from phonemes.get_phoneme_rows(in_rows, preserve_emphasis, phoneme_dict, unknowns_dict)
+        report_unknowns(unknowns_filename, unknowns_dict)
+
+    def stage(in_rows, splitter):
+        return (generate_rows(in_rows), ' ')
+    return stage
+
+
+def build_normalize(arg_list, filenames):
+    '''Returns a normalize stage, loading its spelling index once when the
+    stage is built. Accepts the -e, -d, -s, and -w options of normalize.py.
+    The resolutions of every row passed through so far are written each time
+    the rows run out.'''
+    import pipeline.normalize as normalize
+    optlist, args = getopt.getopt(arg_list, 'e:d:s:w:')
+    dict_filename = ''
+    separator = ','
+    max_distance = 2
+    resolutions_filename = None
+    for o, a in optlist:
+        if o == '-e':
+            if not a.isdigit():
+                raise getopt.GetoptError('edit distance must be a whole number: {}'.format(a))
+            max_distance = int(a)
+        if o == '-d':
+            dict_filename = a
+        if o == '-s':
+            separator = a
+            if separator == '\\t' or separator == '\\\\t':
+                separator = '\t'
+        if o == '-w':
+            resolutions_filename = a
+    index = normalize.load_spelling_index(dict_filename, separator, max_distance)
+    resolutions = {}
+
+    def generate_rows(in_rows):
+        yield from normalize.normalize_rows(in_rows, index, resolutions)
+        if resolutions_filename is not None:
+            with open(resolutions_filename, 'w') as resolutions_file:
+                resolutions_file.write(normalize.format_resolutions(resolutions))
+
+    def stage(in_rows, splitter):
+        return (generate_rows(in_rows), ' ')
+    return stage
+
+
+def build_separate(arg_list, filenames):
+    '''Returns a separate stage, which writes each row to its character file
+    and passes it on unchanged. Accepts the -d and -m options of separate.py.'''
+    import pipeline.separate as separate
+    optlist, args = getopt.getopt(arg_list, 'md:')
+    directory = ''
+    match = False
+    for o, a in optlist:
+        if o == '-d':
+            directory = a.rstrip('/') + '/'
+        if o == '-m':
+            match = True
+
+    def stage(in_rows, splitter):
+        return (separate.separate_rows(in_rows, directory, match, splitter), splitter)
+    return stage
+
+
+def build_store(arg_list, filenames):
+    '''Returns a store stage, which writes a token store of its rows to the
+    file given as its argument and passes them on unchanged.'''
+    import pipeline.store as store
+    optlist, args = getopt.getopt(arg_list, 'f:')
+    for o, a in optlist:
+        if o == '-f':
+            args.append(a)
+    if len(args) != 1:
+        raise getopt.GetoptError('store stage requires a token store file')
+
+    def stage(in_rows, splitter):
+        return (store.store_rows(in_rows, args[0]), splitter)
+    return stage
+
+
+def get_stage_builders():
+    '''Returns a dictionary mapping stage names to their stage builders.'''
+    builders = {}
+    builders['extract'] = build_extract
+    builders['clean'] = build_clean
+    builders['translate'] = build_translate
+    builders['combine'] = build_combine
+    builders['normalize'] = build_normalize
+    builders['phonemes'] = build_phonemes
+    builders['separate'] = build_separate
+    builders['store'] = build_store
+    return builders
+
+
+def split_stage_specs(stage_specs):
+    '''Splits each of the given stage specifications into a list of the stage
+    name and its options, checking that each names a stage, and that only the
+    first is extract. Returns the list of split specifications.'''
+    builders = get_stage_builders()
+    spec_lists = []
+    for spec in stage_specs:
+        spec_list = shlex.split(spec)
+        if len(spec_list) == 0 or spec_list[0] not in builders:
+            raise getopt.GetoptError('unknown stage: {}'.format(spec))
+        if spec_list[0] == 'extract' and len(spec_lists) > 0:
+            raise getopt.GetoptError('extract must be the first stage')
+        spec_lists.append(spec_list)
+    return spec_lists
+
+
+def get_stage_splitter(name, splitter):
+    '''Returns the separator with which the rows written by the given stage
+    are formatted, given the separator of its input rows.'''
+    if name == 'extract':
+        return '\t'
+    if name in ('clean', 'translate', 'normalize', 'phonemes'):
+        return ' '
+    return splitter
+
+
+def build_play_stage(spec_list):
+    '''Returns a function which runs the given stage over the rows of a single
+    play, taking the rows and their separator, and returning a tuple of the
+    list of output rows, their separator, and the unknown word counts of the
+    play (or None, for every stage but phonemes).'''
+    if spec_list[0] == 'phonemes':
+        import pipeline.phonemes as phonemes
+        optlist, args = getopt.getopt(spec_list[1:], PHONEMES_OPTIONS)
+        preserve_emphasis, unknowns_filename, unknowns_dict, dict_filename, separator = read_phonemes_options(optlist)
+        phoneme_dict = load_phoneme_dict(dict_filename, separator)
+
+        def phonemes_stage(in_rows, splitter):
+            play_unknowns = {}
+            out_rows = list(phonemes.get_phoneme_rows(in_rows, preserve_emphasis, phoneme_dict, play_unknowns))
+            return (out_rows, ' ', play_unknowns)
+        return phonemes_stage
+    stage = get_stage_builders()[spec_list[0]](spec_list[1:], [])
+
+    def play_stage(in_rows, splitter):
+        out_rows, splitter = stage(in_rows, splitter)
+        return (list(out_rows), splitter, None)
+    return play_stage
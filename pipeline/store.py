@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+
+import sys
+import getopt
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.tokens as tokens
+import lib.compression as compression
+import lib.profiling as profiling
+
+
+def store_rows(in_rows, store_filename):
+    '''Writes a token store of the words (or phonemes) of each of the given
+    Rows to the given file. Generates each Row unchanged after its words have
+    been written, so that the Rows can continue through the pipeline.'''
+    with open(store_filename, 'wb') as store_file:
+        yield from tokens.store_rows(store_file, in_rows, rows.iter_words)
+
+
+def parse_store(arg_list):
+    '''Parses command-line arguments and runs the core store_rows() function
+    accordingly. Writes the token store to the file given by the -f flag, and
+    writes the original input to stdout so that store.py can be inserted into
+    the pipeline without interrupting it.'''
+    optlist, args = getopt.getopt(arg_list, 'hbf:i:o:')
+    infile = sys.stdin
+    outfile = sys.stdout
+    store_filename = None
+    framed = False
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - store words or phonemes as memory-mapped arrays of token ids
+
+    Usage:
+        python3 {0} -f filename [OPTION]...
+
+    Reads one character's words per line of stdin, as written by translate.py
+    (or clean.py), or one character's phonemes per line, as written by
+    phonemes.py. Thus, stdin is of the form:
+        TCPcode character word [word]...\\n
+
+    Writes a token store, in which each distinct word is given an integer id,
+    and the words of every character are stored as one contiguous array of
+    int32 ids, along with an index of each character's TCP code and name to
+    the position and length of its words in the array. The store can be
+    memory-mapped by lib/tokens.py, which returns each character's words as a
+    NumPy array viewing the file, without reading or splitting any text:
+        store = lib.tokens.TokenStore('plays.ctps')
+        ids = store.get('A08360-1', 'Ham.')
+        words = [store.vocabulary[i] for i in ids]
+
+    Passes stdin to stdout without modification, thus allowing this script to
+    be inserted into the pipeline without interrupting it.
+
+
+    -h              Display this help message.
+
+    -f filename     Specify the file to which to write the token store.
+                        Required.
+
+    -i filename     Specify an input file from which to read rows, rather
+                        than reading from stdin.
+
+    -o filename     Specify an output file to which to write pipeline output
+                        (not the token store, which is always written to file)
+                        rather than writing to stdout.
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-f':
+            store_filename = a
+        if o == '-i':
+            infile = compression.open_file(a, 'r')
+        if o == '-o':
+            outfile = compression.open_file(a, 'w')
+        if o == '-b':
+            framed = True
+    if store_filename is None:
+        print('ERROR: {}: a token store file must be given with -f'.format(sys.argv[0]), file=sys.stderr)
+        exit(1)
+    splitter, in_rows = frames.copy_rows(infile, outfile, framed)
+    for row in profiling.timed(store_rows(in_rows, store_filename), 'core'):
+        pass
+    if infile != sys.stdin:
+        infile.close()
+    if outfile != sys.stdout:
+        outfile.close()
+
+
+def main():
+    profiling.run(parse_store, sys.argv[1:], 'store')
+
+
+if __name__ == '__main__':
+    main()
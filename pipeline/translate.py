@@ -2,19 +2,32 @@
 
 import sys
 import getopt
+import os
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in pipeline directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.profiling as profiling
+import lib.cache as cache
+import lib.table as table
+import lib.compression as compression
 
-std_dict_path = '../dicts/standardizer_dictionary.txt'
+std_dict_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dicts', 'standardizer_dictionary.txt')
 
 
-def get_translation_dictionary(dict_filename=std_dict_path, separator=':', modernize=True):
-    '''Loads a translation dictionary from the given dictionary file, which
+def get_translation_dictionaries(dict_filename=std_dict_path, separator=':'):
+    '''Loads both translation dictionaries from the given dictionary file, which
     should have lines of the form:
         old_english:modern_english:priority
     where priority is 0 if the translation should always occur (ie. 'fore),
     1 if the replacement preserves Old English word forms (ie. abideth), and
-    2 if the replacement translates into odern English (ie. amogst).
-    Returns the dictionary.'''
-    translation_dict = {}
+    2 if the replacement translates into odern English (ie. amogst). Lines with
+    any other priority, such as the ? of the unreviewed suggestions written by
+    normalize.py -w, are ignored.
+    Returns a tuple of the dictionary which modernizes words, including every
+    priority, and the dictionary which preserves Old English word forms,
+    leaving out priority 2, both from a single reading of the file.'''
+    modern_dict = {}
+    preserved_dict = {}
     with open(dict_filename, 'r') as dict_file:
         for line in dict_file:
             line = line.strip()
@@ -24,16 +37,82 @@ def get_translation_dictionary(dict_filename=std_dict_path, separator=':', moder
                 key = line_elements[0].replace(',', ' ')
                 val = line_elements[1].replace(',', ' ')
                 if len(line_elements) == 2:
-                    translation_dict[key] = val
+                    modern_dict[key] = val
+                    preserved_dict[key] = val
                 else:
                     prio = line_elements[2]
-                    if prio == '0':
-                        translation_dict[key] = val
-                    elif modernize and prio == '2':
-                        translation_dict[key] = val
-                    elif prio == '1':
-                        translation_dict[key] = val
-    return translation_dict
+                    if prio == '0' or prio == '1':
+                        modern_dict[key] = val
+                        preserved_dict[key] = val
+                    elif prio == '2':
+                        modern_dict[key] = val
+    return (modern_dict, preserved_dict)
+
+
+def get_translation_dictionary(dict_filename=std_dict_path, separator=':', modernize=True):
+    '''Loads a translation dictionary from the given dictionary file, as
+    described by get_translation_dictionaries(), which modernizes words if
+    modernize is True, and otherwise preserves Old English word forms.
+    Returns the dictionary.'''
+    modern_dict, preserved_dict = get_translation_dictionaries(dict_filename, separator)
+    if modernize:
+        return modern_dict
+    return preserved_dict
+
+
+def get_translation_table(dict_filename=std_dict_path, separator=':', modernize=True):
+    '''Returns the translation dictionary of get_translation_dictionary() as a
+    compiled table, which is memory-mapped rather than loaded, and so is
+    shared by every process using the same dictionary.'''
+    fingerprint = cache.fingerprint(cache.hash_file(dict_filename), separator, modernize)
+    return table.load_table('translate', fingerprint, lambda: get_translation_dictionary(dict_filename, separator, modernize))
+
+
+def translate_rows(in_rows, translation_dict):
+    '''Generates a translated Row for each of the given Rows, where each word
+    of the character's speech which is in the translation dictionary is
+    substituted with its translation.'''
+    for row in in_rows:
+        row_list = []
+        for word in rows.iter_words(row):
+            if word in translation_dict:
+                row_list.append(translation_dict[word])
+            else:
+                row_list.append(word)
+        yield rows.Row(row.code, row.character, row_list)
+
+
+def get_translation_tables(dict_filename=std_dict_path, separator=':'):
+    '''Returns a tuple of the compiled tables of the modernizing and the
+    preserving translation dictionaries, which are the same tables as
+    get_translation_table() returns, reading the dictionary file at most once
+    to compile both.'''
+    loaded = []
+
+    def get_dicts():
+        if not loaded:
+            loaded.extend(get_translation_dictionaries(dict_filename, separator))
+        return loaded
+    file_hash = cache.hash_file(dict_filename)
+    modern_table = table.load_table('translate', cache.fingerprint(file_hash, separator, True), lambda: get_dicts()[0])
+    preserved_table = table.load_table('translate', cache.fingerprint(file_hash, separator, False), lambda: get_dicts()[1])
+    return (modern_table, preserved_table)
+
+
+def translate_variants(in_rows, translation_dicts):
+    '''Generates a tuple of translated Rows for each of the given Rows, one
+    for each of the given translation dictionaries, as translate_rows() would
+    generate them. Each distinct word is looked up in the dictionaries only
+    once, and its translations are remembered for the rest of the rows.'''
+    translations = {}
+    indices = range(len(translation_dicts))
+    for row in in_rows:
+        row_translations = []
+        for word in rows.iter_words(row):
+            if word not in translations:
+                translations[word] = tuple(translation_dict[word] if word in translation_dict else word for translation_dict in translation_dicts)
+            row_translations.append(translations[word])
+        yield tuple(rows.Row(row.code, row.character, [translation[i] for translation in row_translations]) for i in indices)
 
 
 def translate(in_string, dict_filename=std_dict_path, separator=':', modernize=True):
@@ -45,32 +124,22 @@ def translate(in_string, dict_filename=std_dict_path, separator=':', modernize=T
     the character's speech. Returns an output string of the same form, with
     words which are in the dictionary substituted with their translations.'''
     translation_dict = get_translation_dictionary(dict_filename, separator, modernize)
-    out_list = []
-    for row in in_string.strip().split('\n'):
-        words = row.split()
-        assert(len(words) >= 2)
-        TCPcode = words[0]
-        character = words[1]
-        row_list = [TCPcode, character]
-        for word in words[2:]:
-            if word in translation_dict:
-                row_list.append(translation_dict[word])
-            else:
-                row_list.append(word)
-        out_list.append(' '.join(row_list))
-    return '\n'.join(out_list) + '\n'
+    translated_rows = translate_rows(rows.parse_word_rows(in_string), translation_dict)
+    return rows.format_rows(translated_rows, ' ')
 
 
 def parse_translate(arg_list):
     '''Parses command-line arguments and runs the core translate() function
     accordingly. Writes the output to stdout unless an output file is specified
     using the -o flag.'''
-    optlist, args = getopt.getopt(arg_list, 'hpi:o:d:s:')
+    optlist, args = getopt.getopt(arg_list, 'hbpi:o:d:s:w:')
     infile = sys.stdin
     outfile = sys.stdout
+    variant_file = None
     dict_filename = std_dict_path
     separator = ':'
     modernize = True
+    framed = False
     for o, a in optlist:
         if o == '-h':
             print('''
@@ -123,21 +192,52 @@ Usage information for {0}
     -s separator    Specify the separator used by the dictionary file.
 
     -p              Preserve Old English word forms, such as "altereth".
+
+    -w filename     Also write the other translation to the given file, in the
+                        same pass: the translation which preserves Old English
+                        word forms, or, if -p is given, the modernized
+                        translation. Both dictionaries are built from a single
+                        reading of the dictionary file, and each row is split
+                        into words only once, so this is faster than running
+                        the script twice.
+                        Ex:
+                            $ python3 {0} -i clean.txt -o modern.txt \\
+                              -w preserved.txt
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
 '''.format(sys.argv[0]))
             exit(0)
         if o == '-i':
-            infile = open(a, 'r')
+            infile = compression.open_file(a, 'r')
         if o == '-o':
-            outfile = open(a, 'w')
+            outfile = compression.open_file(a, 'w')
         if o == '-d':
             dict_filename = a
         if o == '-s':
             separator = a
         if o == '-p':
             modernize = False
-    in_string = infile.read()
-    out_string = translate(in_string, dict_filename, separator, modernize)
-    outfile.write(out_string)
+        if o == '-w':
+            variant_file = compression.open_file(a, 'w')
+        if o == '-b':
+            framed = True
+    if variant_file is not None:
+        with profiling.phase('load'):
+            translation_dicts = get_translation_tables(dict_filename, separator)
+        if not modernize:
+            translation_dicts = translation_dicts[::-1]
+        splitter, in_rows = frames.read_rows(infile)
+        translated_rows = profiling.timed(translate_variants(in_rows, translation_dicts), 'core')
+        frames.write_variants([outfile, variant_file], translated_rows, ' ', framed)
+        variant_file.close()
+    else:
+        with profiling.phase('load'):
+            translation_dict = get_translation_table(dict_filename, separator, modernize)
+        splitter, in_rows = frames.read_rows(infile)
+        translated_rows = profiling.timed(translate_rows(in_rows, translation_dict), 'core')
+        frames.write_rows(outfile, translated_rows, ' ', framed)
     if infile != sys.stdin:
         infile.close()
     if outfile != sys.stdout:
@@ -145,7 +245,7 @@ Usage information for {0}
 
 
 def main():
-    parse_translate(sys.argv[1:])
+    profiling.run(parse_translate, sys.argv[1:], 'translate')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,32 @@
+import os
+import sys
+import subprocess
+import pytest
+
+project_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(project_dir)  # Add project directory to path
+
+plays_dir = os.path.join(project_dir, 'data', 'plays_of_interest')
+# Small plays, so that the scripts run quickly
+SMALL_PLAYS = ['A03175.xml', 'A12030.xml', 'A12131.xml', 'A29238.xml']
+
+
+def run_script(script, args, stdin=b'', cwd=None, check=True):
+    '''Runs the given script, relative to the project directory, with the
+    given arguments and binary input. Returns the CompletedProcess, with its
+    stdout and stderr as bytes, asserting that it succeeded if check is
+    True.'''
+    result = subprocess.run([sys.executable, os.path.join(project_dir, script)] + args, input=stdin, cwd=cwd, capture_output=True)
+    if check:
+        assert result.returncode == 0, result.stderr.decode('utf-8', 'replace')
+    return result
+
+
+@pytest.fixture
+def script():
+    return run_script
+
+
+@pytest.fixture
+def small_plays():
+    return [os.path.join(plays_dir, filename) for filename in SMALL_PLAYS]
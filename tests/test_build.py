@@ -0,0 +1,35 @@
+'''Incremental builds match the scripts, and rebuild only what changed.'''
+
+import os
+from conftest import project_dir
+
+BENCH_DICT = os.path.join(project_dir, 'dicts', 'bench_phoneme_dict.txt')
+STAGES = ['-s', 'clean', '-s', 'translate', '-s', 'phonemes -d {}'.format(BENCH_DICT)]
+
+
+def run_scripts(script, small_plays):
+    output = script('pipeline/extract.py', small_plays).stdout
+    for stage, args in [('clean', []), ('translate', []), ('phonemes', ['-d', BENCH_DICT])]:
+        result = script('pipeline/{}.py'.format(stage), args, stdin=output)
+        output = result.stdout
+    return (output, result.stderr)
+
+
+def test_build_matches_scripts(script, small_plays, tmp_path):
+    expected = run_scripts(script, small_plays)
+    cache_dir = str(tmp_path / 'cache')
+    result = script('pipeline/build.py', ['-c', cache_dir] + STAGES + small_plays)
+    assert result.stdout == expected[0]
+    assert result.stderr.startswith(expected[1])
+    assert b'phonemes: rebuilt 4 of 4 plays' in result.stderr
+    result = script('pipeline/build.py', ['-c', cache_dir] + STAGES + small_plays)
+    assert result.stdout == expected[0]
+    assert b'clean: rebuilt 0 of 4 plays' in result.stderr
+    assert b'phonemes: rebuilt 0 of 4 plays' in result.stderr
+
+
+def test_build_rejects_stages_which_write_files(script, small_plays, tmp_path):
+    result = script('pipeline/build.py', ['-c', str(tmp_path / 'cache'), '-s', 'clean', '-s', 'separate -d out'] + small_plays, check=False)
+    assert result.returncode == 1
+    assert result.stderr.startswith(b'ERROR: ')
+    assert b'separate' in result.stderr
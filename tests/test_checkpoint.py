@@ -0,0 +1,45 @@
+'''Checkpointed runs match plain runs, and resume where they were interrupted.'''
+
+import os
+
+STAGES = ['-s', 'extract', '-s', 'clean', '-s', 'translate']
+
+
+def test_checkpointed_run_matches_run(script, small_plays, tmp_path):
+    expected = script('pipeline/run.py', STAGES + small_plays).stdout
+    checkpoint_dir = tmp_path / 'checkpoint'
+    assert script('pipeline/run.py', ['-k', str(checkpoint_dir)] + STAGES + small_plays).stdout == expected
+    manifest = (checkpoint_dir / 'manifest.txt').read_text().splitlines()
+    assert manifest[1:] == ['A03175', 'A12030', 'A12131', 'A29238']
+
+
+def test_resume_skips_completed_plays(script, small_plays, tmp_path):
+    expected = script('pipeline/run.py', STAGES + small_plays).stdout
+    checkpoint_dir = tmp_path / 'checkpoint'
+    script('pipeline/run.py', ['-k', str(checkpoint_dir)] + STAGES + small_plays)
+    # Interrupted after the first play, while recording the second
+    manifest_filename = checkpoint_dir / 'manifest.txt'
+    manifest = manifest_filename.read_text().splitlines()
+    manifest_filename.write_text('\n'.join(manifest[:2]) + '\nA120')
+    for code in ['A12030', 'A12131', 'A29238']:
+        os.remove(str(checkpoint_dir / (code + '.ctpf')))
+    first_segment = str(checkpoint_dir / 'A03175.ctpf')
+    os.utime(first_segment, (0, 0))
+    result = script('pipeline/run.py', ['-k', str(checkpoint_dir), '--resume'] + STAGES + small_plays)
+    assert result.stdout == expected
+    assert os.stat(first_segment).st_mtime == 0  # Not run again
+    assert manifest_filename.read_text().splitlines()[1:] == ['A03175', 'A120', 'A12030', 'A12131', 'A29238']
+    # Resumed again, every play is complete
+    os.utime(first_segment, (0, 0))
+    for code in ['A12030', 'A12131', 'A29238']:
+        os.utime(str(checkpoint_dir / (code + '.ctpf')), (0, 0))
+    assert script('pipeline/run.py', ['-k', str(checkpoint_dir), '--resume'] + STAGES + small_plays).stdout == expected
+    assert all(segment.stat().st_mtime == 0 for segment in checkpoint_dir.glob('*.ctpf'))
+
+
+def test_resume_with_other_stages(script, small_plays, tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoint')
+    script('pipeline/run.py', ['-k', checkpoint_dir] + STAGES + small_plays)
+    result = script('pipeline/run.py', ['-k', checkpoint_dir, '-r', '-s', 'extract', '-s', 'clean'] + small_plays, check=False)
+    assert result.returncode == 1
+    assert result.stderr.startswith(b'ERROR: ')
@@ -0,0 +1,79 @@
+'''Compressed files read back as they were written.'''
+
+import gc
+import sys
+import subprocess
+import pytest
+import lib.compression as compression
+from conftest import project_dir
+
+TEXT = ''.join('A00011-1\tCharacter {}\t<l>ſpeech {}</l>\n'.format(i, i * i) for i in range(20000))
+
+
+@pytest.mark.parametrize('extension', ['', '.gz', '.bz2', '.xz'])
+def test_text_round_trip(tmp_path, extension):
+    filename = str(tmp_path / ('rows.tsv' + extension))
+    with compression.open_file(filename, 'w', encoding='utf-8') as outfile:
+        outfile.write(TEXT)
+    with compression.open_file(filename, 'r', encoding='utf-8') as infile:
+        assert infile.read() == TEXT
+    with compression.open_file(filename, 'rb') as infile:
+        assert infile.read() == TEXT.encode('utf-8')
+    if extension:
+        with open(filename, 'rb') as infile:
+            assert infile.read() != TEXT.encode('utf-8')
+
+
+@pytest.mark.parametrize('extension', ['.gz', '.xz'])
+def test_binary_round_trip_in_small_writes(tmp_path, extension):
+    filename = str(tmp_path / ('rows.bin' + extension))
+    data = TEXT.encode('utf-8')
+    with compression.open_file(filename, 'wb') as outfile:
+        for offset in range(0, len(data), 1000):
+            outfile.write(data[offset:offset + 1000])
+    with compression.open_file(filename, 'rb') as infile:
+        assert infile.read() == data
+
+
+def test_write_error_is_raised(tmp_path):
+    # An error on the compressing thread is raised in the writing thread
+    class Failing(object):
+        def write(self, data):
+            raise OSError('disk full')
+
+        def close(self):
+            pass
+    writer = compression.CompressingWriter(Failing(), 'failing')
+    with pytest.raises(OSError):
+        for _ in range(compression.QUEUE_SIZE * 4):
+            writer.write(b'x' * 100)
+        writer.close()
+
+
+@pytest.mark.parametrize('filename, stripped', [
+        ('A00011.xml.gz', 'A00011.xml'),
+        ('dir/A00011.xml.bz2', 'dir/A00011.xml'),
+        ('A00011.xml.xz', 'A00011.xml'),
+        ('A00011.xml', 'A00011.xml'),
+        ('A00011.tgz', 'A00011.tgz'),
+        ])
+def test_strip_extension(filename, stripped):
+    assert compression.strip_extension(filename) == stripped
+
+
+def test_unclosed_file_is_written_at_exit(tmp_path):
+    # The file is referenced by a global, so it is not closed until exit
+    filename = str(tmp_path / 'rows.tsv.gz')
+    code = 'import sys, lib.compression as compression; outfile = compression.open_file({!r}, "wb"); outfile.write(sys.stdin.buffer.read())'.format(filename)
+    subprocess.run([sys.executable, '-c', code], input=TEXT.encode('utf-8'), cwd=project_dir, check=True)
+    with compression.open_file(filename, 'r', encoding='utf-8') as infile:
+        assert infile.read() == TEXT
+
+
+def test_closed_files_are_not_kept(tmp_path):
+    for i in range(10):
+        with compression.open_file(str(tmp_path / 'rows{}.tsv.xz'.format(i)), 'w') as outfile:
+            outfile.write(TEXT[:100])
+    del outfile
+    gc.collect()
+    assert len(compression.writers) == 0
@@ -0,0 +1,66 @@
+'''Jobs run by the daemon match the scripts, and reload changed dictionaries.'''
+
+import os
+import sys
+import time
+import subprocess
+import pytest
+import lib.rows as rows
+import pipeline.clean as clean
+import pipeline.daemon as daemon
+from conftest import project_dir
+
+BENCH_DICT = os.path.join(project_dir, 'dicts', 'bench_phoneme_dict.txt')
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    socket_path = str(tmp_path / 'ctp.sock')
+    process = subprocess.Popen([sys.executable, os.path.join(project_dir, 'pipeline', 'daemon.py'), '-s', socket_path], stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+    yield socket_path
+    process.terminate()
+    process.wait()
+
+
+def test_client_matches_scripts(script, small_plays, socket_path):
+    for flags in [[], ['-b']]:
+        stdin = script('pipeline/extract.py', flags + small_plays).stdout
+        for stage, args in [('clean', flags), ('translate', flags), ('phonemes', flags + ['-d', BENCH_DICT])]:
+            expected = script('pipeline/{}.py'.format(stage), args, stdin=stdin)
+            result = script('pipeline/client.py', ['-s', socket_path, stage] + args, stdin=stdin)
+            assert result.stdout == expected.stdout
+            stdin = result.stdout
+
+
+def test_changed_dictionary_is_reloaded(script, socket_path, tmp_path):
+    dict_filename = tmp_path / 'dict.txt'
+
+    def translate():
+        return script('pipeline/client.py', ['-s', socket_path, 'translate', '-d', str(dict_filename)], stdin=b'A00011-1 Bellario haue it\n').stdout
+    dict_filename.write_text('haue:have:0\n')
+    assert translate() == b'A00011-1 Bellario have it\n'
+    dict_filename.write_text('haue:hath:0\n')
+    assert translate() == b'A00011-1 Bellario hath it\n'
+
+
+def test_conversion_dict_is_stamped_and_reloaded(monkeypatch):
+    loads = []
+
+    def load_conversion_dict():
+        loads.append(None)
+        return {'ſ': 'z'}
+    monkeypatch.setattr(clean, 'load_conversion_dict', load_conversion_dict)
+    monkeypatch.setattr(daemon, 'dictionaries', {})
+    for _ in range(2):
+        framed, variant_filename, job = daemon.load_job('clean', [], project_dir)
+    assert len(loads) == 1
+    assert daemon.dictionaries[('clean',)][1] == [daemon.get_file_stamp(clean.conversion_dict.__file__)]
+    daemon.reload_dictionaries()
+    framed, variant_filename, job = daemon.load_job('clean', [], project_dir)
+    assert len(loads) == 2
+    row = next(job([rows.Row('A00011-1', 'First Lord', ['<ns0:l xmlns:ns0="http://www.tei-c.org/ns/1.0">ſo</ns0:l>'])], sys.stderr))
+    assert (row.character, row.elements) == ('First-Lord', ['zo'])
@@ -0,0 +1,30 @@
+'''Parsing only the front matter finds the same dramatis personae.'''
+
+import os
+import tools.extract_dramatis_personae as dramatis_personae
+from conftest import plays_dir
+
+LATE_PLAY = os.path.join(plays_dir, 'A01513.xml')  # Has a second div after its first speech
+
+
+def test_fast_matches_whole_parse(script, small_plays):
+    args = small_plays + [LATE_PLAY]
+    assert script('tools/extract_dramatis_personae.py', ['-f'] + args).stdout == script('tools/extract_dramatis_personae.py', args).stdout
+
+
+def test_late_plays_are_parsed_whole():
+    late_codes = dramatis_personae.read_late_codes()
+    assert 'A01513' in late_codes
+    assert len(dramatis_personae.read_personae_divs(LATE_PLAY, True, late_codes)) == 2
+    assert len(dramatis_personae.read_personae_divs(LATE_PLAY, True, set())) == 1
+
+
+def test_rest_of_file_is_not_read(small_plays, tmp_path):
+    # The end of the file is cut off, which is an error only if it is parsed
+    filename = str(tmp_path / 'A29238.xml')
+    with open(small_plays[3], 'rb') as infile:
+        data = infile.read()
+    with open(filename, 'wb') as outfile:
+        outfile.write(data[:len(data) // 2])
+    divs = dramatis_personae.parse_front(filename)
+    assert [div.get('type') for div in divs] == ['dramatis_personae']
@@ -0,0 +1,81 @@
+'''Corpus estimates from stratified samples of plays, characters, or lines.'''
+
+import os
+import csv
+import pytest
+import lib.rows as rows
+import pipeline.estimate as estimate
+from conftest import project_dir
+
+BENCH_DICT = os.path.join(project_dir, 'dicts', 'bench_phoneme_dict.txt')
+PHONEME_DICT = {'the': ['DH', 'AH0'], 'king': ['K', 'IH1', 'NG']}
+ROWS = [
+        rows.Row('A00011-1', 'Bellario', ['The king', 'haue']),
+        rows.Row('A00011-2', 'Bellario', ['the']),
+        rows.Row('A00012-1', 'Arbaces', ['thinke the king']),
+        ]
+GENRES = {'A00011': 'TR', 'A00012': 'CO'}
+
+
+def test_count_clusters():
+    assert estimate.count_clusters(ROWS, 'character', PHONEME_DICT) == {
+            ('A00011-1', 'Bellario'): [3, 1],
+            ('A00011-2', 'Bellario'): [1, 0],
+            ('A00012-1', 'Arbaces'): [3, 1],
+            }
+    assert estimate.count_clusters(ROWS, 'play', PHONEME_DICT) == {'A00011': [4, 1], 'A00012': [3, 1]}
+
+
+def test_estimate_total():
+    # Each cluster stands for 2, with half of the population sampled
+    total, variance = estimate.estimate_total([[2, 4], [5]], 2, 0.5)
+    assert total == 22
+    assert variance == pytest.approx(2 * 2 * 0.5 * 2 * 2)
+    assert estimate.estimate_total([[2, 4], [5]], 1, 0) == (11, 0)
+
+
+def test_estimate_ratio():
+    ratio, variance = estimate.estimate_ratio([[1, 3]], [[2, 4]], 2, 0.5)
+    assert ratio == pytest.approx(4 / 6)
+    assert variance > 0
+    assert estimate.estimate_ratio([[1]], [[0]], 2, 0.5) == (0.0, 0.0)
+
+
+def test_whole_corpus_has_no_error():
+    clusters = estimate.count_clusters(ROWS, 'character', PHONEME_DICT)
+    estimates = {(name, genre): (value, error) for name, genre, value, error in estimate.get_estimates(clusters, GENRES, 'character', 1.0)}
+    assert estimates[('sampled_characters', 'all')] == (3, 0)
+    assert estimates[('tokens', 'all')] == (7, 0)
+    assert estimates[('tokens', 'TR')] == (4, 0)
+    assert estimates[('tokens_per_character', 'TR')] == (2, 0)
+    assert estimates[('unknown_tokens', 'CO')] == (1, 0)
+    assert estimates[('unknown_rate', 'all')] == (pytest.approx(2 / 7), 0)
+
+
+def test_sample_is_scaled():
+    clusters = estimate.count_clusters(ROWS, 'play', PHONEME_DICT)
+    estimates = {(name, genre): (value, error) for name, genre, value, error in estimate.get_estimates(clusters, GENRES, 'play', 0.25)}
+    assert estimates[('sampled_plays', 'all')] == (2, 0)
+    assert estimates[('tokens', 'all')][0] == pytest.approx(28)
+    assert estimates[('tokens_per_play', 'all')][0] == pytest.approx(3.5)
+    assert estimates[('unknown_rate', 'all')][0] == pytest.approx(2 / 7)
+    # One play per genre gives no variance within either genre
+    assert estimates[('tokens', 'TR')][1] == 0
+
+
+def test_script(script):
+    stdin = ''.join(rows.format_row(row, ' ') + '\n' for row in ROWS).encode('utf-8')
+    result = script('pipeline/estimate.py', ['-d', BENCH_DICT, '-a', 'character:0.5:7'], stdin=stdin)
+    lines = list(csv.reader(result.stdout.decode('utf-8').splitlines()))
+    assert lines[0] == estimate.COLUMNS
+    values = {(line[0], line[1]): [float(value) for value in line[2:]] for line in lines[1:]}
+    assert values[('tokens', 'all')][0] == 14
+    estimated, error, lower, upper = values[('tokens', 'all')]
+    assert lower == pytest.approx(estimated - estimate.Z * error, abs=1e-3)
+    assert upper == pytest.approx(estimated + estimate.Z * error, abs=1e-3)
+
+
+def test_script_rejects_invalid_sample(script):
+    result = script('pipeline/estimate.py', ['-d', BENCH_DICT, '-a', 'act:0.5'], check=False)
+    assert result.returncode == 1
+    assert result.stderr.startswith(b'ERROR: ')
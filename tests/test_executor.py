@@ -0,0 +1,61 @@
+'''Pipelines keep rows in order, and cancel every stage when they stop early.'''
+
+import time
+import itertools
+import threading
+import pytest
+import lib.executor as executor
+
+
+def double(batch):
+    return [row * 2 for row in batch]
+
+
+def fail_at(limit):
+    def stage(rows):
+        for row in rows:
+            if row >= limit:
+                raise ValueError('row {}'.format(row))
+            yield row
+    return stage
+
+
+def wait_for_threads(threads):
+    # Stages give up within executor.POLL_INTERVAL once cancelled
+    deadline = time.perf_counter() + 5
+    while threading.active_count() > threads and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return threading.active_count()
+
+
+def test_rows_are_kept_in_order():
+    pipeline = executor.Pipeline(queue_size=2, batch_size=3)
+    pipeline.add_source('source', lambda: range(1000))
+    pipeline.add_map('double', double, workers=4)
+    pipeline.add_stream('stream', lambda rows: (row + 1 for row in rows))
+    assert list(pipeline.run()) == [row * 2 + 1 for row in range(1000)]
+    metrics = pipeline.get_metrics()
+    assert [stage['output_queue']['rows'] for stage in metrics['stages']] == [1000, 1000, 1000]
+
+
+def test_error_cancels_upstream_stages():
+    threads = threading.active_count()
+    pipeline = executor.Pipeline(queue_size=2, batch_size=4)
+    pipeline.add_source('source', lambda: itertools.count())  # Never done
+    pipeline.add_map('double', double, workers=2)
+    pipeline.add_stream('fail', fail_at(1000))
+    with pytest.raises(ValueError):
+        for row in pipeline.run():
+            pass
+    assert wait_for_threads(threads) == threads
+
+
+def test_abandoned_run_cancels_every_stage():
+    threads = threading.active_count()
+    pipeline = executor.Pipeline(queue_size=2, batch_size=4)
+    pipeline.add_source('source', lambda: itertools.count())
+    pipeline.add_stream('stream', lambda rows: (row + 1 for row in rows))
+    rows = pipeline.run()
+    assert [next(rows) for _ in range(10)] == list(range(1, 11))
+    rows.close()
+    assert wait_for_threads(threads) == threads
@@ -0,0 +1,30 @@
+'''Plays selected by -c and -q are found whether or not they are compressed.'''
+
+import os
+import gzip
+import shutil
+from conftest import plays_dir, SMALL_PLAYS
+
+
+def compress_plays(directory):
+    # The first play is left uncompressed, and the others are compressed
+    directory.mkdir()
+    shutil.copy(os.path.join(plays_dir, SMALL_PLAYS[0]), str(directory))
+    for filename in SMALL_PLAYS[1:]:
+        with open(os.path.join(plays_dir, filename), 'rb') as infile, gzip.open(str(directory / (filename + '.gz')), 'wb') as outfile:
+            shutil.copyfileobj(infile, outfile)
+
+
+def test_selected_plays_may_be_compressed(script, small_plays, tmp_path):
+    expected = script('pipeline/extract.py', small_plays).stdout
+    directory = tmp_path / 'plays'
+    compress_plays(directory)
+    codes = [filename[:-len('.xml')] for filename in SMALL_PLAYS]
+    csv_filename = tmp_path / 'codes.csv'
+    csv_filename.write_text('TCP\n' + '\n'.join(codes) + '\n')
+    result = script('pipeline/extract.py', ['-d', str(directory), '-c', str(csv_filename)])
+    assert result.stdout == expected
+    query = ' or '.join('code=' + code for code in codes)
+    result = script('pipeline/extract.py', ['-d', str(directory), '-q', query])
+    assert result.stdout == expected
+    assert result.stderr == b''
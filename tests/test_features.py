@@ -0,0 +1,68 @@
+'''Per-character word counts, from rows or a token store.'''
+
+import os
+import csv
+import numpy
+import lib.rows as rows
+import lib.tokens as tokens
+import pipeline.features as features
+from conftest import project_dir
+
+METADATA = os.path.join(project_dir, 'data', 'VEP_metadata.csv')
+ROWS = [
+        rows.Row('A00011-1', 'Bellario', ['and the king', 'and i']),
+        rows.Row('A00011-1', 'Philaster', ['the king the', 'queen']),
+        rows.Row('A00011-2', 'Bellario', []),
+        ]
+
+
+def get_counted(words, counted):
+    return [(code, character, dict(zip(words + [features.TOTAL_COLUMN], counts.tolist()))) for code, character, counts in counted]
+
+
+def test_top_words():
+    words, counted = features.get_features(ROWS, top=3)
+    # Equally frequent words are in the order they were first read
+    assert words == ['the', 'and', 'king']
+    assert get_counted(words, counted) == [
+            ('A00011-1', 'Bellario', {'the': 1, 'and': 2, 'king': 1, features.TOTAL_COLUMN: 5}),
+            ('A00011-1', 'Philaster', {'the': 2, 'and': 0, 'king': 1, features.TOTAL_COLUMN: 4}),
+            ('A00011-2', 'Bellario', {'the': 0, 'and': 0, 'king': 0, features.TOTAL_COLUMN: 0}),
+            ]
+
+
+def test_given_words():
+    words, counted = features.get_features(ROWS, words=['queen', 'and', 'absent'])
+    assert words == ['queen', 'and', 'absent']
+    assert [counts.tolist() for code, character, counts in counted] == [[0, 2, 0, 5], [1, 0, 0, 4], [0, 0, 0, 0]]
+
+
+def test_metadata_words():
+    prefix, words = features.load_metadata_words(METADATA)
+    assert prefix == 'tcp_top_100'
+    assert len(words) == 100
+    assert words[:3] == ['and', 'of', 'to']
+
+
+def test_store_matches_rows(tmp_path):
+    store_filename = str(tmp_path / 'rows.ctpt')
+    with open(store_filename, 'wb') as store_file:
+        tokens.write_store(store_file, ROWS, rows.iter_words)
+    store = tokens.TokenStore(store_filename)
+    for words in [None, ['queen', 'and', 'absent']]:
+        expected_words, expected = features.get_features(ROWS, words=words, top=3)
+        store_words, counted = features.get_features(store=store, words=words, top=3)
+        assert store_words == expected_words
+        assert get_counted(store_words, counted) == get_counted(expected_words, expected)
+
+
+def test_script_writes_csv_and_matrix(script, tmp_path):
+    matrix_filename = str(tmp_path / 'features.npy')
+    stdin = ''.join(rows.format_row(row, '\t') + '\n' for row in ROWS[:2]).encode('utf-8')
+    result = script('pipeline/features.py', ['-m', METADATA, '-n', matrix_filename], stdin=stdin)
+    lines = list(csv.reader(result.stdout.decode('utf-8').splitlines()))
+    assert lines[0][:3] == ['TCP', 'character', 'tcp_top_100:and']
+    assert lines[0][-1] == 'tcp_top_100:' + features.TOTAL_COLUMN
+    assert [line[:3] for line in lines[1:]] == [['A00011-1', 'Bellario', '2'], ['A00011-1', 'Philaster', '0']]
+    matrix = numpy.load(matrix_filename)
+    assert matrix.tolist() == [[int(count) for count in line[2:]] for line in lines[1:]]
@@ -0,0 +1,100 @@
+'''Round trips between pipeline text and the framed format.'''
+
+import io
+import pytest
+import lib.rows as rows
+import lib.frames as frames
+
+ROWS = [
+        rows.Row('A00011-1', 'Bellario', ['<l>Is he not here?</l>', '<l>Tis the Prince</l>']),
+        rows.Row('A00011-1', 'King of Sicily', ['<p>A speech with  two spaces</p>']),
+        rows.Row('A00011-2', 'Ghost', []),
+        rows.Row('A00011-2', 'Ænone', ['ſpeech', 'with', 'long', 'esses']),
+        ]
+
+# Rows of words, as written by the space-separated stages
+WORD_ROWS = [
+        rows.Row('A00011-1', 'Bellario', ['is', 'he', 'not', 'here']),
+        rows.Row('A00011-1', 'King-of-Sicily', ['AH0', 'S', 'P', 'IY1', 'CH']),
+        rows.Row('A00011-2', 'Ghost', []),
+        ]
+
+
+def get_framed(in_rows, separator='\t'):
+    outfile = io.BytesIO()
+    frames.write_frames(outfile, in_rows, separator)
+    return outfile.getvalue()
+
+
+def get_text(in_rows, separator='\t'):
+    outfile = io.StringIO()
+    frames.write_rows(outfile, in_rows, separator)
+    return outfile.getvalue()
+
+
+def test_parse_frames_round_trip():
+    separator, in_rows = frames.parse_frames(get_framed(ROWS))
+    assert separator == '\t'
+    assert list(in_rows) == ROWS
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 64, 1 << 20])
+def test_read_frames_any_block_size(monkeypatch, block_size):
+    # Frames which span blocks, and frames larger than a block, are read whole
+    monkeypatch.setattr(frames, 'BLOCK_SIZE', block_size)
+    data = get_framed(ROWS * 50, ' ')
+    copy = io.BytesIO()
+    separator, in_rows = frames.read_frames(io.BytesIO(data), copy)
+    assert separator == ' '
+    assert list(in_rows) == ROWS * 50
+    assert copy.getvalue() == data
+
+
+def test_read_frames_truncated(monkeypatch):
+    monkeypatch.setattr(frames, 'BLOCK_SIZE', 16)
+    separator, in_rows = frames.read_frames(io.BytesIO(get_framed(ROWS)[:-3]))
+    with pytest.raises(AssertionError):
+        list(in_rows)
+
+
+@pytest.mark.parametrize('in_rows, separator', [(ROWS, '\t'), (WORD_ROWS, ' ')])
+def test_read_rows_text_and_framed_agree(in_rows, separator):
+    text = get_text(in_rows, separator).encode('utf-8')
+    text_separator, from_text = frames.read_rows(io.BufferedReader(io.BytesIO(text)))
+    framed_separator, from_framed = frames.read_rows(io.BufferedReader(io.BytesIO(get_framed(in_rows, separator))))
+    assert text_separator == framed_separator == separator
+    assert list(from_text) == list(from_framed) == in_rows
+
+
+@pytest.mark.parametrize('framed', [False, True])
+def test_copy_rows_text(framed):
+    text = get_text(ROWS).encode('utf-8')
+    outfile = io.BytesIO()
+    separator, in_rows = frames.copy_rows(io.BufferedReader(io.BytesIO(text)), outfile, framed)
+    assert separator == '\t'
+    assert list(in_rows) == ROWS
+    if framed:
+        assert outfile.getvalue() == get_framed(ROWS)
+    else:
+        assert outfile.getvalue() == text
+
+
+def test_copy_rows_framed(monkeypatch):
+    monkeypatch.setattr(frames, 'BLOCK_SIZE', 32)
+    data = get_framed(ROWS * 10)
+    outfile = io.BytesIO()
+    separator, in_rows = frames.copy_rows(io.BufferedReader(io.BytesIO(data)), outfile)
+    assert list(in_rows) == ROWS * 10
+    assert outfile.getvalue() == data
+
+
+def test_write_variants_matches_write_rows():
+    variants = [row._replace(character=row.character.upper()) for row in ROWS]
+    for framed in [False, True]:
+        outfiles = [io.StringIO(), io.StringIO()] if not framed else [io.BytesIO(), io.BytesIO()]
+        frames.write_variants(outfiles, zip(ROWS, variants), '\t', framed)
+        for outfile, in_rows in zip(outfiles, [ROWS, variants]):
+            if framed:
+                assert outfile.getvalue() == get_framed(in_rows)
+            else:
+                assert outfile.getvalue() == get_text(in_rows)
@@ -0,0 +1,43 @@
+'''Character lists, whole or per play, while the input passes through.'''
+
+import lib.rows as rows
+import tools.get_character_list as get_character_list
+
+TEXT = b'A00011-1 Philaster the  king\nA00011-1 Bellario I haue it\nA00012-1 Arbaces the\nA00011-1 Bell away\n'
+
+
+def read_files(directory):
+    return {path.name: path.read_text() for path in directory.iterdir()}
+
+
+def test_match_groups_sorted_names(tmp_path):
+    in_rows = list(rows.parse_rows(TEXT.decode('utf-8'), ' '))
+    out_rows = list(get_character_list.list_rows(iter(in_rows), str(tmp_path), 'names.txt', True))
+    assert out_rows == in_rows
+    # Names sort as the lines of their rows would
+    assert read_files(tmp_path) == {
+            'names_A00011-1.txt': 'Bell\nBellario\nPhilaster\n',
+            'names_A00012-1.txt': 'Arbaces\n',
+            }
+
+
+def test_get_match_filename():
+    assert get_character_list.get_match_filename('names', 'A00011-1') == 'names_A00011-1.txt'
+    assert get_character_list.get_match_filename('dir.v2/names.csv', 'A00011-1') == 'dir.v2/names_A00011-1.csv'
+
+
+def test_script_passes_input_through(script, tmp_path):
+    result = script('tools/get_character_list.py', ['-d', str(tmp_path / 'all')], stdin=TEXT)
+    assert result.stdout == TEXT
+    assert read_files(tmp_path / 'all') == {'characters.txt': 'A00011-1 Philaster\nA00011-1 Bellario\nA00012-1 Arbaces\nA00011-1 Bell\n'}
+
+
+def test_script_match_text_and_framed(script, tmp_path):
+    result = script('tools/get_character_list.py', ['-m', '-d', str(tmp_path / 'text')], stdin=TEXT)
+    assert result.stdout == TEXT
+    framed = script('tools/get_character_list.py', ['-b', '-d', str(tmp_path / 'unused')], stdin=TEXT).stdout
+    assert framed != TEXT
+    result = script('tools/get_character_list.py', ['-m', '-d', str(tmp_path / 'framed')], stdin=framed)
+    assert result.stdout == framed
+    assert read_files(tmp_path / 'framed') == read_files(tmp_path / 'text')
+    assert sorted(read_files(tmp_path / 'text')) == ['characters_A00011-1.txt', 'characters_A00012-1.txt']
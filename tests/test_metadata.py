@@ -0,0 +1,118 @@
+'''Queries of the VEP metadata.'''
+
+import getopt
+import pytest
+import lib.table as table
+import lib.metadata as metadata
+
+PLAYS = [
+        metadata.Play('A00001', 'Fletcher, John', 'Love and Honor', 'TC', 1634, 1649, 20000),
+        metadata.Play('A00002', 'Jonson, Ben', 'Volpone, or The Fox', 'CO', 1606, 1607, 25000),
+        metadata.Play('A00003', 'Anonymous', "The Maid's Tragedy", 'TR', None, 1619, 18000),
+        metadata.Play('A00004', 'Fletcher, John', 'The Chances', 'CO', 1617, None, None),
+        ]
+
+CSV = '''TCP,author,title,genre,date of writing,date of text used,tcp_top_100:# Word Tokens
+A00001,"Fletcher, John",Love and Honor,TC,1634,1649,20000
+A00002,"Jonson, Ben","Volpone, or The Fox",CO,1606,1607,25000
+A00003,Anonymous,The Maid's Tragedy,TR,,1619,18000
+A00004,"Fletcher, John",The Chances,CO,1617,,
+A00005,"Marlowe, Christopher",Dido,TR,1594,1594,12000
+A00006,"Heywood, Thomas",The Golden Age,HI,1610,1611,15000
+A00006,"Heywood, Thomas",The Silver Age,CO,1612,1613,16000
+'''
+
+
+def select(query):
+    matches = metadata.parse_query(query)
+    return [play.code for play in PLAYS if matches(play)]
+
+
+@pytest.mark.parametrize('query, codes', [
+        ('genre=CO', ['A00002', 'A00004']),
+        ('genre=CO and date<1610', ['A00002']),
+        ('genre=TR or genre=CO and date>=1610', ['A00003', 'A00004']),
+        ('author~fletcher', ['A00001', 'A00004']),
+        ('date!=1634', ['A00002', 'A00003', 'A00004']),
+        ('printed<=1619', ['A00002', 'A00003']),
+        ('tokens>19000', ['A00001', 'A00002']),
+        ('date~16', ['A00001', 'A00002', 'A00004']),
+        ('code=A00003', ['A00003']),
+        ('  genre = CO  and  date > 1610 ', ['A00004']),
+        ])
+def test_parse_query(query, codes):
+    assert select(query) == codes
+
+
+@pytest.mark.parametrize('query, codes', [
+        ('title~"Love and Honor"', ['A00001']),
+        ("title~'Love and Honor'", ['A00001']),
+        ('title="Volpone, or The Fox" or genre=TR', ['A00002', 'A00003']),
+        ('title~"or The" and author~Jonson', ['A00002']),
+        ("title~Maid's and genre=TR", ['A00003']),
+        ])
+def test_parse_query_quoted_values(query, codes):
+    assert select(query) == codes
+
+
+def test_split_query():
+    assert metadata.split_query('title~"Love and Honor" and genre=TC or date<1600') == [[' title~"Love and Honor"', 'genre=TC'], ['date<1600 ']]
+    assert metadata.split_query("author~Fletcher") == [[' author~Fletcher ']]
+
+
+@pytest.mark.parametrize('query', [
+        'genre=CO and',
+        'or genre=CO',
+        'genre',
+        'play=CO',
+        'date<sixteen',
+        'title~"Love and',
+        ])
+def test_invalid_queries(query):
+    with pytest.raises(getopt.GetoptError):
+        metadata.parse_query(query)
+
+
+@pytest.fixture
+def metadata_filename(tmp_path, monkeypatch):
+    monkeypatch.setattr(table, 'table_dir', str(tmp_path))
+    (tmp_path / 'metadata.csv').write_text(CSV, encoding='utf-8-sig')  # As exported, with a byte order mark
+    (tmp_path / 'missing_files.txt').write_text('A00005.xml\n')
+    return str(tmp_path / 'metadata.csv')
+
+
+def test_index(metadata_filename):
+    index = metadata.load_index(metadata_filename)
+    assert list(index) == ['A00001', 'A00002', 'A00003', 'A00004', 'A00006']  # A00005 is missing
+    assert [play.title for play in index['A00006']] == ['The Golden Age', 'The Silver Age']
+    assert 'A00005' not in index
+    assert [index[play.code] for play in PLAYS] == [[play] for play in PLAYS]
+    assert index.select(None) == list(index)
+    assert metadata.select_filenames('genre=CO', metadata_filename) == ['A00002.xml', 'A00004.xml', 'A00006.xml']
+
+
+@pytest.mark.parametrize('query', [
+        'code=A00004 or code=A00001',
+        'code=A00002 and genre=TR or code=A00003',
+        'code=A00001 and code=A00002',
+        'code=A00005 or code=A99999',
+        'code=A00001 or genre=CO',
+        'code=A00001 or date>1611',
+        'code!=A00001',
+        'genre=CO',
+        'genre=HI or genre=TR',
+        'author~heywood and title~silver',
+        'date<1615 and printed>=1611',
+        'tokens>=16000 or date~159',
+        'printed!=1649',
+        ])
+def test_index_matches_each_play(metadata_filename, query):
+    index = metadata.load_index(metadata_filename)
+    matches = metadata.parse_query(query)
+    assert index.select(query) == [code for code in index if any(matches(play) for play in index[code])]
+
+
+def test_read_codes(tmp_path):
+    (tmp_path / 'plays.csv').write_text('TCP\nA00001\nA00002.xml\n\nA00001\nA00005\n')
+    (tmp_path / 'missing_files.txt').write_text('A00005.xml\n')
+    assert metadata.read_codes(str(tmp_path / 'plays.csv')) == ['A00001', 'A00002']
@@ -0,0 +1,37 @@
+'''Resolutions are written for review, and are not applied until accepted.'''
+
+import os
+import pipeline.normalize as normalize
+import pipeline.translate as translate
+from conftest import project_dir
+
+BENCH_DICT = os.path.join(project_dir, 'dicts', 'bench_phoneme_dict.txt')
+RESOLUTIONS = {
+        'goods': (0, ['gods']),
+        'haue': (0, ['have']),
+        'thinke': (1, ['think']),
+        'sate': (1, ['sat', 'set']),
+        }
+
+
+def test_resolutions_are_suggestions(tmp_path):
+    text = normalize.format_resolutions(RESOLUTIONS)
+    lines = text.splitlines()
+    assert lines.index('goods:gods:?') < lines.index('haue:have:?') < lines.index('thinke:think:?')
+    assert '# sate: sat set' in lines
+    dict_filename = str(tmp_path / 'resolutions.txt')
+    with open(dict_filename, 'w') as dict_file:
+        dict_file.write(text)
+    assert translate.get_translation_dictionaries(dict_filename) == ({}, {})
+    # Accepting a resolution, by changing its priority to 0, applies it
+    with open(dict_filename, 'w') as dict_file:
+        dict_file.write(text.replace('haue:have:?', 'haue:have:0'))
+    assert translate.get_translation_dictionaries(dict_filename) == ({'haue': 'have'}, {'haue': 'have'})
+
+
+def test_script_resolves_and_writes_suggestions(script, tmp_path):
+    resolutions_filename = str(tmp_path / 'resolutions.txt')
+    result = script('pipeline/normalize.py', ['-d', BENCH_DICT, '-w', resolutions_filename], stdin=b'A00011-1 Bellario I haue it\n')
+    assert result.stdout == b'A00011-1 Bellario I have it\n'
+    with open(resolutions_filename, 'r') as resolutions_file:
+        assert 'haue:have:?' in resolutions_file.read().splitlines()
@@ -0,0 +1,56 @@
+'''Stages run in one process match the scripts piped together.'''
+
+import os
+import pytest
+from conftest import project_dir
+
+BENCH_DICT = os.path.join(project_dir, 'dicts', 'bench_phoneme_dict.txt')
+SCRIPTS = [
+        ('clean', 'pipeline/clean.py', []),
+        ('translate -p', 'pipeline/translate.py', ['-p']),
+        ('normalize -d {}'.format(BENCH_DICT), 'pipeline/normalize.py', ['-d', BENCH_DICT]),
+        ('phonemes -d {}'.format(BENCH_DICT), 'pipeline/phonemes.py', ['-d', BENCH_DICT]),
+        ]
+
+
+def run_scripts(script, small_plays, count):
+    '''Returns the output and messages of extract.py and the first given
+    number of SCRIPTS, each given the output of the one before.'''
+    result = script('pipeline/extract.py', small_plays)
+    for spec, filename, args in SCRIPTS[:count]:
+        result = script(filename, args, stdin=result.stdout)
+    return result
+
+
+@pytest.mark.parametrize('count', range(len(SCRIPTS) + 1))
+def test_run_matches_scripts(script, small_plays, count):
+    expected = run_scripts(script, small_plays, count)
+    stage_args = ['-s', 'extract'] + [arg for spec, filename, args in SCRIPTS[:count] for arg in ['-s', spec]]
+    result = script('pipeline/run.py', stage_args + small_plays)
+    assert result.stdout == expected.stdout
+    assert result.stderr == expected.stderr  # The unknown words of phonemes
+    framed = script('pipeline/run.py', ['-b'] + stage_args + small_plays)
+    assert script('pipeline/run.py', [], stdin=framed.stdout).stdout == expected.stdout
+
+
+def test_run_reads_stdin(script, small_plays):
+    extracted = script('pipeline/extract.py', small_plays).stdout
+    expected = run_scripts(script, small_plays, 2)
+    result = script('pipeline/run.py', ['-s', 'clean', '-s', 'translate -p'], stdin=extracted)
+    assert result.stdout == expected.stdout
+
+
+def test_run_combine_matches_script(script, small_plays, tmp_path):
+    dict_filename = tmp_path / 'characters.tsv'
+    dict_filename.write_text('A03175-1\tfrere.\tFrere\nA03175-1\tfrere:\tFrere\n')
+    cleaned = run_scripts(script, small_plays, 1).stdout
+    expected = script('pipeline/combine_characters.py', [str(dict_filename)], stdin=cleaned).stdout
+    assert b'Frere' in expected
+    result = script('pipeline/run.py', ['-s', 'extract', '-s', 'clean', '-s', 'combine {}'.format(dict_filename)] + small_plays)
+    assert result.stdout == expected
+
+
+def test_unknown_stage(script):
+    result = script('pipeline/run.py', ['-s', 'unclean'], check=False)
+    assert result.returncode == 1
+    assert result.stderr.startswith(b'ERROR: ')
@@ -0,0 +1,73 @@
+'''Samples are deterministic, stratified, and independent of order.'''
+
+import getopt
+import pytest
+import lib.rows as rows
+import lib.sampling as sampling
+
+FILENAMES = ['A{:05d}.xml'.format(i) for i in range(200)]
+GENRES = {'A{:05d}'.format(i): ['CO', 'TR', 'HI', None][i % 4] for i in range(200)}
+ROWS = [rows.Row('A{:05d}-{}'.format(play, text), 'Character {}'.format(character), ['line {}'.format(line) for line in range(10)]) for play in range(5) for text in range(1, 3) for character in range(8)]
+
+
+@pytest.mark.parametrize('arg, sample', [
+        ('play:0.1', ('play', 0.1, '0')),
+        ('character:1', ('character', 1.0, '0')),
+        ('line:0.25:7', ('line', 0.25, '7')),
+        ])
+def test_parse_sample(arg, sample):
+    assert sampling.parse_sample(arg) == sample
+
+
+@pytest.mark.parametrize('arg', ['play', 'act:0.1', 'play:0', 'play:1.5', 'play:half', 'play:0.1:2:3'])
+def test_parse_invalid_sample(arg):
+    with pytest.raises(getopt.GetoptError):
+        sampling.parse_sample(arg)
+
+
+def test_sample_plays_is_stratified_and_deterministic():
+    sampled = sampling.sample_plays(FILENAMES, 0.2, '0', GENRES)
+    assert sampled == sampling.sample_plays(FILENAMES, 0.2, '0', GENRES)
+    assert sampled != sampling.sample_plays(FILENAMES, 0.2, '1', GENRES)
+    assert sampled == [filename for filename in FILENAMES if filename in sampled]  # In order
+    for genre in ['CO', 'TR', 'HI', None]:
+        in_genre = [filename for filename in sampled if GENRES[filename[:-len('.xml')]] == genre]
+        assert len(in_genre) == 10  # 0.2 of the 50 plays of each genre
+
+
+def test_sample_plays_ignores_order():
+    sampled = sampling.sample_plays(FILENAMES, 0.3, 'seed', GENRES)
+    reversed_sample = sampling.sample_plays(FILENAMES[::-1], 0.3, 'seed', GENRES)
+    assert reversed_sample == sampled[::-1]
+
+
+def test_sample_plays_whole():
+    assert sampling.sample_plays(FILENAMES, 1, '0', GENRES) == FILENAMES
+
+
+def test_sample_characters():
+    sampled = list(sampling.sample_rows(ROWS, 'character', 0.5, '0'))
+    assert sampled == list(sampling.sample_rows(ROWS, 'character', 0.5, '0'))
+    assert all(row in ROWS for row in sampled)
+    for code in set(row.code for row in ROWS):
+        assert len([row for row in sampled if row.code == code]) == 4
+    # Each play's sample is the same whichever other plays are sampled with it
+    for code in set(row.code for row in ROWS):
+        alone = list(sampling.sample_rows([row for row in ROWS if row.code == code], 'character', 0.5, '0'))
+        assert alone == [row for row in sampled if row.code == code]
+
+
+def test_sample_lines():
+    sampled = list(sampling.sample_rows(ROWS, 'line', 0.3, '0'))
+    assert sampled == list(sampling.sample_rows(ROWS, 'line', 0.3, '0'))
+    assert [(row.code, row.character) for row in sampled] == [(row.code, row.character) for row in ROWS]
+    for row, sampled_row in zip(ROWS, sampled):
+        assert len(sampled_row.elements) == 3
+        assert sampled_row.elements == [element for element in row.elements if element in sampled_row.elements]
+
+
+def test_sample_size_is_unbiased():
+    # N * FRACTION is rounded up with a probability equal to its fractional part
+    sizes = [sampling.get_sample_size(10, 0.25, sampling.get_key('0', 'stratum', str(i))) for i in range(2000)]
+    assert set(sizes) == {2, 3}
+    assert abs(sum(sizes) / len(sizes) - 2.5) < 0.1
@@ -0,0 +1,19 @@
+'''Separated character files do not depend on the wire format.'''
+
+import os
+
+
+def separate(script, small_plays, directory, framed):
+    flags = ['-b'] if framed else []
+    extracted = script('pipeline/extract.py', flags + small_plays).stdout
+    cleaned = script('pipeline/clean.py', flags, stdin=extracted).stdout
+    script('pipeline/separate.py', ['-d', str(directory)], stdin=cleaned)
+    return {filename: (directory / filename).read_text() for filename in os.listdir(str(directory))}
+
+
+def test_framed_and_text_files_match(script, small_plays, tmp_path):
+    text_files = separate(script, small_plays, tmp_path / 'text', False)
+    framed_files = separate(script, small_plays, tmp_path / 'framed', True)
+    assert framed_files == text_files
+    assert [filename for filename in text_files if '-' in filename.split('_', 1)[1]]
+    assert not [filename for filename in text_files if ' ' in filename]
@@ -0,0 +1,56 @@
+'''Sharded runs cover every file once, and gather to the unsharded output.'''
+
+import getopt
+import pytest
+import lib.shards as shards
+
+STAGES = ['-s', 'extract', '-s', 'clean', '-s', 'translate']
+
+
+def test_shards_partition_files():
+    filenames = ['A{:05d}.xml'.format(i) for i in range(100)]
+    selected = [shards.select(filenames, shard, 3) for shard in range(1, 4)]
+    assert sorted(sum(selected, [])) == filenames
+    for shard_files in selected:
+        assert shard_files == [filename for filename in filenames if filename in shard_files]
+    assert shards.select(['dir/A00001.xml.gz'], shards.get_shard('A00001', 3), 3) == ['dir/A00001.xml.gz']
+
+
+@pytest.mark.parametrize('arg', ['3/2', '0/2', '1', 'a/b', '1/0'])
+def test_parse_invalid_shard(arg):
+    with pytest.raises(getopt.GetoptError):
+        shards.parse_shard(arg)
+
+
+def test_gathered_shards_match_unsharded_run(script, small_plays, tmp_path):
+    unsharded = script('pipeline/run.py', STAGES + small_plays).stdout
+    checkpoint_dir = str(tmp_path / 'checkpoint')
+    for shard in range(1, 4):
+        result = script('pipeline/run.py', ['-k', checkpoint_dir, '-n', '{}/3'.format(shard)] + STAGES + small_plays)
+        assert result.stdout == b''
+    assert not [filename for filename in (tmp_path / 'checkpoint').iterdir() if filename.name.endswith('.lock')]
+    gathered = script('pipeline/run.py', ['-k', checkpoint_dir, '-g', '3'] + STAGES + small_plays).stdout
+    assert gathered == unsharded
+
+
+def test_gather_before_shards_are_done(script, small_plays, tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoint')
+    script('pipeline/run.py', ['-k', checkpoint_dir, '-n', '1/2'] + STAGES + small_plays)
+    result = script('pipeline/run.py', ['-k', checkpoint_dir, '-g', '2'] + STAGES + small_plays, check=False)
+    assert result.returncode == 1
+    assert b'ERROR' in result.stderr
+
+
+def test_extract_shards_cover_every_play(script, small_plays):
+    unsharded = script('pipeline/extract.py', small_plays).stdout.splitlines()
+    sharded = []
+    for shard in range(1, 3):
+        sharded += script('pipeline/extract.py', ['-n', '{}/2'.format(shard)] + small_plays).stdout.splitlines()
+    assert sorted(sharded) == sorted(unsharded)
+
+
+def test_extract_invalid_shard(script, small_plays):
+    result = script('pipeline/extract.py', ['-n', '3/2'] + small_plays, check=False)
+    assert result.returncode == 1
+    assert result.stderr.startswith(b'ERROR: ')
+    assert b'Traceback' not in result.stderr
@@ -0,0 +1,53 @@
+'''Phoneme frequency signatures.'''
+
+import numpy
+import pytest
+import lib.rows as rows
+import lib.errors as errors
+import pipeline.signatures as signatures
+
+STRESSED = rows.Row('A00011-1', 'Bellario', ['DH', 'AH0', 'K', 'IH1', 'NG', 'AH0'])
+PLAIN = rows.Row('A00011-1', 'Bellario', ['DH', 'AH', 'K', 'IH', 'NG', 'AH'])
+
+
+def get_counts(signature, columns):
+    return {column: count for column, count in zip(columns, signature) if count}
+
+
+def test_signature_ignores_stress():
+    for row in [STRESSED, PLAIN]:
+        code, character, signature = next(signatures.get_signatures([row], normalized=False))
+        assert (code, character) == ('A00011-1', 'Bellario')
+        assert get_counts(signature, signatures.get_columns()) == {'AH': 2, 'DH': 1, 'IH': 1, 'K': 1, 'NG': 1}
+
+
+def test_stressed_signature():
+    columns = signatures.get_columns(stressed=True)
+    code, character, signature = next(signatures.get_signatures([STRESSED], stressed=True))
+    assert len(signature) == len(columns) == 39 + 69
+    assert signature[:39].sum() == pytest.approx(1)
+    assert signature[39:].sum() == pytest.approx(1)
+    assert signature[columns.index('AH0', 39)] == pytest.approx(2 / 6)
+    assert signature[columns.index('IH1', 39)] == pytest.approx(1 / 6)
+
+
+def test_stressed_signature_requires_stress_markings():
+    with pytest.raises(errors.PipelineError):
+        list(signatures.get_signatures([PLAIN], stressed=True))
+
+
+def test_bigrams():
+    columns = signatures.get_columns(bigrams=True)
+    code, character, signature = next(signatures.get_signatures([STRESSED], bigrams=True, normalized=False))
+    assert get_counts(signature[39:], columns[39:]) == {'DH-AH': 1, 'AH-K': 1, 'K-IH': 1, 'IH-NG': 1, 'NG-AH': 1}
+
+
+def test_script_reports_missing_stress_markings(script, tmp_path):
+    result = script('pipeline/signatures.py', ['-e'], stdin=(rows.format_row(PLAIN, ' ') + '\n').encode('utf-8'), check=False)
+    assert result.returncode == 1
+    assert result.stderr.startswith(b'ERROR: ')
+    matrix_filename = str(tmp_path / 'signatures.npz')
+    result = script('pipeline/signatures.py', ['-e', '-n', matrix_filename], stdin=(rows.format_row(STRESSED, ' ') + '\n').encode('utf-8'))
+    assert result.stdout.decode('utf-8').splitlines()[0].startswith('TCP,character,AA,AE')
+    archive = numpy.load(matrix_filename)
+    assert archive['matrix'].shape == (1, 39 + 69)
@@ -0,0 +1,81 @@
+'''Compiled tables behave as the dicts they are compiled from.'''
+
+import pytest
+import lib.table as table
+
+DICTIONARY = {
+        'haue': 'have',
+        'iust': 'just',
+        'sonne': 'son',
+        'ſpeech': 'speech',
+        'Ænone': 'Oenone',
+        '': 'empty key',
+        'a': '',
+        }
+
+
+@pytest.fixture
+def table_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(table, 'table_dir', str(tmp_path))
+    return tmp_path
+
+
+def test_table_matches_dict(tmp_path):
+    table_filename = str(tmp_path / 'words.ctpt')
+    table.compile_table(table_filename, DICTIONARY.items())
+    words = table.Table(table_filename)
+    assert len(words) == len(DICTIONARY)
+    assert dict(words) == DICTIONARY
+    assert list(words) == sorted(DICTIONARY, key=lambda key: key.encode('utf-8'))
+    for key, value in DICTIONARY.items():
+        assert key in words
+        assert words[key] == value
+    for key in ['have', 'hau', 'sonnes', 'zzz', 'Haue']:
+        assert key not in words
+        assert words.get(key) is None
+        with pytest.raises(KeyError):
+            words[key]
+    assert 1 not in words
+
+
+def test_empty_table(tmp_path):
+    table_filename = str(tmp_path / 'empty.ctpt')
+    table.compile_table(table_filename, [])
+    empty = table.Table(table_filename)
+    assert len(empty) == 0
+    assert 'haue' not in empty
+    assert list(empty) == []
+
+
+def test_lookups_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(table, 'MEMO_SIZE', 4)
+    table_filename = str(tmp_path / 'numbers.ctpt')
+    table.compile_table(table_filename, ((str(i), str(i * i)) for i in range(100)))
+    numbers = table.Table(table_filename)
+    for i in range(100):
+        assert numbers[str(i)] == str(i * i)
+    assert numbers.lookup.cache_info().currsize == 4
+
+
+def test_load_table_compiles_once(table_dir):
+    calls = []
+
+    def get_dict():
+        calls.append(1)
+        return {'haue': ['have', 2]}
+    encode = lambda value: '{}:{}'.format(*value)
+    decode = lambda value: [value.split(':')[0], int(value.split(':')[1])]
+    for _ in range(2):
+        words = table.load_table('test', 'fingerprint', get_dict, encode, decode)
+        assert isinstance(words, table.Table)
+        assert words['haue'] == ['have', 2]
+    assert len(calls) == 1
+    table.load_table('test', 'other fingerprint', get_dict, encode, decode)
+    assert len(calls) == 2
+
+
+def test_load_table_falls_back_to_dict(tmp_path, monkeypatch):
+    # A table cannot be written inside a file, as in a read-only directory
+    (tmp_path / 'file').write_text('')
+    monkeypatch.setattr(table, 'table_dir', str(tmp_path / 'file'))
+    assert table.load_table('test', 'unwritable', lambda: DICTIONARY) is DICTIONARY
@@ -0,0 +1,382 @@
+#!/usr/bin/python3
+
+import sys
+import getopt
+import os
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in tools directory, add project directory to path
+import lib.compression as compression
+import lib.profiling as profiling
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+pipeline_dir = os.path.join(project_dir, 'pipeline')
+plays_dir = os.path.join(project_dir, 'data', 'plays_of_interest')
+bench_phoneme_dict = os.path.join(project_dir, 'dicts', 'bench_phoneme_dict.txt')
+
+
+def get_stage_list():
+    '''Returns the list of stages which are benchmarked, in the order in which
+    they are run. Each stage after extract reads the output of an earlier
+    stage.'''
+    stage_list = [
+            'extract',
+            'clean',
+            'translate',
+            'phonemes',
+            'combine_characters',
+            'separate',
+            'merge'
+            ]
+    return stage_list
+
+
+def get_stage_inputs():
+    '''Returns a dictionary mapping each stage to the stage whose output it
+    reads, or None if it reads the xml files.'''
+    stage_inputs = {}
+    stage_inputs['extract'] = None
+    stage_inputs['clean'] = 'extract'
+    stage_inputs['translate'] = 'clean'
+    stage_inputs['phonemes'] = 'translate'
+    stage_inputs['combine_characters'] = 'translate'
+    stage_inputs['separate'] = 'translate'
+    stage_inputs['merge'] = 'separate'
+    return stage_inputs
+
+
+def get_subsets(directory=plays_dir):
+    '''Returns a dictionary mapping subset names to fixed, sorted lists of xml
+    files from the given directory: the first file, the first ten files, and
+    all files.'''
+    filenames = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.xml'))
+    subsets = {}
+    subsets['1'] = filenames[:1]
+    subsets['10'] = filenames[:10]
+    subsets['all'] = filenames
+    return subsets
+
+
+def count_lines(filename):
+    '''Returns the number of non-empty lines in the given file, which may be
+    compressed.'''
+    count = 0
+    with compression.open_file(filename, 'rb') as infile:
+        for line in infile:
+            if line.strip():
+                count += 1
+    return count
+
+
+def write_character_dictionary(in_filename, dict_filename):
+    '''Writes a combine_characters dictionary which maps the first character of
+    every play in the given pipeline output to the second character of that
+    play, so that the combine stage has real work to do.'''
+    plays = {}
+    with compression.open_file(in_filename, 'r') as infile:
+        for line in infile:
+            fields = line.split(' ', 2)
+            if len(fields) >= 2:
+                plays.setdefault(fields[0], []).append(fields[1])
+    with open(dict_filename, 'w') as dict_file:
+        for TCPcode in sorted(plays):
+            if len(plays[TCPcode]) >= 2:
+                dict_file.write('\t'.join([TCPcode, plays[TCPcode][0], plays[TCPcode][1]]) + '\n')
+
+
+def time_command(command, cwd=pipeline_dir, out_filename=None):
+    '''Runs the given command in the given directory, writing its stdout to
+    the given file and discarding its stderr. Returns a tuple of the wall time
+    in seconds and the peak resident set size of the process in kilobytes.'''
+    stdout = subprocess.DEVNULL
+    if out_filename is not None:
+        stdout = open(out_filename, 'w')
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, stdout=stdout, stderr=subprocess.DEVNULL)
+    pid, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if out_filename is not None:
+        stdout.close()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    peak_rss = rusage.ru_maxrss
+    if sys.platform == 'darwin':  # ru_maxrss is given in bytes rather than kilobytes
+        peak_rss //= 1024
+    return (wall_time, peak_rss)
+
+
+def compress_files(filenames, directory, extension):
+    '''Writes a copy of each of the given files to the given directory,
+    compressed according to the given extension. Returns the list of the
+    compressed filenames.'''
+    os.makedirs(directory, exist_ok=True)
+    compressed = []
+    for filename in filenames:
+        compressed.append(os.path.join(directory, os.path.basename(filename) + extension))
+        with open(filename, 'rb') as infile, compression.open_file(compressed[-1], 'wb') as outfile:
+            shutil.copyfileobj(infile, outfile)
+    return compressed
+
+
+def get_stage_command(stage, work_dir, filenames, extension=''):
+    '''Returns a tuple of the command which runs the given stage, the
+    directory in which to run it, the list of its input files (for measuring
+    input size), and the file to which its output is written, all within the
+    given work directory. Each file which one stage writes and another reads
+    is compressed according to the given extension, if one is given. merge.py
+    is run within the directory of separated files, since it splits the whole
+    path of each file on underscores.'''
+    python = sys.executable
+    path = lambda name: os.path.join(work_dir, name + extension if name.endswith('.txt') else name)
+    if stage == 'extract':
+        return ([python, 'extract.py', '-o', path('extracted.txt')] + filenames, pipeline_dir, filenames, path('extracted.txt'))
+    if stage == 'clean':
+        return ([python, 'clean.py', '-i', path('extracted.txt'), '-o', path('cleaned.txt')], pipeline_dir, [path('extracted.txt')], path('cleaned.txt'))
+    if stage == 'translate':
+        return ([python, 'translate.py', '-i', path('cleaned.txt'), '-o', path('translated.txt')], pipeline_dir, [path('cleaned.txt')], path('translated.txt'))
+    if stage == 'phonemes':
+        return ([python, 'phonemes.py', '-d', bench_phoneme_dict, '-i', path('translated.txt'), '-o', path('phonemes.txt'), '-u', path('unknowns.tsv')], pipeline_dir, [path('translated.txt')], path('phonemes.txt'))
+    if stage == 'combine_characters':
+        write_character_dictionary(path('translated.txt'), path('characters.tsv'))
+        return ([python, 'combine_characters.py', '-i', path('translated.txt'), '-o', path('combined.txt'), path('characters.tsv')], pipeline_dir, [path('translated.txt')], path('combined.txt'))
+    if stage == 'separate':
+        return ([python, 'separate.py', '-d', path('separated'), '-i', path('translated.txt'), '-o', os.devnull], pipeline_dir, [path('translated.txt')], path('translated.txt'))
+    if stage == 'merge':
+        separated = sorted(os.listdir(path('separated')))
+        return ([python, os.path.join(pipeline_dir, 'merge.py'), '-o', path('merged.txt')] + separated, path('separated'), [os.path.join(path('separated'), f) for f in separated], path('merged.txt'))
+    raise ValueError('unknown stage: {}'.format(stage))
+
+
+def benchmark_subset(filenames, stages, repeat=1, extension='', directory=None):
+    '''Runs each of the given stages over the given xml files in a temporary
+    work directory within the given directory, in the order given by
+    get_stage_list(). Stages which are needed to produce the input of a
+    requested stage are run but not recorded. If a compressed extension is
+    given, the xml files are compressed before any stage is run, and every
+    stage reads and writes compressed files. Returns a dictionary mapping each
+    requested stage to its results, using the fastest of the given number of
+    repetitions.'''
+    results = {}
+    stage_inputs = get_stage_inputs()
+    needed = set()
+    for stage in stages:
+        while stage is not None:
+            needed.add(stage)
+            stage = stage_inputs[stage]
+    work_dir = tempfile.mkdtemp(prefix='ctp-bench-', dir=directory)
+    try:
+        if extension:
+            filenames = compress_files(filenames, os.path.join(work_dir, 'xml'), extension)
+        for stage in get_stage_list():
+            if stage not in needed:
+                continue
+            best_time = None
+            best_rss = None
+            for i in range(repeat if stage in stages else 1):
+                if stage == 'separate':
+                    shutil.rmtree(os.path.join(work_dir, 'separated'), ignore_errors=True)
+                command, cwd, in_files, out_filename = get_stage_command(stage, work_dir, filenames, extension)
+                wall_time, peak_rss = time_command(command, cwd)
+                if best_time is None or wall_time < best_time:
+                    best_time = wall_time
+                if best_rss is None or peak_rss > best_rss:
+                    best_rss = peak_rss
+            if stage not in stages:
+                continue
+            in_bytes = sum(os.path.getsize(f) for f in in_files)
+            out_rows = count_lines(out_filename)
+            if stage == 'merge':
+                out_rows = len(in_files)
+            results[stage] = {
+                    'wall_time': best_time,
+                    'rows': out_rows,
+                    'rows_per_sec': out_rows / best_time,
+                    'input_bytes': in_bytes,
+                    'mb_per_sec': in_bytes / 1e6 / best_time,
+                    'output_bytes': os.path.getsize(out_filename),
+                    'peak_rss_kb': best_rss
+                    }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def benchmark(subset_names, stages, repeat=1, extension='', directory=None):
+    '''Benchmarks the given stages over each of the named subsets of the plays
+    of interest, compressing their files according to the given extension, in
+    the given directory. Returns a dictionary of the results along with a
+    description of the environment in which they were measured.'''
+    subsets = get_subsets()
+    results = {}
+    for name in subset_names:
+        print('Benchmarking {} file(s)...'.format(len(subsets[name])), file=sys.stderr)
+        results[name] = benchmark_subset(subsets[name], stages, repeat, extension, directory)
+    environment = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'compression': extension,
+            'directory': directory if directory is not None else tempfile.gettempdir(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+            }
+    return {'environment': environment, 'results': results}
+
+
+def compare(results, baseline, threshold=0.1):
+    '''Compares the given results against the given baseline results. A stage
+    has regressed if its wall time or peak memory grew by more than the given
+    fraction of the baseline. Returns a list of tuples, one for each stage in
+    both results, of the form:
+        (subset, stage, metric, baseline value, new value, regressed)'''
+    comparison = []
+    for subset in results['results']:
+        if subset not in baseline['results']:
+            continue
+        for stage in results['results'][subset]:
+            if stage not in baseline['results'][subset]:
+                continue
+            new = results['results'][subset][stage]
+            old = baseline['results'][subset][stage]
+            for metric in ('wall_time', 'peak_rss_kb'):
+                regressed = new[metric] > old[metric] * (1 + threshold)
+                comparison.append((subset, stage, metric, old[metric], new[metric], regressed))
+    return comparison
+
+
+def format_comparison(comparison):
+    '''Formats a comparison as a table, one line per stage and metric, where
+    regressions are marked with REGRESSION.'''
+    out_list = []
+    for subset, stage, metric, old, new, regressed in comparison:
+        change = (new - old) / old * 100 if old else 0.0
+        line = '{:>4} {:<20} {:<12} {:>12.3f} {:>12.3f} {:>+8.1f}%'.format(subset, stage, metric, old, new, change)
+        if regressed:
+            line += '  REGRESSION'
+        out_list.append(line)
+    return '\n'.join(out_list) + '\n'
+
+
+def parse_benchmark(arg_list):
+    '''Parses command-line arguments and runs the core benchmark() function
+    accordingly. Writes the results to a json file, and compares them against
+    a baseline if one is given using the -b flag.'''
+    optlist, args = getopt.getopt(arg_list, 'hs:n:r:o:b:t:z:d:')
+    subset_names = ['1', '10', 'all']
+    stages = get_stage_list()
+    repeat = 1
+    out_filename = 'benchmark.json'
+    baseline_filename = None
+    threshold = 0.1
+    extension = ''
+    directory = None
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - benchmark each stage of the pipeline over the plays of interest
+
+    Usage:
+        python3 {0} [OPTION]...
+
+    Runs each stage of the pipeline as a separate process over fixed subsets of
+    data/plays_of_interest (the first file, the first ten files, and all files,
+    in sorted order), feeding each stage the output of the stage before it.
+    For each subset and stage, records the wall time, rows per second, input
+    megabytes per second, size of its output, and peak resident set size in a
+    json results file.
+    The phonemes stage uses the small bundled dictionary
+    dicts/bench_phoneme_dict.txt, so no network access or nltk is required.
+
+
+    -h              Display this help message.
+
+    -s subsets      Specify a comma-separated list of subsets to benchmark.
+                        The default is 1,10,all
+
+    -n stages       Specify a comma-separated list of stages to benchmark.
+                        Stages needed to produce their input are run but not
+                        recorded. The default is all stages:
+                            {1}
+
+    -r #            Specify the number of times to run each stage, keeping the
+                        fastest time. The default is 1.
+
+    -o filename     Specify the json file to which to write the results. The
+                        default is benchmark.json
+
+    -b filename     Specify a baseline json results file against which to
+                        compare the results. Prints a comparison to stdout and
+                        exits with status 2 if any stage regressed.
+
+    -t percent      Specify the percentage by which wall time or peak memory
+                        must grow beyond the baseline to count as a
+                        regression. The default is 10.
+
+    -z extension    Compress the xml files, and every file which one stage
+                        writes and another reads, with the given codec: gz,
+                        bz2, or xz. The xml files are compressed before any
+                        stage is timed. Whether the smaller files save more
+                        time than compressing them costs is shown by comparing
+                        against an uncompressed run on the same storage.
+                        Ex:
+                            $ python3 {0} -o plain.json
+                            $ python3 {0} -z gz -o gz.json -b plain.json
+
+    -d directory    Specify the directory in which to create the work
+                        directory holding every file the stages read and
+                        write, so that the storage on which they are kept is
+                        measured. The default is the system's temporary
+                        directory.
+'''.format(sys.argv[0], ','.join(get_stage_list())))
+            exit(0)
+        if o == '-s':
+            subset_names = a.split(',')
+        if o == '-n':
+            stages = a.split(',')
+        if o == '-r':
+            repeat = int(a)
+        if o == '-o':
+            out_filename = a
+        if o == '-b':
+            baseline_filename = a
+        if o == '-t':
+            threshold = float(a) / 100
+        if o == '-z':
+            extension = '.' + a.lstrip('.')
+            if extension not in compression.EXTENSIONS:
+                print('ERROR: {}: Unknown compression: {}'.format(sys.argv[0], a), file=sys.stderr)
+                exit(1)
+        if o == '-d':
+            directory = a
+    for name in subset_names:
+        if name not in get_subsets():
+            print('ERROR: {}: Unknown subset: {}'.format(sys.argv[0], name), file=sys.stderr)
+            exit(1)
+    for stage in stages:
+        if stage not in get_stage_list():
+            print('ERROR: {}: Unknown stage: {}'.format(sys.argv[0], stage), file=sys.stderr)
+            exit(1)
+    results = benchmark(subset_names, stages, repeat, extension, directory)
+    with open(out_filename, 'w') as outfile:
+        json.dump(results, outfile, indent=2)
+        outfile.write('\n')
+    if baseline_filename is not None:
+        with open(baseline_filename, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        comparison = compare(results, baseline, threshold)
+        sys.stdout.write(format_comparison(comparison))
+        if any(c[-1] for c in comparison):
+            exit(2)
+
+
+def main():
+    profiling.run(parse_benchmark, sys.argv[1:], 'benchmark')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,122 +3,260 @@
 import sys
 import getopt
 import os
+import re
+import copy
 import xml.etree.ElementTree as ET
 sys.path.append(sys.path[0] + '/..')  # Assuming script is in tools directory, add project directory to path
 import pipeline.clean as clean
+import pipeline.extract as extract
+import lib.rows as rows
+import lib.frames as frames
+import lib.shards as shards
+import lib.compression as compression
+import lib.errors as errors
+import lib.profiling as profiling
 
+CHUNK_SIZE = 16384
+project_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+late_personae_path = os.path.join(project_dir, 'data', 'late_dramatis_personae.txt')
 
-def extract_dramatis_personae(filename):
+
+def get_contents(div, url, filename, count):
+    '''Returns the list of elements holding the character names and
+    descriptions of the given dramatis personae div element, which are its
+    items not containing another list, or the cells of the tables within them.'''
+    elements = []
+    for item in div.iter(url + 'item'):  # First get all items, if there are any
+        if len([l for l in item.iter(url + 'list')]) == 0:  # Skip this item if it contains another list
+            elements.append(item)
+    for p in div.iter(url + 'items'):  # Get all <p> elements, including ones containing tables
+        elements.append(p)
+    contents = []
+    for elem in elements:
+        table = elem.find(url + 'table')
+        if table is None:
+            table = elem.find('table')
+        tables = [t for t in elem.iter(url + 'table')]
+        if table is None and len(tables) > 0:
+            print('WARNING: {}-{}\n    Table in item but table is not found as a child of the element'.format(filename, count), file=sys.stderr)
+            print(ET.tostring(elem), file=sys.stderr)
+            print(file=sys.stderr)
+        if table is not None:  # There is a table, so take the first cell from each row
+            found_row = False
+            for row in table.findall(url + 'row'):
+                found_row = True
+                for cell in row.findall(url + 'cell'):
+                    contents.append(cell)
+            if not found_row:
+                print('WARNING: {}-{}\n    Failed to find row in table:'.format(filename, count), file=sys.stderr)
+                print(ET.tostring(table), file=sys.stderr)
+                print(file=sys.stderr)
+        else:
+            contents.append(elem)
+    return contents
+
+
+def clean_content(element, xml_dict, filename, count):
+    '''Returns the text of the given element of a dramatis personae div,
+    cleaned by replacing newline characters and tabs with spaces and removing
+    xml elements similarly to clean.py. The tags which clean.py deletes are
+    removed from a copy of the element as parsed, so that the tree, which
+    may be shared with extract.py, is left unchanged, and the element is
+    serialized only once.'''
+    element = copy.deepcopy(element)
+    element.tail = None
+    for tag_del in clean.get_xml_delete() + ['label']:
+        clean.remove_tags(element, clean.get_ns_tag(tag_del))
+    content = ET.tostring(element, encoding='unicode')
+    content = content.replace('\n', ' ')
+    content = content.replace('\t', ' ')
+
+    content = clean.fill_gaps(content)
+
+    for key in xml_dict:
+        if key in content:
+            content = content.replace(key, xml_dict[key])
+
+    content = clean.ignore_tags(content, clean.get_xml_ignore() + ['p', 'cell'])
+
+    content = clean.remove_abbreviations(content)
+
+    while '  ' in content:
+        content = content.replace('  ', ' ')
+    content = content.strip()
+
+    if '<' in content or '>' in content:
+        print('WARNING: {}-{}\n    Text not fully cleaned of xml.'.format(filename, count), file=sys.stderr)
+        print(content, file=sys.stderr)
+        print(file=sys.stderr)
+        quit()
+    return content
+
+
+def is_personae_div(element, url):
+    '''Returns True if the given element is a <div type="dramatis_personae">
+    tag.'''
+    return element.tag == url + 'div' and element.get('type') == 'dramatis_personae'
+
+
+def get_personae_divs(root):
+    '''Returns the list of dramatis personae div elements under the given
+    root element, in document order.'''
+    url = root.tag[:root.tag.find('}') + 1]
+    return [div for div in root.iter(url + 'div') if is_personae_div(div, url)]
+
+
+def get_dramatis_personae_rows(divs, filename):
+    '''Generates a Row for each character named in each of the given
+    dramatis personae div elements of the given xml file, which are all of
+    those in the file, in order. The code of each Row is the TCP code
+    followed by a hyphen and the number of the div in which the character was
+    found, the character is the character's name and description, cleaned as
+    by clean_content(), and there are no elements.'''
+    code = shards.get_code(filename)
+    xml_dict = clean.get_xml_dictionary()
+    count = 0
+    for div in divs:
+        url = div.tag[:div.tag.find('}') + 1]
+        count += 1
+        for element in get_contents(div, url, filename, count):
+            content = clean_content(element, xml_dict, filename, count)
+            if content:
+                yield rows.Row(code + '-' + str(count), content, [])
+
+
+def iter_events(parser, blocks):
+    '''Generates the start and end events of the given pull parser as it is
+    fed the given blocks of bytes, one at a time, so that reading stops as
+    soon as the events are no longer consumed.'''
+    for block in blocks:
+        parser.feed(block)
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def parse_front(filename):
+    '''Returns the list of dramatis personae div elements of the given xml
+    file, which may be compressed, found by parsing only its front matter, or
+    None if it could not be parsed.
+
+    Dramatis personae are almost always in the front matter, or just before
+    the first speech, so the file is read one block at a time and parsed only
+    until the end of its first <front> tag, if a div has been found, or else
+    the start of its first <sp> tag, and the rest is never read. If the file
+    holds several <text> tags in a <group>, or an <sp> tag within a div, the
+    rest of the file is parsed as it is read. Divs after the part parsed are
+    missed, so files known to have them are listed in
+    data/late_dramatis_personae.txt, and parsed whole by
+    read_personae_divs().'''
+    try:
+        with profiling.phase('parse'), compression.open_file(filename, 'rb') as infile:
+            events = iter_events(ET.XMLPullParser(events=('start', 'end')), iter(lambda: infile.read(CHUNK_SIZE), b''))
+            root = None
+            divs = []
+            ended = 0
+            for event, element in events:
+                if root is None:
+                    root = element
+                    url = root.tag[:root.tag.find('}') + 1]
+                if is_personae_div(element, url):
+                    if event == 'start':
+                        divs.append(element)
+                    else:
+                        ended += 1
+                elif event == 'start' and element.tag == url + 'group':
+                    break
+                elif event == 'end' and element.tag == url + 'front' and ended == len(divs) > 0:
+                    return divs
+                elif event == 'start' and element.tag == url + 'sp':
+                    if ended == len(divs):
+                        return divs
+                    break
+            for event, element in events:  # Parse the rest of the file
+                pass
+            return None if root is None else get_personae_divs(root)
+    except ET.ParseError:
+        print('ERROR: File {} could not be parsed.'.format(filename), file=sys.stderr)
+        return None
+
+
+def read_late_codes(filename=late_personae_path):
+    '''Returns the set of TCP codes of the files listed in the given list of
+    files with dramatis personae after their front matter, or an empty set if
+    it does not exist.'''
+    if not os.path.exists(filename):
+        return set()
+    with open(filename, 'r') as infile:
+        return set(re.findall(r'^([A-Za-z]\d+)', infile.read(), re.MULTILINE))
+
+
+def read_personae_divs(filename, fast=False, late_codes=set()):
+    '''Returns the list of dramatis personae div elements of the given xml
+    file, parsing only its front matter if fast is True, unless its TCP code
+    is in the given set of codes of files with dramatis personae after their
+    front matter, or an empty list if it could not be parsed.'''
+    if fast and shards.get_code(filename) not in late_codes:
+        divs = parse_front(filename)
+    else:
+        root = extract.parse_root(filename)
+        divs = None if root is None else get_personae_divs(root)
+    if divs is None:
+        return []
+    return divs
+
+
+def extract_dramatis_personae(filename, fast=False):
     '''Returns a tsv string where each row is separated by a newline \\n. The
     first element of each row is the TCP code followed by a hyphen and the
     number of the <div type="dramatis_personae"> tag in which the character
     speech was found, and the following element of the row is the character's
     name and description from the dramatis personae div element, cleaned by
     replacing newline characters and tabs with spaces and removing xml elements
-    similarly to clean.py'''
-    try:
-        root = ET.parse(filename).getroot()
-    except ET.ParseError:
-        print('ERROR: File {} could not be parsed.'.format(filename), file=sys.stederr)
-        return ''
-    root_tag = root.tag
-    url = root_tag[:root_tag.find('}') + 1]
-    tsv_list = []
-    count = 0
-    for div in root.iter(url + 'div'):
-        if 'type' in div.attrib and div.attrib['type'] == 'dramatis_personae':
-            count += 1
-            elements = []
-            for item in div.iter(url + 'item'):  # First get all items, if there are any
-                if len([l for l in item.iter(url + 'list')]) == 0:  # Skip this item if it contains another list
-                    elements.append(item)
-            for p in div.iter(url + 'items'):  # Get all <p> elements, including ones containing tables
-                elements.append(p)
-            contents = []
-            for elem in elements:
-                table = elem.find(url + 'table')
-                if table is None:
-                    table = elem.find('table')
-                tables = [t for t in elem.iter(url + 'table')]
-                if table is None and len(tables) > 0:
-                    print('WARNING: {}-{}\n    Table in item but table is not found as a child of the element'.format(filename, count), file=sys.stderr)
-                    print(ET.tostring(elem), file=sys.stderr)
-                    print(file=sys.stderr)
-                if table is not None:  # There is a table, so take the first cell from each row
-                    found_row = False
-                    for row in table.findall(url + 'row'):
-                        found_row = True
-                        for cell in row.findall(url + 'cell'):
-                            contents.append(ET.tostring(cell, encoding='unicode'))
-                    if not found_row:
-                        print('WARNING: {}-{}\n    Failed to find row in table:'.format(filename, count), file=sys.stderr)
-                        print(ET.tostring(table), file=sys.stderr)
-                        print(file=sys.stderr)
-                else:
-                    contents.append(ET.tostring(elem, encoding='unicode'))
-
-            xml_dict = clean.get_xml_dictionary()
-            for content in contents:
-
-                content = content.replace('\n', ' ')
-                content = content.replace('\t', ' ')
-                content = content.strip()
-                if content:
-
-                    try:
-                        element = ET.fromstring(content)
-                    except ET.ParseError:
-                        print('ERROR: {}-{}\n    Failed to parse text:'.format(filename, count), file=sys.stderr)
-                        print(content, file=sys.stderr)
-                        print(file=sys.stderr)
-                        exit(1)
-                    for tag_del in clean.get_xml_delete() + ['label']:
-                        clean.remove_tags(element, clean.get_ns_tag(tag_del))
-                    content = ET.tostring(element, encoding='unicode')
-
-                    content = clean.fill_gaps(content)
-
-                    for key in xml_dict:
-                        if key in content:
-                            content = content.replace(key, xml_dict[key])
-
-                    content = clean.ignore_tags(content, clean.get_xml_ignore() + ['p', 'cell'])
-
-                    content = clean.remove_abbreviations(content)
-
-                    while '  ' in content:
-                        content = content.replace('  ', ' ')
-                    content = content.strip()
-
-                    if '<' in content or '>' in content:
-                        print('WARNING: {}-{}\n    Text not fully cleaned of xml.'.format(filename, count), file=sys.stderr)
-                        print(content, file=sys.stderr)
-                        print(file=sys.stderr)
-                        quit()
-
-                    if content:
-                        filename_id = filename.split('/')[-1]
-                        row = [filename_id.replace('.xml', '') + '-' + str(count), content]
-                        tsv_list.append('\t'.join(row))
-    return '\n'.join(tsv_list) + '\n'
+    similarly to clean.py. If fast is True, the file is parsed only as far as
+    its front matter, by parse_front(), unless it is listed in
+    data/late_dramatis_personae.txt.'''
+    late_codes = read_late_codes() if fast else set()
+    return rows.format_rows(get_dramatis_personae_rows(read_personae_divs(filename, fast, late_codes), filename), '\t')
+
+
+def extract_both(filenames, personae_rows):
+    '''Generates the speech Rows of each of the given xml files, as
+    extract.py does, and appends the dramatis personae Rows of each to the
+    given list, which is modified in place, parsing each file only once.'''
+    for filename in filenames:
+        root = extract.parse_root(filename)
+        found = False
+        file_personae = []
+        if root is not None:
+            file_personae = list(get_dramatis_personae_rows(get_personae_divs(root), filename))
+            for row in extract.get_rows(root, filename):
+                found = True
+                yield row
+        if not found:
+            print('WARNING: No <sp> tags found in the entirety of file {}'.format(filename), file=sys.stderr)
+        if not file_personae:
+            print('WARNING: No dramatis personae elements found in the entirety of file {}'.format(filename), file=sys.stderr)
+        personae_rows.extend(file_personae)
 
 
 def parse_csv(filename, column=0):
-    filenames = []
-    with open(filename, newline='') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            filenames.append(row[column] + '.xml')
-    return filenames
+    '''Returns the xml filenames of the TCP codes in the given column of the
+    given csv file, such as the VEP metadata, skipping its header.'''
+    import lib.metadata as metadata
+    return [code + '.xml' for code in metadata.read_codes(filename, column)]
 
 
 def parse_extract_dramatis_personae(arg_list):
     '''Parses command-line arguments and runs core extract_dramatis_personae()
     function accordingly. Writes the output to stdout unless an output file is
     specified using the -o flag.'''
-    optlist, args = getopt.getopt(arg_list, 'hd:c:o:')
+    optlist, args = getopt.getopt(arg_list, 'hbfd:c:o:w:')
     in_directory = ''
     outfile = sys.stdout
+    speech_file = None
+    fast = False
+    framed = False
     for o, a in optlist:
         if o == '-h':
             print('''
@@ -155,6 +293,33 @@ Usage information for {0}
 
     -o filename     Specify an output file to which to write output, rather
                         than writing to stdout. A tsv file is preferred.
+
+    -w filename     Also write the character speech of each file to the given
+                        file, exactly as extract.py would write it, from the
+                        same parse of each file, so that both are extracted
+                        in a single pass rather than by running both scripts.
+                        Ex:
+                            $ python3 {0} -d ../data/plays_of_interest \\
+                              -c ../data/VEP_metadata.csv \\
+                              -o dramatis_personae.tsv -w extracted.tsv
+
+    -f              Read and parse each file only as far as the end of its
+                        first <front> tag, if dramatis personae were found
+                        there, or else the start of its first <sp> tag, rather
+                        than parsing the whole file. Files which hold several
+                        texts in a <group>, and the plays listed in
+                        data/late_dramatis_personae.txt, which have dramatis
+                        personae after their first speech, are parsed whole,
+                        so that for the plays in data/plays_of_interest the
+                        output is the same as without -f. Dramatis personae
+                        after the first speech of any other file are missed.
+                        Files are not checked for xml errors beyond the part
+                        parsed. Ignored with -w, which parses every whole
+                        file.
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
 '''.format(sys.argv[0]))
             exit(0)
         if o == '-d':
@@ -162,17 +327,33 @@ Usage information for {0}
         if o == '-c':
             args += parse_csv(a)
         if o == '-o':
-            outfile = open(a, 'w')
-    dramatis_personae_string_list = []
-    for filename in args:
-        filename = in_directory + filename
-        dramatis_personae_string = extract_dramatis_personae(filename)
-        if dramatis_personae_string.strip():
-            dramatis_personae_string_list.append(extract_dramatis_personae(filename).strip())
+            outfile = compression.open_file(a, 'w')
+        if o == '-w':
+            speech_file = compression.open_file(a, 'w')
+        if o == '-f':
+            fast = True
+        if o == '-b':
+            framed = True
+    filenames = [in_directory + filename for filename in args]
+    personae_rows = []
+    try:
+        if speech_file is not None:
+            frames.write_rows(speech_file, extract_both(filenames, personae_rows), '\t', framed)
+            speech_file.close()
         else:
-            print('WARNING: No dramatis personae elements found in the entirety of file {}'.format(filename), file=sys.stderr)
-    tsv_string = '\n'.join(dramatis_personae_string_list) + '\n'
-    outfile.write(tsv_string)
+            late_codes = read_late_codes() if fast else set()
+            for filename in filenames:
+                file_personae = list(get_dramatis_personae_rows(read_personae_divs(filename, fast, late_codes), filename))
+                if not file_personae:
+                    print('WARNING: No dramatis personae elements found in the entirety of file {}'.format(filename), file=sys.stderr)
+                personae_rows.extend(file_personae)
+    except errors.PipelineError as err:
+        print('ERROR: {}'.format(err), file=sys.stderr)
+        exit(1)
+    if framed:
+        frames.write_rows(outfile, personae_rows, '\t', framed)
+    else:
+        outfile.write(rows.format_rows(personae_rows, '\t'))
     if outfile != sys.stdout:
         outfile.close()
 
@@ -182,7 +363,7 @@ def main():
         print('Please include filename of xml file from which to extract text,', file=sys.stderr)
         print('or include -c csvfile containing metadata with TCP codes.', file=sys.stderr)
         exit(1)
-    parse_extract_dramatis_personae(sys.argv[1:])
+    profiling.run(parse_extract_dramatis_personae, sys.argv[1:], 'extract_dramatis_personae')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+
+import sys
+import getopt
+import os
+import random
+import itertools
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in tools directory, add project directory to path
+import lib.conversion_dict as conversion_dict
+import lib.profiling as profiling
+
+dicts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dicts')
+std_dict_path = os.path.join(dicts_dir, 'standardizer_dictionary.txt')
+bench_dict_path = os.path.join(dicts_dir, 'bench_phoneme_dict.txt')
+
+
+def get_markup_rates():
+    '''Returns a dictionary mapping each kind of inline markup to the average
+    number of times it occurs per <l> or <p> element, as measured over a
+    sample of data/plays_of_interest. These rates are scaled by the markup
+    density.'''
+    rates = {}
+    rates['hi'] = 0.15
+    rates['gap'] = 0.05
+    rates['EOLhyphen'] = 0.03
+    rates['punc'] = 0.008
+    rates['cmbAbbrStroke'] = 0.005
+    rates['note'] = 0.002
+    rates['unicode'] = 0.02  # Words containing a character from lib/conversion_dict.py
+    return rates
+
+
+def get_gap_extents():
+    '''Returns a list of (extent, weight) tuples for <gap> elements, with
+    weights proportional to their frequency in data/plays_of_interest.'''
+    extents = [
+            ('1 letter', 3201),
+            ('1+ letters', 761),
+            ('1 word', 412),
+            ('2 letters', 284),
+            ('1 span', 88),
+            ('3 letters', 43),
+            ('4 letters', 12)
+            ]
+    return extents
+
+
+def load_vocabulary():
+    '''Returns a list of words from which to build speech, ordered so that
+    earlier words should be chosen more often: the common modern words of the
+    bundled phoneme dictionary, followed by the early modern spellings of the
+    standardizer dictionary, which exercise translate.py.'''
+    vocabulary = []
+    for dict_filename, separator in [(bench_dict_path, ','), (std_dict_path, ':')]:
+        with open(dict_filename, 'r') as dict_file:
+            for line in dict_file:
+                line = line.strip()
+                if line and line[0] != '#':
+                    word = line.split(separator)[0]
+                    if word.isalpha():
+                        vocabulary.append(word)
+    return vocabulary
+
+
+class PlayGenerator:
+    '''Generates synthetic TEI P5 plays. Each play is generated from its own
+    random number generator, seeded by the corpus seed and the play's number,
+    so that any play can be regenerated independently of the others.'''
+
+    def __init__(self, vocabulary, seed=0, speakers=76, speeches=830, lines=2.5, words=9.0, density=1.0, nested=0.05):
+        self.vocabulary = vocabulary
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))  # Zipf's law
+        self.seed = seed
+        self.speakers = speakers
+        self.speeches = speeches
+        self.lines = lines
+        self.words = words
+        self.rates = {key: rate * density for key, rate in get_markup_rates().items()}
+        self.nested = nested
+        self.unicode_chars = sorted(conversion_dict.getConversionDict())
+        self.gap_extents = [e for e, w in get_gap_extents()]
+        self.gap_weights = [w for e, w in get_gap_extents()]
+
+    def count(self, rng, mean):
+        '''Returns a random count with the given mean, which is at least 1 and
+        has a geometric-like long tail, as speech lengths do.'''
+        return max(1, int(rng.expovariate(1 / mean) + 0.5))
+
+    def occurs(self, rng, key):
+        '''Returns the number of times the given markup occurs in one line.'''
+        rate = self.rates[key]
+        n = int(rate)
+        if rng.random() < rate - n:
+            n += 1
+        return n
+
+    def word(self, rng):
+        '''Returns a random word, possibly containing a non-ASCII character.'''
+        word = rng.choices(self.vocabulary, cum_weights=self.cum_weights)[0]
+        if self.occurs(rng, 'unicode'):
+            i = rng.randrange(len(word))
+            word = word[:i] + rng.choice(self.unicode_chars) + word[i + 1:]
+        return word
+
+    def line(self, rng, tag):
+        '''Returns an <l> or <p> element containing random words and markup.'''
+        words = [self.word(rng) for i in range(self.count(rng, self.words))]
+        for i in range(self.occurs(rng, 'EOLhyphen')):
+            j = rng.randrange(len(words))
+            k = len(words[j]) // 2
+            words[j] = words[j][:k] + '<g ref="char:EOLhyphen"/>' + words[j][k:]
+        for i in range(self.occurs(rng, 'cmbAbbrStroke')):
+            j = rng.randrange(len(words))
+            words[j] = words[j] + '<g ref="char:cmbAbbrStroke">̄</g>'
+        for i in range(self.occurs(rng, 'hi')):
+            j = rng.randrange(len(words))
+            words[j] = '<hi>{}</hi>'.format(words[j])
+        for i in range(self.occurs(rng, 'punc')):
+            words.insert(rng.randrange(len(words) + 1), '<g ref="char:punc">▪</g>')
+        for i in range(self.occurs(rng, 'gap')):
+            extent = rng.choices(self.gap_extents, self.gap_weights)[0]
+            words.insert(rng.randrange(len(words) + 1), '<gap reason="illegible" resp="#TECH" extent="{}"><desc>•</desc></gap>'.format(extent))
+        for i in range(self.occurs(rng, 'note')):
+            note = ' '.join(self.word(rng) for k in range(self.count(rng, 4)))
+            words.insert(rng.randrange(len(words) + 1), '<note place="margin">{}</note>'.format(note))
+        return '<{0}>{1}</{0}>'.format(tag, ' '.join(words))
+
+    def speaker_names(self, rng):
+        '''Returns a list of random speaker names, abbreviated as they often are
+        in the <speaker> elements of the TCP texts.'''
+        names = []
+        for i in range(self.count(rng, self.speakers)):
+            name = ''.join(rng.choice('bcdfghlmnprstvw') + rng.choice('aeiou') for k in range(rng.randint(1, 3))).capitalize()
+            if rng.random() < 0.5:
+                name = name[:rng.randint(2, len(name))]
+            names.append(name + '.')
+        return names
+
+    def text(self, rng, number, lang='eng'):
+        '''Returns a single (not nested) <text> element with a front matter
+        containing a dramatis personae list, and a body of speeches.'''
+        names = self.speaker_names(rng)
+        out_list = ['<text xml:lang="{}">'.format(lang), '<front>', '<div type="title_page"><p>Synthetic play {}</p></div>'.format(number)]
+        out_list.append('<div type="dramatis_personae"><head>Dramatis personae.</head><list>')
+        for name in names:
+            out_list.append('<item>{}</item>'.format(name))
+        out_list += ['</list></div>', '</front>', '<body>', '<div type="act" n="1">']
+        page = 1
+        for i in range(self.count(rng, self.speeches)):
+            if rng.random() < 0.02:
+                page += 1
+                out_list.append('<pb facs="tcp:0:{}"/>'.format(page))
+            if rng.random() < 0.01:
+                out_list.append('<stage>Exit.</stage>')
+            tag = 'l'
+            if rng.random() < 0.2:
+                tag = 'p'
+            out_list.append('<sp><speaker>{}</speaker>'.format(rng.choice(names)))
+            for k in range(self.count(rng, self.lines)):
+                out_list.append(self.line(rng, tag))
+            out_list.append('</sp>')
+        out_list += ['</div>', '</body>', '</text>']
+        return '\n'.join(out_list)
+
+    def play(self, number, code):
+        '''Returns the complete TEI document for the play with the given number
+        and TCP code. A fraction of plays contain several <text> elements
+        nested within a <group>, as collections in the TCP do.'''
+        rng = random.Random('{}-{}'.format(self.seed, number))
+        out_list = ['<TEI xmlns="http://www.tei-c.org/ns/1.0">', '<teiHeader><fileDesc><titleStmt>']
+        out_list.append('<title>Synthetic play {}</title>'.format(number))
+        out_list.append('</titleStmt><notesStmt><note>(Synthetic corpus ; no. {})</note></notesStmt></fileDesc></teiHeader>'.format(code))
+        if rng.random() < self.nested:
+            out_list += ['<text>', '<group>']
+            for i in range(rng.randint(2, 4)):
+                out_list.append(self.text(rng, number))
+            out_list += ['</group>', '</text>']
+        else:
+            out_list.append(self.text(rng, number))
+        out_list.append('</TEI>')
+        return '\n'.join(out_list) + '\n'
+
+
+def generate_corpus(directory, plays=10, prefix='S', first=1, **kwargs):
+    '''Writes the given number of synthetic plays to the given directory, named
+    by TCP codes made of the given prefix and a five digit number starting from
+    first. Any keyword arguments are passed to PlayGenerator. Returns the list
+    of filenames written.'''
+    generator = PlayGenerator(load_vocabulary(), **kwargs)
+    if directory:
+        directory = directory.rstrip('/') + '/'
+        try:
+            os.makedirs(directory, 0o755)
+        except FileExistsError:
+            pass
+    filenames = []
+    for number in range(first, first + plays):
+        code = '{}{:05d}'.format(prefix, number)
+        filename = directory + code + '.xml'
+        with open(filename, 'w', encoding='utf-8') as outfile:
+            outfile.write(generator.play(number, code))
+        filenames.append(filename)
+    return filenames
+
+
+def parse_generate_corpus(arg_list):
+    '''Parses command-line arguments and runs the core generate_corpus()
+    function accordingly. Writes the list of generated files to stdout.'''
+    optlist, args = getopt.getopt(arg_list, 'hd:n:f:p:r:s:e:l:w:m:t:')
+    directory = 'synthetic'
+    plays = 10
+    first = 1
+    prefix = 'S'
+    kwargs = {}
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - generate a synthetic corpus of TEI P5 plays for scale testing
+
+    Usage:
+        python3 {0} [OPTION]...
+
+    Writes synthetic plays in the TEI P5 format used by the TCP, with speeches
+    in <sp> elements, dramatis personae lists in the front matter, and inline
+    markup including <hi>, <g ref="char:...">, <gap extent="...">, <note>,
+    <pb>, and <stage>, as well as words containing the non-ASCII characters
+    of lib/conversion_dict.py and the early modern spellings of the
+    standardizer dictionary. Some plays nest several <text> elements within a
+    <group>. The default statistics are modeled on data/plays_of_interest.
+
+    Generation is deterministic: the same seed and options always produce the
+    same files, and each play depends only on the seed and its own number, so
+    a corpus may be generated in parts using -f.
+
+    Writes the name of each generated file to stdout, one per line.
+
+
+    -h              Display this help message.
+
+    -d directory    Specify the directory in which to write the plays. The
+                        default is synthetic
+
+    -n #            Specify the number of plays to generate. The default is 10.
+
+    -f #            Specify the number of the first play. The default is 1.
+
+    -p prefix       Specify the prefix of the generated TCP codes, which are
+                        the prefix followed by the five digit play number.
+                        The default is S, giving S00001.xml, S00002.xml, ...
+
+    -r seed         Specify the random seed. The default is 0.
+
+    -s #            Specify the mean number of speakers per play.
+                        The default is 76.
+
+    -e #            Specify the mean number of speeches (<sp> elements) per
+                        play. The default is 830.
+
+    -l #            Specify the mean number of lines per speech.
+                        The default is 2.5
+
+    -w #            Specify the mean number of words per line.
+                        The default is 9.
+
+    -m density      Specify a factor by which to scale the rate of inline
+                        markup and non-ASCII characters. The default is 1.
+
+    -t fraction     Specify the fraction of plays which contain nested <text>
+                        elements. The default is 0.05
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-d':
+            directory = a
+        if o == '-n':
+            plays = int(a)
+        if o == '-f':
+            first = int(a)
+        if o == '-p':
+            prefix = a
+        if o == '-r':
+            kwargs['seed'] = a
+        if o == '-s':
+            kwargs['speakers'] = float(a)
+        if o == '-e':
+            kwargs['speeches'] = float(a)
+        if o == '-l':
+            kwargs['lines'] = float(a)
+        if o == '-w':
+            kwargs['words'] = float(a)
+        if o == '-m':
+            kwargs['density'] = float(a)
+        if o == '-t':
+            kwargs['nested'] = float(a)
+    for filename in generate_corpus(directory, plays, prefix, first, **kwargs):
+        print(filename)
+
+
+def main():
+    profiling.run(parse_generate_corpus, sys.argv[1:], 'generate_corpus')
+
+
+if __name__ == '__main__':
+    main()
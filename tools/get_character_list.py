@@ -1,8 +1,15 @@
 #!/usr/bin/python3
 
 import sys
+import io
 import getopt
 import os
+import itertools
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in tools directory, add project directory to path
+import lib.rows as rows
+import lib.frames as frames
+import lib.compression as compression
+import lib.profiling as profiling
 
 
 def verify_string(in_string):
@@ -34,52 +41,79 @@ def get_character_list(in_string, directory='', filename='characters.txt', match
         TCPcode character word [word]...\\n
     OR
         TCPcode\\tcharacter\\txmltext[\\txmltext]...\\n
-    
-    Separates each of these lines into a separate character file, where the
-    filename is given by <TCPcode>_<character>.txt and the contents of the file
-    are the contents of the line with the TCP code and character removed.
+
+    Writes each character's name to a file, as described by list_rows().
     '''
     assert(verify_string)
+    splitter = rows.get_separator(in_string)
+    for row in list_rows(rows.parse_rows(in_string, splitter), directory, filename, match, splitter):
+        pass
+
+
+def get_match_filename(filename, code):
+    '''Returns the name of the file of the characters of the play with the
+    given TCP code, which is the given filename with the TCP code inserted
+    before its extension, or before .txt if it has none.'''
+    filename_components = filename.split('.')
+    if len(filename_components) == 1:  # If no extension is given, default to .txt
+        prefix = filename
+        suffix = '.txt'
+    else:
+        prefix = '.'.join(filename_components[:-1])
+        suffix = '.' + filename_components[-1]
+    return prefix + '_' + code + suffix
+
+
+def list_rows(in_rows, directory='', filename='characters.txt', match=False, splitter=' '):
+    '''Writes the TCP code and character name of each of the given Rows,
+    joined by the given splitter, to a single file with the given filename,
+    as soon as each Row is read. If match is True, the characters are instead
+    grouped by TCP code, holding only their names, and once the Rows run out,
+    the sorted names of each play's characters are written to a file named by
+    get_match_filename(). Generates each Row unchanged after it has been
+    listed, so that the Rows can continue through the pipeline.'''
     if directory:
         directory = directory.rstrip('/') + '/'
         try:
-            os.makedirs(out_dir, 0o755)
+            os.makedirs(directory, 0o755)
         except FileExistsError:
             pass
-    splitter = ' '
-    if '\t' in in_string:
-        splitter = '\t'
     if match:
-        filename_components = filename.split('.')
-        if len(filename_components) == 1:  # If no extension is given, default to .txt
-            prefix = filename
-            suffix = '.txt'
-        else:
-            prefix = '.'.join(filename_components[:-1])
-            suffix = '.' + filename_components[-1]
-        curr_code = None
-        outfile = None
-        lines = in_string.split('\n')
-        lines = sorted(lines)
-        for line in lines:
-            if line.strip() == '':
-                continue
-            TCPcode, speaker = line.split(splitter)[:2]
-            if curr_code == None or curr_code != TCPcode:
-                if outfile != None:
-                    outfile.close()
-                outfile = open(directory + prefix + '_' + TCPcode + suffix, 'w')
-                curr_code = TCPcode
-            outfile.write(speaker + '\n')
-        if outfile != None:
-            outfile.close
+        characters = {}
+        for row in in_rows:
+            characters.setdefault(row.code, []).append(row.character)
+            yield row
+        for code in sorted(characters):
+            with open(directory + get_match_filename(filename, code), 'w') as outfile:
+                for character in sorted(characters[code], key=lambda character: character + splitter):  # As the rows would sort
+                    outfile.write(character + '\n')
     else:
         with open(directory + filename, 'w') as outfile:
-            for line in in_string.split('\n'):
-                if line.strip() == '':
-                    continue
-                TCPcode, speaker = line.split(splitter)[:2]
-                outfile.write(splitter.join([TCPcode, speaker]) + '\n')
+            for row in in_rows:
+                outfile.write(splitter.join([row.code, row.character]) + '\n')
+                yield row
+
+
+def read_name_rows(infile):
+    '''Reads pipeline text from the given file one line at a time, as
+    rows.read_rows() does, but splits only the TCP code and the character's
+    name from each line, leaving the rest of the line as a single element, so
+    that formatting each Row with the separator reproduces the line. Returns
+    a tuple of the separator and a generator of the Rows.'''
+    line = infile.readline()
+    while line and line.strip() == '':
+        line = infile.readline()
+    separator = rows.get_separator(line)
+
+    def generate_rows(first_line):
+        for line in profiling.timed(itertools.chain([first_line], infile), 'read'):
+            line = line.rstrip('\n')
+            if line.strip() != '':
+                fields = line.split(separator, 2)
+                assert(len(fields) >= 2)
+                yield rows.Row(fields[0], fields[1], fields[2:])
+
+    return (separator, profiling.timed(generate_rows(line), 'parse'))
 
 
 def parse_get_character_list(arg_list):
@@ -87,12 +121,13 @@ def parse_get_character_list(arg_list):
     accordingly. Writes each character's text to a separate file, and writes
     the original input to stdout so that separate.py can be inserted into the
     pipeline without interrupting it.''' 
-    optlist, args = getopt.getopt(arg_list, 'hmi:o:d:n:')
+    optlist, args = getopt.getopt(arg_list, 'hbmi:o:d:n:')
     infile = sys.stdin
     outfile = sys.stdout
     directory = ''
     filename = 'characters.txt'
     match = False
+    framed = False
     for o, a in optlist:
         if o == '-h':
             print('''
@@ -118,7 +153,8 @@ Usage information for {0}
     character's name to a file.
     Passes stdin to stdout without modification, thus allowing this script to
     be inserted into the pipeline to save some stage of the output without
-    interrupting the pipeline.
+    interrupting the pipeline. Each line is passed on as soon as it is read,
+    and only the TCP code and name of each character are kept in memory.
 
 
     -h              Display this help message.
@@ -149,21 +185,37 @@ Usage information for {0}
                         single file along with their play codes. If -d is
                         used, these files will be placed in the directory
                         given by -d.
+
+    -b              Write output in the framed binary format rather than as
+                        text. Framed input is detected automatically by every
+                        script in the pipeline.
 '''.format(sys.argv[0]))
             exit(0)
         if o == '-i':
-            infile = open(a, 'r')
+            infile = compression.open_file(a, 'r')
         if o == '-o':
-            outfile = open(a, 'w')
+            outfile = compression.open_file(a, 'w')
         if o == '-d':
             directory = a.rstrip('/') + '/'
         if o == '-n':
             filename = a
         if o == '-m':
             match = True
-    in_string = infile.read()
-    get_character_list(in_string, directory, filename, match)
-    outfile.write(in_string)
+        if o == '-b':
+            framed = True
+    buf = frames.get_buffer(infile)
+    if frames.is_framed(buf.peek(len(frames.MAGIC))):
+        splitter, in_rows = frames.copy_rows(buf, outfile)
+        for row in profiling.timed(list_rows(in_rows, directory, filename, match, splitter), 'core'):
+            pass
+    else:
+        text = io.TextIOWrapper(buf, encoding='utf-8')
+        if framed:  # Framed output needs every field of each row
+            splitter, in_rows = rows.read_rows(text)
+        else:
+            splitter, in_rows = read_name_rows(text)
+        out_rows = profiling.timed(list_rows(in_rows, directory, filename, match, splitter), 'core')
+        frames.write_rows(outfile, out_rows, splitter, framed)
     if infile != sys.stdin:
         infile.close()
     if outfile != sys.stdout:
@@ -171,7 +223,7 @@ Usage information for {0}
 
 
 def main():
-    parse_get_character_list(sys.argv[1:])
+    profiling.run(parse_get_character_list, sys.argv[1:], 'get_character_list')
 
 
 if __name__ == '__main__':
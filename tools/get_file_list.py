@@ -1,12 +1,88 @@
 #!/usr/bin/python3
 
-import csv
-
-with open('VEP_metadata.csv', newline='') as infile:
-    reader = csv.reader(infile)
-    header = True
-    for row in reader:
-        if header:
-            header = False
-            continue
-        print(row[0] + '.xml')
+import sys
+import getopt
+sys.path.append(sys.path[0] + '/..')  # Assuming script is in tools directory, add project directory to path
+import lib.metadata as metadata
+import lib.compression as compression
+import lib.profiling as profiling
+
+
+def get_file_list(query=None, metadata_filename=metadata.metadata_path):
+    '''Returns a string of the xml filename of each TCP code in the given VEP
+    metadata csv file of which any play matches the given query, or of every
+    TCP code if there is no query, one per line, leaving out those whose files
+    are listed as missing.'''
+    return ''.join(filename + '\n' for filename in metadata.select_filenames(query, metadata_filename))
+
+
+def parse_get_file_list(arg_list):
+    '''Parses command-line arguments and runs the core get_file_list()
+    function accordingly. Writes the output to stdout unless an output file is
+    specified using the -o flag.'''
+    optlist, args = getopt.getopt(arg_list, 'hq:m:o:')
+    queries = []
+    metadata_filename = metadata.metadata_path
+    outfile = sys.stdout
+    for o, a in optlist:
+        if o == '-h':
+            print('''
+Usage information for {0}
+
+    {0} - lists the xml files of the plays in the VEP metadata
+
+    Usage:
+        python3 {0} [OPTION]...
+
+    Writes the xml filename of each TCP code in the VEP metadata to stdout, one
+    per line, in order of TCP code, leaving out those listed in
+    missing_files.txt alongside the metadata. If a query is given, lists only
+    the files of plays which match it, exactly as they are selected by
+    extract.py -q, so that the list can be given to extract.py -c:
+        $ python3 {0} -q "genre=TR and tokens>20000" > tragedies.csv
+
+
+    -h              Display this help message.
+
+    -q query        List only the files of plays which match the given query,
+                        which is a list of comparisons of the fields code,
+                        author, title, genre, date (of writing), printed (the
+                        date of the text used), and tokens, by =, !=, <, <=,
+                        >, >=, or ~ (contains, ignoring case), joined by "and"
+                        and "or". A value containing spaces, "and", or "or"
+                        may be quoted, as in title~"Love and Honor". May be
+                        given more than once, to list the files of plays
+                        which match any of the queries.
+
+    -m filename     Specify the VEP metadata csv file, rather than
+                        data/VEP_metadata.csv.
+
+    -o filename     Specify an output file to which to write output, rather
+                        than writing to stdout.
+'''.format(sys.argv[0]))
+            exit(0)
+        if o == '-q':
+            queries.append(a)
+        if o == '-m':
+            metadata_filename = a
+        if o == '-o':
+            outfile = compression.open_file(a, 'w')
+    query = None
+    if queries:
+        query = ' or '.join(queries)
+    try:
+        file_list = get_file_list(query, metadata_filename)
+    except getopt.GetoptError as err:
+        print('ERROR: {}: {}'.format(sys.argv[0], err), file=sys.stderr)
+        exit(1)
+    outfile.write(file_list)
+    if outfile != sys.stdout:
+        outfile.close()
+
+
+def main():
+    profiling.run(parse_get_file_list, sys.argv[1:], 'get_file_list')
+
+
+if __name__ == '__main__':
+    main()